@@ -1,13 +1,22 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_async_session
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_async_session
+from app.core.llm_clients import LLMClients, get_llm_clients
+from app.core.pagination import Page
+from app.core.websocket import ConnectionLimiter, TRY_AGAIN_LATER, receive_json
 from app.services.chat_service import ChatService
 from app.schemas.chat import ChatMessage, ChatResponse, ConversationCreate, ConversationResponse
+from services.deadline import Deadline, DeadlineExceeded, ClientDisconnected, run_until_disconnected
 
 router = APIRouter()
 
+# Open chat sockets in this worker; they hold no database connection while idle
+websocket_limiter = ConnectionLimiter(settings.WS_MAX_CONNECTIONS)
+
 
 @router.post("/conversations", response_model=ConversationResponse)
 async def create_conversation(
@@ -21,13 +30,22 @@ async def create_conversation(
 
 @router.get("/conversations", response_model=List[ConversationResponse])
 async def list_conversations(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_async_session),
 ):
-    """List all chat conversations."""
+    """
+    List chat conversations, most recently active first.
+    
+    Pass the X-Next-Cursor or X-Prev-Cursor response header back as `cursor`
+    to fetch the neighbouring page; `skip` is still accepted for offset paging.
+    """
     chat_service = ChatService(db)
-    return await chat_service.get_conversations(skip=skip, limit=limit)
+    page = await _page_or_400(chat_service.get_conversations(skip=skip, limit=limit, cursor=cursor))
+    page.set_headers(response)
+    return page.items
 
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
@@ -45,11 +63,29 @@ async def get_conversation(
     return conversation
 
 
+@router.put("/conversations/{conversation_id}/context-documents", response_model=ConversationResponse)
+async def update_context_documents(
+    conversation_id: int,
+    document_ids: List[int] = Body(..., embed=True),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """Replace the documents the AI tutor draws context from in a conversation."""
+    chat_service = ChatService(db)
+    conversation = await chat_service.update_context_documents(conversation_id, document_ids)
+    
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    return conversation
+
+
 @router.post("/conversations/{conversation_id}/messages", response_model=ChatResponse)
 async def send_message(
     conversation_id: int,
     message: ChatMessage,
+    request: Request,
     db: AsyncSession = Depends(get_async_session),
+    llm_clients: LLMClients = Depends(get_llm_clients),
 ):
     """
     Send a message to the AI tutor and get a response.
@@ -58,8 +94,12 @@ async def send_message(
     - All uploaded documents and their analysis
     - Previous conversation history
     - User's learning progress and skill gaps
+    
+    Answers not ready within CHAT_REQUEST_TIMEOUT return 504; if the client
+    disconnects first, generation is cancelled.
     """
-    chat_service = ChatService(db)
+    deadline = Deadline(settings.CHAT_REQUEST_TIMEOUT)
+    chat_service = ChatService(db, llm_clients)
     
     # Verify conversation exists
     conversation = await chat_service.get_conversation_by_id(conversation_id)
@@ -67,7 +107,15 @@ async def send_message(
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     # Process message and generate response
-    response = await chat_service.process_message(conversation_id, message)
+    try:
+        response = await run_until_disconnected(
+            chat_service.process_message(conversation_id, message, deadline),
+            request.is_disconnected
+        )
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Timed out generating a response: {str(e)}")
+    except ClientDisconnected:
+        return Response(status_code=499)
     
     return response
 
@@ -75,11 +123,20 @@ async def send_message(
 @router.get("/conversations/{conversation_id}/messages", response_model=List[ChatResponse])
 async def get_conversation_messages(
     conversation_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    latest: bool = False,
     db: AsyncSession = Depends(get_async_session),
 ):
-    """Get all messages in a conversation."""
+    """
+    Get messages in a conversation, oldest first.
+    
+    Paged like the conversation list via X-Next-Cursor / X-Prev-Cursor; with
+    `latest=true` the first page is the most recent messages and the prev
+    cursor scrolls back through the history.
+    """
     chat_service = ChatService(db)
     
     # Verify conversation exists
@@ -87,11 +144,11 @@ async def get_conversation_messages(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    messages = await chat_service.get_conversation_messages(
-        conversation_id, skip=skip, limit=limit
-    )
-    
-    return messages
+    page = await _page_or_400(chat_service.get_conversation_messages(
+        conversation_id, skip=skip, limit=limit, cursor=cursor, latest=latest
+    ))
+    page.set_headers(response)
+    return page.items
 
 
 @router.delete("/conversations/{conversation_id}")
@@ -113,19 +170,27 @@ async def delete_conversation(
 async def websocket_chat(
     websocket: WebSocket,
     conversation_id: int,
-    db: AsyncSession = Depends(get_async_session),
+    llm_clients: LLMClients = Depends(get_llm_clients),
 ):
     """
     WebSocket endpoint for real-time chat with the AI tutor.
     
-    Supports streaming responses and real-time interaction.
+    Supports streaming responses and real-time interaction. Each message gets
+    its own database session, which holds a pooled connection only while the
+    turn loads and saves, so neither idle sockets nor streaming replies
+    hold one. Quiet clients are pinged every WS_HEARTBEAT_INTERVAL seconds
+    and disconnected after WS_IDLE_TIMEOUT seconds without a message; beyond
+    WS_MAX_CONNECTIONS open sockets, new ones are closed with code 1013.
     """
     await websocket.accept()
-    chat_service = ChatService(db)
+    if not websocket_limiter.try_acquire():
+        await websocket.close(code=TRY_AGAIN_LATER, reason="Too many open chat connections")
+        return
     
     try:
         # Verify conversation exists
-        conversation = await chat_service.get_conversation_by_id(conversation_id)
+        async with AsyncSessionLocal() as db:
+            conversation = await ChatService(db).get_conversation_by_id(conversation_id)
         if not conversation:
             await websocket.send_json({
                 "type": "error",
@@ -136,24 +201,21 @@ async def websocket_chat(
         
         while True:
             # Receive message from client
-            data = await websocket.receive_json()
+            data = await receive_json(websocket, settings.WS_HEARTBEAT_INTERVAL, settings.WS_IDLE_TIMEOUT)
+            if data is None:
+                await websocket.close(reason="Idle timeout")
+                return
             
             if data["type"] == "message":
                 message = ChatMessage(**data["content"])
                 
-                # Process message with streaming response
-                async for chunk in chat_service.process_message_stream(conversation_id, message):
-                    await websocket.send_json({
-                        "type": "response_chunk",
-                        "content": chunk
-                    })
-                
-                # Send final response
-                response = await chat_service.get_last_response(conversation_id)
-                await websocket.send_json({
-                    "type": "response_complete",
-                    "content": response
-                })
+                # Forward token deltas as they arrive; the last event carries the saved message.
+                # The session checks a connection out only to load the conversation and to
+                # save the turn (see ChatService._open_turn), none while tokens stream.
+                async with AsyncSessionLocal() as db:
+                    chat_service = ChatService(db, llm_clients)
+                    async for event in chat_service.process_message_stream(conversation_id, message):
+                        await websocket.send_json(jsonable_encoder(event))
             
     except WebSocketDisconnect:
         pass
@@ -163,6 +225,8 @@ async def websocket_chat(
             "message": str(e)
         })
         await websocket.close()
+    finally:
+        websocket_limiter.release()
 
 
 @router.post("/conversations/{conversation_id}/feedback")
@@ -185,3 +249,11 @@ async def provide_feedback(
     await chat_service.save_feedback(conversation_id, message_id, feedback)
     
     return {"message": "Feedback saved successfully"}
+
+
+async def _page_or_400(page_query) -> Page:
+    """Await a paginated query, turning a malformed cursor into a 400."""
+    try:
+        return await page_query
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Backgro
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_async_session
+from app.core.llm_clients import LLMClients, get_llm_clients
 from app.services.document_service import DocumentService
 from app.services.content_extraction_service import ContentExtractionService
 from app.models.document import Document
@@ -18,6 +19,7 @@ async def upload_document(
     title: str = None,
     subject: str = None,
     db: AsyncSession = Depends(get_async_session),
+    llm_clients: LLMClients = Depends(get_llm_clients),
 ):
     """
     Upload a document (PDF, DOCX, TXT, etc.) for processing.
@@ -48,7 +50,8 @@ async def upload_document(
     background_tasks.add_task(
         process_document_content,
         document.id,
-        db
+        db,
+        llm_clients
     )
     
     return document
@@ -102,6 +105,7 @@ async def reprocess_document(
     document_id: int,
     background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_async_session),
+    llm_clients: LLMClients = Depends(get_llm_clients),
 ):
     """Reprocess a document with updated AI analysis."""
     doc_service = DocumentService(db)
@@ -114,7 +118,8 @@ async def reprocess_document(
     background_tasks.add_task(
         process_document_content,
         document_id,
-        db
+        db,
+        llm_clients
     )
     
     return {"message": "Document reprocessing started"}
@@ -135,12 +140,19 @@ async def delete_document(
     return {"message": "Document deleted successfully"}
 
 
-async def process_document_content(document_id: int, db: AsyncSession):
+async def process_document_content(document_id: int, db: AsyncSession, llm_clients: LLMClients):
     """Background task to process document content with AI."""
-    content_service = ContentExtractionService()
+    content_service = ContentExtractionService(llm_clients)
     doc_service = DocumentService(db)
     
     try:
+        # Extract the text and index its chunks for retrieval at chat time
+        document = await doc_service.get_document_by_id(document_id)
+        if document:
+            text = await content_service.extract_text(document.file_path)
+            await doc_service.save_extracted_text(document_id, text)
+            await content_service.index_document(document_id, document.user_id, text)
+        
         # Extract and analyze content
         analysis = await content_service.process_document(document_id)
         
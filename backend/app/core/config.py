@@ -54,6 +54,11 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    # Async engine pool per worker: a chat turn holds at most three connections,
+    # and only while reading its context (see ChatService._build_context)
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 20
+
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     
@@ -62,6 +67,49 @@ class Settings(BaseSettings):
     ANTHROPIC_API_KEY: Optional[str] = None
     HUGGINGFACE_API_KEY: Optional[str] = None
     
+    # Seconds a chat request may wait for the model before a 504
+    CHAT_REQUEST_TIMEOUT: float = 60.0
+    
+    # Connection pools shared by all OpenAI calls of the process
+    OPENAI_MAX_CONNECTIONS: int = 20
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    OPENAI_KEEPALIVE_EXPIRY: float = 30.0
+    OPENAI_CONNECT_TIMEOUT: float = 5.0
+    
+    # Rolling conversation summaries: once this many messages follow the latest
+    # summary, all but the most recent KEEP_RECENT are folded into a new one
+    CONVERSATION_SUMMARY_TRIGGER: int = 16
+    CONVERSATION_SUMMARY_KEEP_RECENT: int = 6
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 400
+    
+    # Per-conversation document/progress context cache: "memory" (single worker),
+    # "redis" (shared through REDIS_URL, for multiple workers) or "none"
+    CONTEXT_CACHE_BACKEND: str = "memory"
+    CONTEXT_CACHE_TTL: int = 3600
+    CONTEXT_CACHE_MAX_ENTRIES: int = 1024
+    
+    # Chat WebSockets: open sockets per worker, seconds between server pings
+    # while the client is quiet, and seconds without a message before closing
+    WS_MAX_CONNECTIONS: int = 500
+    WS_HEARTBEAT_INTERVAL: float = 25.0
+    WS_IDLE_TIMEOUT: float = 600.0
+    
+    # Opt-in write-behind for chat messages: turns are queued and written in
+    # batches every INTERVAL seconds or once BATCH_SIZE messages are waiting (PostgreSQL only)
+    CHAT_WRITE_BEHIND: bool = False
+    CHAT_WRITE_BEHIND_INTERVAL: float = 0.5
+    CHAT_WRITE_BEHIND_BATCH_SIZE: int = 200
+    
+    # Chunk-level retrieval: local vector index directory, chunking at ingestion,
+    # chunks taken from each of BM25 and vector search, chunks added to each chat
+    # prompt, and documents kept in each worker's in-memory BM25 index
+    VECTOR_INDEX_PATH: str = "./vector_index"
+    RAG_CHUNK_SIZE: int = 1000
+    RAG_CHUNK_OVERLAP: int = 150
+    RAG_CANDIDATES: int = 20
+    RAG_TOP_K: int = 4
+    KEYWORD_INDEX_MAX_DOCUMENTS: int = 2000
+    
     # Vector Database (ChromaDB/Pinecone)
     VECTOR_DB_TYPE: str = "chromadb"  # "chromadb" or "pinecone"
     CHROMADB_HOST: str = "localhost"
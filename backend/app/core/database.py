@@ -16,6 +16,8 @@ engine = create_engine(
 async_engine = create_async_engine(
     str(settings.SQLALCHEMY_DATABASE_URI).replace("postgresql://", "postgresql+asyncpg://"),
     pool_pre_ping=True,
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
     echo=settings.LOG_LEVEL == "DEBUG"
 )
 
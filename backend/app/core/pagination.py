@@ -0,0 +1,158 @@
+import json
+import base64
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from fastapi import Response
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+
+
+@dataclass
+class Page:
+    """One page of rows with opaque cursors to the pages next to it."""
+
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+    def set_headers(self, response: Response):
+        """Expose the cursors as response headers so the body stays a plain list."""
+        if self.next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = self.next_cursor
+        if self.prev_cursor:
+            response.headers[PREV_CURSOR_HEADER] = self.prev_cursor
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int, backward: bool) -> str:
+    """Opaque cursor for the position of a row and the direction to walk from it."""
+    payload = [sort_value.isoformat() if sort_value else None, row_id, "p" if backward else "n"]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int, bool]:
+    """Position and direction of a cursor; raises ValueError for anything not made by encode_cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ("n", "p"):
+            raise ValueError(direction)
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(row_id), direction == "p"
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+def _beyond(sort_column, id_column, sort_value, row_id, descending: bool, nullable: bool):
+    """Rows strictly after (sort_value, row_id) in the given order, with NULL sorting last ascending as in Postgres."""
+    if not nullable:
+        position = tuple_(sort_column, id_column)
+        target = tuple_(sort_value, row_id)
+        return position < target if descending else position > target
+    if sort_value is None:
+        if descending:
+            return or_(sort_column.isnot(None), and_(sort_column.is_(None), id_column < row_id))
+        return and_(sort_column.is_(None), id_column > row_id)
+    position = tuple_(sort_column, id_column)
+    target = tuple_(sort_value, row_id)
+    return position < target if descending else or_(position > target, sort_column.is_(None))
+
+
+async def paginate(
+    db: AsyncSession,
+    query,
+    sort_column,
+    id_column,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    descending: bool = False,
+    from_end: bool = False,
+    nullable: bool = False,
+    pending: Sequence[Any] = ()
+) -> Page:
+    """Keyset pagination over (sort_column, id_column).
+
+    Each page seeks straight to its first row through the matching composite
+    index, so page 500 costs the same as page 1, unlike OFFSET which reads and
+    discards every row before it. skip is still honoured when no cursor is
+    given, for clients that page by offset.
+
+    Args:
+        db: Session to run the query in
+        query: Select statement with any filters applied, but no order or limit
+        sort_column: Timestamp column the rows are ordered by
+        id_column: Primary key breaking ties between equal timestamps
+        limit: Rows per page
+        cursor: Cursor from a previous page's next_cursor or prev_cursor
+        skip: Offset of the first page when no cursor is given
+        descending: Display order of the rows
+        from_end: Without a cursor, start at the last page instead of the first
+        nullable: Whether sort_column may be NULL
+        pending: Rows not committed yet, merged into the page as if stored
+            (sort_column must not be nullable; skip counts stored rows only)
+
+    Raises:
+        ValueError: The cursor is malformed
+    """
+    position = None
+    backward = from_end
+    if cursor:
+        sort_value, row_id, backward = decode_cursor(cursor)
+        position = (sort_value, row_id)
+
+    # Walking backward runs the query in the opposite order and flips the rows
+    reverse = descending != backward
+    if position is not None:
+        query = query.where(_beyond(sort_column, id_column, *position, reverse, nullable))
+    elif skip:
+        query = query.offset(skip)
+    if reverse:
+        ordering = (sort_column.desc().nulls_first() if nullable else sort_column.desc(), id_column.desc())
+    else:
+        ordering = (sort_column.asc().nulls_last() if nullable else sort_column.asc(), id_column.asc())
+    result = await db.execute(query.order_by(*ordering).limit(limit + 1))
+    rows = result.scalars().all()
+    if pending:
+        rows = _merge_pending(rows, pending, sort_column, id_column, position, reverse, limit + 1)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    page = Page(items=rows)
+    if not rows:
+        return page
+
+    # A page reached through a cursor or offset has rows on the side it came from
+    if backward:
+        has_prev, has_next = has_more, position is not None
+    else:
+        has_prev, has_next = position is not None or skip > 0, has_more
+    first, last = rows[0], rows[-1]
+    if has_next:
+        page.next_cursor = encode_cursor(_value(last, sort_column), _value(last, id_column), backward=False)
+    if has_prev:
+        page.prev_cursor = encode_cursor(_value(first, sort_column), _value(first, id_column), backward=True)
+    return page
+
+
+def _merge_pending(rows, pending, sort_column, id_column, position, reverse: bool, limit: int) -> List[Any]:
+    """First rows of the query order across stored rows and uncommitted ones past the position."""
+    def key(row):
+        return _value(row, sort_column), _value(row, id_column)
+
+    # A row committed since pending was read can already be among the stored rows
+    stored = {_value(row, id_column) for row in rows}
+    extra = [
+        row for row in pending
+        if _value(row, id_column) not in stored
+        and (position is None or (key(row) < position if reverse else key(row) > position))
+    ]
+    return sorted([*rows, *extra], key=key, reverse=reverse)[:limit]
+
+
+def _value(row, column):
+    return getattr(row, column.key)
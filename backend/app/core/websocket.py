@@ -0,0 +1,54 @@
+import time
+import asyncio
+from typing import Any, Optional
+from fastapi import WebSocket
+
+# Close code asking the client to reconnect later (RFC 6455 registry)
+TRY_AGAIN_LATER = 1013
+
+
+class ConnectionLimiter:
+    """Cap on the WebSockets one worker keeps open at a time."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.open = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.open >= self.limit:
+            self.rejected += 1
+            return False
+        self.open += 1
+        return True
+
+    def release(self):
+        self.open -= 1
+
+
+async def receive_json(websocket: WebSocket, heartbeat_interval: float, idle_timeout: float) -> Optional[Any]:
+    """Next JSON message from the client, or None once it has sent nothing for idle_timeout seconds.
+
+    While the client is quiet it is sent {"type": "ping"} every
+    heartbeat_interval seconds, so dead connections surface as a
+    WebSocketDisconnect. Client {"type": "ping"} messages are answered with a
+    pong; heartbeats in either direction do not count as activity.
+    """
+    deadline = time.monotonic() + idle_timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        wait = min(heartbeat_interval, remaining)
+        try:
+            data = await asyncio.wait_for(websocket.receive_json(), wait)
+        except asyncio.TimeoutError:
+            if wait < remaining:
+                await websocket.send_json({"type": "ping"})
+            continue
+
+        kind = data.get("type") if isinstance(data, dict) else None
+        if kind == "ping":
+            await websocket.send_json({"type": "pong"})
+        elif kind != "pong":
+            return data
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from contextlib import asynccontextmanager
@@ -6,6 +6,13 @@ from contextlib import asynccontextmanager
 from app.api.v1 import api_router
 from app.core.config import settings
 from app.core.database import create_tables
+from app.core.metrics import llm_metrics
+from services.metrics import CONTENT_TYPE_LATEST
+from app.core.llm_clients import LLMClients
+from app.core.pagination import NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.context_cache import context_cache
+from app.services.message_writer import message_writer
 
 
 @asynccontextmanager
@@ -13,9 +20,15 @@ async def lifespan(app: FastAPI):
     """Application lifespan events."""
     # Startup
     await create_tables()
+    app.state.llm_clients = LLMClients.create()
     yield
     # Shutdown
-    pass
+    if message_writer:
+        await message_writer.shutdown()
+    await conversation_summarizer.shutdown()
+    await app.state.llm_clients.aclose()
+    if context_cache:
+        await context_cache.close()
 
 
 def create_application() -> FastAPI:
@@ -37,6 +50,7 @@ def create_application() -> FastAPI:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=[NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER],
         )
 
     # Add trusted host middleware
@@ -61,6 +75,11 @@ def create_application() -> FastAPI:
     async def health_check():
         return {"status": "healthy"}
 
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """LLM call metrics in the Prometheus text format."""
+        return Response(llm_metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
     return app
 
 
@@ -0,0 +1,94 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class DocumentContext:
+    """Analysis highlights of a document attached to a conversation."""
+
+    id: int
+    title: str
+    summary: Optional[str] = None
+    key_concepts: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_analysis(cls, id: int, title: str, analysis: Dict[str, Any]) -> "DocumentContext":
+        return cls(
+            id=id,
+            title=title,
+            summary=analysis.get("summary"),
+            key_concepts=list(analysis.get("key_concepts") or [])
+        )
+
+    def render(self) -> str:
+        text = f"Title: {self.title}\n"
+        if self.summary is not None:
+            text += f"Summary: {self.summary}\n"
+        if self.key_concepts:
+            text += f"Key Concepts: {', '.join(self.key_concepts)}\n"
+        return text
+
+
+@dataclass
+class ProgressContext:
+    """One recent progress record of the student."""
+
+    topic_id: int
+    mastery_level: Optional[str]
+    confidence_score: Optional[float]
+
+    def render(self) -> str:
+        return f"- Topic {self.topic_id}: {self.mastery_level} (confidence: {self.confidence_score})\n"
+
+
+@dataclass
+class PassageContext:
+    """A document chunk retrieved for the student's question."""
+
+    document_id: int
+    text: str
+    score: float
+
+
+@dataclass
+class HistoryTurn:
+    """One message of the recent conversation history."""
+
+    role: str  # "Student" or "Tutor"
+    content: str
+
+    def render(self) -> str:
+        return f"{self.role}: {self.content}"
+
+
+@dataclass
+class ChatContext:
+    """Everything a chat turn's prompt is built from, loaded in one round of queries."""
+
+    documents: List[DocumentContext] = field(default_factory=list)
+    progress: List[ProgressContext] = field(default_factory=list)
+    history: List[HistoryTurn] = field(default_factory=list)
+    summary: Optional[str] = None  # Rolling summary of the messages before history
+    passages: List[PassageContext] = field(default_factory=list)
+
+    def render_context(self) -> str:
+        """Document and progress section of the tutor prompt."""
+        context_parts = [f"Document: {document.render()}" for document in self.documents]
+        if self.passages:
+            titles = {document.id: document.title for document in self.documents}
+            excerpts = "\n\n".join(
+                f"[{titles.get(passage.document_id, f'Document {passage.document_id}')}]\n{passage.text}"
+                for passage in self.passages
+            )
+            context_parts.append(f"Relevant excerpts from the student's materials:\n{excerpts}")
+        if self.progress:
+            progress = "Recent learning progress:\n" + "".join(record.render() for record in self.progress)
+            context_parts.append(f"User Progress: {progress}")
+        return "\n\n".join(context_parts)
+
+    def render_history(self) -> str:
+        """Conversation history section of the tutor prompt: the rolling summary, then the recent turns verbatim."""
+        turns = "\n".join(turn.render() for turn in self.history)
+        if self.summary:
+            return f"Summary of earlier messages: {self.summary}\n\n{turns}"
+        return turns
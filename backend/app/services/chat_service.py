@@ -1,10 +1,9 @@
+import time
 import asyncio
-from typing import List, Optional, AsyncGenerator, Dict
+from datetime import datetime, timezone
+from typing import List, Optional, AsyncGenerator, Dict, Sequence, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from langchain.llms import OpenAI
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
 from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationalRetrievalChain
 from langchain.prompts import PromptTemplate
@@ -13,21 +12,37 @@ from app.models.chat import Conversation, Message, MessageRole
 from app.models.document import Document
 from app.models.progress import ProgressRecord
 from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.llm_clients import LLMClients
+from app.core.pagination import Page, paginate
+from app.core.metrics import call_llm, stream_llm
+from services.deadline import Deadline, DeadlineExceeded
+from services.generation_profiles import GenerationProfile, default_profiles, GENERAL
 from app.schemas.chat import ConversationCreate, ChatMessage
+from app.services.chat_context import ChatContext, DocumentContext, ProgressContext, HistoryTurn
+from app.services.conversation_summarizer import conversation_summarizer, latest_summary
+from app.services.context_cache import context_cache
+from app.services.hybrid_retrieval import hybrid_retriever
+from app.services.message_writer import message_writer
+
+# Output budget and stop sequences per message type
+GENERATION_PROFILES = default_profiles()
+
+
+def _generation_profile(message_type: Optional[str]) -> GenerationProfile:
+    return GENERATION_PROFILES.get(message_type or GENERAL, GENERATION_PROFILES[GENERAL])
 
 
 class ChatService:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, clients: Optional[LLMClients] = None, session_factory=None):
         self.db = db
-        self.llm = OpenAI(
-            openai_api_key=settings.OPENAI_API_KEY,
-            temperature=0.7,
-            max_tokens=1000
-        ) if settings.OPENAI_API_KEY else None
-        
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=settings.OPENAI_API_KEY
-        ) if settings.OPENAI_API_KEY else None
+        # Context reads run concurrently, each in its own short-lived session;
+        # chat turns release db first (see _open_turn)
+        self.session_factory = session_factory or AsyncSessionLocal
+        # App-lifetime clients; without them the service answers with a configuration notice
+        self.clients = clients
+        self.llm = clients.chat_llm if clients else None
+        self.embeddings = clients.embeddings if clients else None
 
     async def create_conversation(self, conversation_data: ConversationCreate) -> Conversation:
         """Create a new conversation."""
@@ -47,15 +62,19 @@ class ChatService:
         
         return conversation
 
-    async def get_conversations(self, skip: int = 0, limit: int = 100) -> List[Conversation]:
-        """Get list of conversations."""
-        result = await self.db.execute(
-            select(Conversation)
-            .offset(skip)
-            .limit(limit)
-            .order_by(Conversation.last_activity_at.desc())
+    async def get_conversations(self, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> Page:
+        """Get a page of conversations, most recently active first."""
+        return await paginate(
+            self.db,
+            select(Conversation),
+            Conversation.last_activity_at,
+            Conversation.id,
+            limit,
+            cursor=cursor,
+            skip=skip,
+            descending=True,
+            nullable=True
         )
-        return result.scalars().all()
 
     async def get_conversation_by_id(self, conversation_id: int) -> Optional[Conversation]:
         """Get a specific conversation by ID."""
@@ -64,24 +83,26 @@ class ChatService:
         )
         return result.scalar_one_or_none()
 
-    async def process_message(self, conversation_id: int, message: ChatMessage) -> Dict:
-        """Process a user message and generate AI response."""
-        conversation = await self.get_conversation_by_id(conversation_id)
-        if not conversation:
-            raise Exception("Conversation not found")
+    async def process_message(
+        self, conversation_id: int, message: ChatMessage, deadline: Optional[Deadline] = None
+    ) -> Dict:
+        """Process a user message and generate AI response.
+
+        Raises DeadlineExceeded if the answer is not ready by the deadline; nothing
+        is saved in that case.
+        """
+        conversation = await self._open_turn(conversation_id)
 
-        # Save user message
         user_message = Message(
             conversation_id=conversation_id,
             role=MessageRole.USER,
             content=message.content,
             message_type=message.message_type or "general"
         )
-        self.db.add(user_message)
 
         # Generate AI response
         ai_response_content = await self._generate_ai_response(
-            conversation, message.content
+            conversation, message.content, deadline, message.message_type
         )
 
         # Save AI response
@@ -92,14 +113,7 @@ class ChatService:
             model_used="gpt-3.5-turbo",
             message_type="response"
         )
-        self.db.add(ai_message)
-
-        # Update conversation metadata
-        conversation.total_messages += 2
-        conversation.last_activity_at = user_message.created_at
-
-        await self.db.commit()
-        await self.db.refresh(ai_message)
+        await self._save_turn(conversation, user_message, ai_message)
 
         return {
             "id": ai_message.id,
@@ -109,18 +123,64 @@ class ChatService:
             "message_type": ai_message.message_type
         }
 
+    async def _open_turn(self, conversation_id: int) -> Conversation:
+        """Load the conversation of a chat turn and hand the request's connection back to the pool.
+
+        Context reads and generation then run without a connection of this
+        session; closing detaches the conversation, which _save_turn adds back
+        when it commits the turn in a new transaction.
+        """
+        conversation = await self.get_conversation_by_id(conversation_id)
+        if not conversation:
+            raise Exception("Conversation not found")
+        await self.db.close()
+        return conversation
+
+    async def _save_turn(self, conversation: Conversation, user_message: Message, ai_message: Message):
+        """Persist a question and its answer and bump the conversation counters.
+
+        With write-behind enabled the turn is only queued, so the reply does not
+        wait for a commit; otherwise it is committed here in a short transaction.
+        """
+        conversation_id = conversation.id
+        if message_writer:
+            await message_writer.enqueue(conversation_id, [user_message, ai_message])
+        else:
+            self.db.add_all([conversation, user_message, ai_message])
+            conversation.total_messages += 2
+            # created_at is a server default, unknown until the INSERT
+            conversation.last_activity_at = datetime.now(timezone.utc)
+            await self.db.commit()
+            await self.db.refresh(ai_message)
+            # Hand the connection back before the reply goes out, as _open_turn does
+            await self.db.close()
+        conversation_summarizer.schedule(conversation_id, self.clients.summary_llm if self.clients else None)
+
     async def get_conversation_messages(
-        self, conversation_id: int, skip: int = 0, limit: int = 100
-    ) -> List[Message]:
-        """Get messages in a conversation."""
-        result = await self.db.execute(
-            select(Message)
-            .where(Message.conversation_id == conversation_id)
-            .offset(skip)
-            .limit(limit)
-            .order_by(Message.created_at.asc())
+        self,
+        conversation_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        latest: bool = False
+    ) -> Page:
+        """Get a page of messages in a conversation, oldest first.
+
+        With latest, the first page holds the most recent messages and its
+        prev cursor scrolls back through the history. Messages still queued
+        for writing are included.
+        """
+        return await paginate(
+            self.db,
+            select(Message).where(Message.conversation_id == conversation_id),
+            Message.created_at,
+            Message.id,
+            limit,
+            cursor=cursor,
+            skip=skip,
+            from_end=latest,
+            pending=message_writer.pending(conversation_id) if message_writer else ()
         )
-        return result.scalars().all()
 
     async def delete_conversation(self, conversation_id: int) -> bool:
         """Delete a conversation and all its messages."""
@@ -128,12 +188,32 @@ class ChatService:
         if not conversation:
             return False
 
+        if message_writer:
+            message_writer.discard(conversation_id)
         await self.db.delete(conversation)
         await self.db.commit()
+        if context_cache:
+            await context_cache.conversation_changed(conversation_id)
         return True
 
+    async def update_context_documents(self, conversation_id: int, document_ids: List[int]) -> Optional[Conversation]:
+        """Replace the documents a conversation draws its context from."""
+        conversation = await self.get_conversation_by_id(conversation_id)
+        if not conversation:
+            return None
+
+        conversation.context_documents = list(document_ids)
+        await self.db.commit()
+        await self.db.refresh(conversation)
+        if context_cache:
+            await context_cache.conversation_changed(conversation_id)
+        return conversation
+
     async def save_feedback(self, conversation_id: int, message_id: int, feedback: Dict):
         """Save user feedback on an AI response."""
+        if message_writer and message_writer.pending(conversation_id):
+            # The rated message may still be queued
+            await message_writer.flush()
         result = await self.db.execute(
             select(Message).where(
                 Message.id == message_id,
@@ -149,154 +229,252 @@ class ChatService:
             await self.db.commit()
 
     async def process_message_stream(
-        self, conversation_id: int, message: ChatMessage
-    ) -> AsyncGenerator[str, None]:
-        """Process message with streaming response."""
-        # This would implement streaming responses for real-time chat
-        # For now, we'll simulate streaming by yielding chunks
-        response = await self._generate_ai_response_simple(message.content)
-        
-        # Simulate streaming by yielding chunks
-        words = response.split()
-        for i, word in enumerate(words):
-            if i > 0:
-                yield " "
-            yield word
-            await asyncio.sleep(0.05)  # Simulate typing delay
-
-    async def get_last_response(self, conversation_id: int) -> Optional[Dict]:
-        """Get the last AI response in a conversation."""
-        result = await self.db.execute(
-            select(Message)
-            .where(
-                Message.conversation_id == conversation_id,
-                Message.role == MessageRole.ASSISTANT
-            )
-            .order_by(Message.created_at.desc())
-            .limit(1)
+        self, conversation_id: int, message: ChatMessage, deadline: Optional[Deadline] = None
+    ) -> AsyncGenerator[Dict, None]:
+        """Process a user message, streaming the AI response as it is generated.
+
+        Yields {"type": "response_chunk", "content": delta} for every upstream
+        token delta, then persists the assistant message once and yields
+        {"type": "response_complete", "content": message} with the saved row.
+        """
+        conversation = await self._open_turn(conversation_id)
+
+        user_message = Message(
+            conversation_id=conversation_id,
+            role=MessageRole.USER,
+            content=message.content,
+            message_type=message.message_type or "general"
         )
-        message = result.scalar_one_or_none()
-        
-        if message:
-            return {
-                "id": message.id,
-                "role": message.role,
-                "content": message.content,
-                "created_at": message.created_at
+
+        started = time.monotonic()
+        parts = []
+        if not self.llm:
+            parts.append("I'm sorry, but I'm not configured to provide AI responses. Please check the API configuration.")
+            yield {"type": "response_chunk", "content": parts[-1]}
+        else:
+            prompt = await self._build_prompt(conversation, message.content)
+            profile = _generation_profile(message.message_type)
+            try:
+                async for delta in stream_llm(
+                    self.llm, prompt, "chat_stream", deadline,
+                    stop=list(profile.stop), max_tokens=profile.max_new_tokens
+                ):
+                    parts.append(delta)
+                    yield {"type": "response_chunk", "content": delta}
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                parts.append(f"I apologize, but I encountered an error while processing your question: {str(e)}")
+                yield {"type": "response_chunk", "content": parts[-1]}
+
+        # Persist the complete answer once, now that the stream has ended
+        ai_message = Message(
+            conversation_id=conversation_id,
+            role=MessageRole.ASSISTANT,
+            content="".join(parts).strip(),
+            model_used=getattr(self.llm, "model_name", None),
+            processing_time_ms=int((time.monotonic() - started) * 1000),
+            message_type="response"
+        )
+        await self._save_turn(conversation, user_message, ai_message)
+
+        yield {
+            "type": "response_complete",
+            "content": {
+                "id": ai_message.id,
+                "role": ai_message.role,
+                "content": ai_message.content,
+                "created_at": ai_message.created_at,
+                "message_type": ai_message.message_type
             }
-        return None
+        }
 
-    async def _generate_ai_response(self, conversation: Conversation, user_input: str) -> str:
+    async def _generate_ai_response(
+        self,
+        conversation: Conversation,
+        user_input: str,
+        deadline: Optional[Deadline] = None,
+        message_type: Optional[str] = None
+    ) -> str:
         """Generate AI response with context awareness."""
         if not self.llm:
             return "I'm sorry, but I'm not configured to provide AI responses. Please check the API configuration."
 
-        # Build context from conversation history, documents, and user progress
-        context = await self._build_context(conversation)
-        
-        # Create a contextualized prompt
-        prompt_template = self._get_tutor_prompt_template(conversation)
+        full_prompt = await self._build_prompt(conversation, user_input)
         
         try:
             # Generate response using the AI model
-            full_prompt = prompt_template.format(
-                context=context,
-                user_input=user_input,
-                conversation_history=await self._get_conversation_history(conversation.id),
-                learning_objectives=", ".join(conversation.learning_objectives),
-                difficulty_level=conversation.difficulty_level or "intermediate"
+            profile = _generation_profile(message_type)
+            response = await call_llm(
+                self.llm, full_prompt, "chat", deadline,
+                stop=list(profile.stop), max_tokens=profile.max_new_tokens
             )
-            
-            response = await asyncio.to_thread(self.llm, full_prompt)
             return response.strip()
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return f"I apologize, but I encountered an error while processing your question: {str(e)}"
 
-    async def _generate_ai_response_simple(self, user_input: str) -> str:
-        """Simple AI response without full context (for streaming demo)."""
-        if not self.llm:
-            return "I'm sorry, but I'm not configured to provide AI responses."
-
-        try:
-            prompt = f"As a helpful AI tutor, please respond to this student question: {user_input}"
-            response = await asyncio.to_thread(self.llm, prompt)
-            return response.strip()
-        except Exception as e:
-            return f"I apologize, but I encountered an error: {str(e)}"
-
-    async def _build_context(self, conversation: Conversation) -> str:
-        """Build contextual information for the AI response."""
-        context_parts = []
-
-        # Add document context
-        if conversation.context_documents:
-            for doc_id in conversation.context_documents:
-                doc = await self._get_document_context(doc_id)
-                if doc:
-                    context_parts.append(f"Document: {doc}")
+    async def _build_prompt(self, conversation: Conversation, user_input: str) -> str:
+        """Build the tutor prompt from documents, progress and conversation history."""
+        # Build context from conversation history, documents, and user progress
+        context = await self._build_context(conversation, user_input)
+        
+        # Create a contextualized prompt
+        prompt_template = self._get_tutor_prompt_template(conversation)
+        
+        return prompt_template.format(
+            context=context.render_context(),
+            user_input=user_input,
+            conversation_history=context.render_history(),
+            learning_objectives=", ".join(conversation.learning_objectives),
+            difficulty_level=conversation.difficulty_level or "intermediate"
+        )
 
-        # Add user progress context
-        progress_context = await self._get_user_progress_context(conversation.user_id)
-        if progress_context:
-            context_parts.append(f"User Progress: {progress_context}")
+    async def _build_context(self, conversation: Conversation, user_input: str) -> ChatContext:
+        """Load documents, progress, history and relevant passages for a chat turn.
+
+        The loads run concurrently, so the latency is that of the slowest
+        (history: the latest summary, then the messages after it) no matter how
+        many documents the conversation references. Documents and progress
+        rarely change between turns and come from the context cache when it
+        has a current entry. Passages are then retrieved from the documents
+        that loaded, which keeps deleted documents out; documents missing from
+        this worker's keyword index are first loaded in one more short read.
+
+        Connection budget: a turn holds no pooled connection while it gets
+        here (see _open_turn) and at most three at once in here (documents,
+        progress and history, then the keyword index load on its own), each
+        only for its query. The pool
+        (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW) therefore bounds the turns
+        reading context at the same moment, not the turns in flight.
+        """
+        pending = message_writer.pending(conversation.id) if message_writer else ()
+        (documents, progress), (summary, history), query_embedding = await asyncio.gather(
+            self._load_grounding(conversation),
+            self._read(self._load_history, conversation.id, pending),
+            self._embed_query(user_input) if conversation.context_documents else asyncio.sleep(0),
+        )
+        document_ids = [document.id for document in documents]
+        missing = hybrid_retriever.missing(document_ids)
+        if missing:
+            # Chunked and indexed after the read, without holding its connection
+            rows = await self._read(hybrid_retriever.fetch_texts, missing)
+            await hybrid_retriever.index_fetched(missing, rows)
+        passages = await hybrid_retriever.retrieve(
+            user_input, query_embedding, document_ids, conversation.user_id, settings.RAG_TOP_K
+        )
+        return ChatContext(
+            documents=documents, progress=progress, history=history, summary=summary, passages=passages
+        )
 
-        return "\n\n".join(context_parts) if context_parts else ""
+    async def _embed_query(self, user_input: str) -> Optional[List[float]]:
+        """Embedding of the student's question, or None to retrieve by keywords alone.
 
-    async def _get_document_context(self, document_id: int) -> Optional[str]:
-        """Get relevant context from a document."""
-        result = await self.db.execute(
-            select(Document).where(Document.id == document_id)
+        Retrieval only adds context, so a failed embedding call narrows it
+        rather than failing the turn.
+        """
+        if not self.embeddings:
+            return None
+        try:
+            return await self.embeddings.aembed_query(user_input)
+        except Exception:
+            return None
+
+    async def _load_grounding(self, conversation: Conversation) -> Tuple[List[DocumentContext], List[ProgressContext]]:
+        """Documents and progress, from the context cache or from the database."""
+        versions = None
+        if context_cache:
+            cached, versions = await context_cache.lookup(conversation)
+            if cached:
+                return cached
+
+        documents, progress = await asyncio.gather(
+            self._read(self._load_documents, conversation.context_documents or []),
+            self._read(self._load_progress, conversation.user_id),
         )
-        document = result.scalar_one_or_none()
-        
-        if document and document.ai_analysis:
-            # Extract key information from the document analysis
-            analysis = document.ai_analysis
-            context = f"Title: {document.title}\n"
-            if "summary" in analysis:
-                context += f"Summary: {analysis['summary']}\n"
-            if "key_concepts" in analysis:
-                context += f"Key Concepts: {', '.join(analysis['key_concepts'])}\n"
-            return context
+        if context_cache:
+            await context_cache.store(conversation, versions, documents, progress)
+        return documents, progress
+
+    async def _read(self, loader, *args):
+        """Run a read-only loader in its own session; one AsyncSession cannot run queries concurrently."""
+        async with self.session_factory() as session:
+            return await loader(session, *args)
+
+    @staticmethod
+    async def _load_documents(session: AsyncSession, document_ids: List[int]) -> List[DocumentContext]:
+        """Referenced documents that have text or an analysis, in one IN query, in reference order.
+
+        A document whose analysis is missing or failed still grounds the turn
+        through its retrieved passages.
+        """
+        if not document_ids:
+            return []
+        # Only the columns the prompt needs; extracted_text can be megabytes
+        result = await session.execute(
+            select(
+                Document.id, Document.title, Document.ai_analysis,
+                Document.extracted_text.isnot(None).label("has_text")
+            )
+            .where(Document.id.in_(document_ids))
+        )
+        by_id = {row.id: row for row in result}
         
-        return None
-
-    async def _get_user_progress_context(self, user_id: int) -> Optional[str]:
-        """Get user's learning progress context."""
-        # Get recent progress records
-        result = await self.db.execute(
-            select(ProgressRecord)
+        documents = []
+        for document_id in document_ids:
+            row = by_id.get(document_id)
+            if row and (row.has_text or row.ai_analysis):
+                documents.append(DocumentContext.from_analysis(row.id, row.title, row.ai_analysis or {}))
+        return documents
+
+    @staticmethod
+    async def _load_progress(session: AsyncSession, user_id: int, limit: int = 10) -> List[ProgressContext]:
+        """User's most recently updated progress records."""
+        result = await session.execute(
+            select(ProgressRecord.topic_id, ProgressRecord.mastery_level, ProgressRecord.confidence_score)
             .where(ProgressRecord.user_id == user_id)
             .order_by(ProgressRecord.updated_at.desc())
-            .limit(10)
+            .limit(limit)
         )
-        progress_records = result.scalars().all()
-        
-        if progress_records:
-            context = "Recent learning progress:\n"
-            for record in progress_records:
-                context += f"- Topic {record.topic_id}: {record.mastery_level} (confidence: {record.confidence_score})\n"
-            return context
-        
-        return None
-
-    async def _get_conversation_history(self, conversation_id: int, limit: int = 10) -> str:
-        """Get recent conversation history."""
-        result = await self.db.execute(
-            select(Message)
-            .where(Message.conversation_id == conversation_id)
-            .order_by(Message.created_at.desc())
+        return [
+            ProgressContext(row.topic_id, getattr(row.mastery_level, "value", row.mastery_level), row.confidence_score)
+            for row in result
+        ]
+
+    @staticmethod
+    async def _load_history(
+        session: AsyncSession,
+        conversation_id: int,
+        pending: Sequence[Message] = (),
+        limit: int = settings.CONVERSATION_SUMMARY_TRIGGER
+    ) -> Tuple[Optional[str], List[HistoryTurn]]:
+        """Latest rolling summary and the messages after it, oldest first.
+
+        The summarizer keeps the unsummarized tail below the trigger, so the
+        history stays bounded however long the conversation gets; the limit
+        only matters while a summary is still being written. Pending messages
+        from the write-behind queue are merged in by id.
+        """
+        summary = await latest_summary(session, conversation_id)
+        after = summary.message_range_end if summary else 0
+        result = await session.execute(
+            select(Message.id, Message.role, Message.content)
+            .where(
+                Message.conversation_id == conversation_id,
+                Message.id > after
+            )
+            .order_by(Message.id.desc())
             .limit(limit)
         )
-        messages = result.scalars().all()
-        
-        history = []
-        for message in reversed(messages):
-            role = "Student" if message.role == MessageRole.USER else "Tutor"
-            history.append(f"{role}: {message.content}")
-        
-        return "\n".join(history)
+        rows = {row.id: row for row in result}
+        rows.update({message.id: message for message in pending if message.id > after})
+        history = [
+            HistoryTurn("Student" if row.role == MessageRole.USER else "Tutor", row.content)
+            for _, row in sorted(rows.items())[-limit:]
+        ]
+        return (summary.summary if summary else None), history
 
     def _get_tutor_prompt_template(self, conversation: Conversation) -> PromptTemplate:
         """Get the AI tutor prompt template."""
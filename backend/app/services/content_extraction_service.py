@@ -1,20 +1,45 @@
 import os
-from typing import Dict, List, Optional
 import asyncio
+import logging
+from typing import Dict, List, Optional
 from langchain.document_loaders import PyPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document as LangChainDocument
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.llms import OpenAI
 from langchain.prompts import PromptTemplate
 
-from app.core.config import settings
+from app.core.metrics import call_llm
+from app.core.llm_clients import LLMClients
+from app.services.hybrid_retrieval import hybrid_retriever
+from app.services.vector_index import vector_index
+
+logger = logging.getLogger(__name__)
 
 
 class ContentExtractionService:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(openai_api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
-        self.llm = OpenAI(openai_api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
+    def __init__(self, clients: Optional[LLMClients] = None):
+        self.embeddings = clients.embeddings if clients else None
+        self.llm = clients.extraction_llm if clients else None
+
+    async def extract_text(self, file_path: str) -> str:
+        """Extract the plain text of an uploaded file."""
+        pages = await self._load_document(file_path)
+        return "\n\n".join(page.page_content for page in pages)
+
+    async def index_document(self, document_id: int, user_id: int, text: str) -> int:
+        """Chunk a document into the keyword index and, with embeddings available, the vector index.
+
+        A failed embedding call leaves the document searchable by keywords
+        only rather than failing its processing. Returns the number of chunks
+        indexed.
+        """
+        chunks = await hybrid_retriever.index_text(document_id, user_id, text)
+        if not self.embeddings or not chunks:
+            return len(chunks)
+        try:
+            embeddings = await self.embeddings.aembed_documents(chunks)
+            await asyncio.to_thread(vector_index.add_document, document_id, chunks, embeddings)
+        except Exception as e:
+            logger.error(f"Embedding document {document_id} failed, keyword search only: {str(e)}")
+        return len(chunks)
 
     async def process_document(self, document_id: int) -> Dict:
         """
@@ -46,6 +71,10 @@ class ContentExtractionService:
 
     async def _load_document(self, file_path: str) -> List[LangChainDocument]:
         """Load document content based on file type."""
+        return await asyncio.to_thread(self._load_document_sync, file_path)
+
+    def _load_document_sync(self, file_path: str) -> List[LangChainDocument]:
+        """Load document content based on file type; blocking."""
         file_extension = file_path.split('.')[-1].lower()
         
         try:
@@ -195,6 +224,6 @@ class ContentExtractionService:
         )
         
         formatted_prompt = prompt.format(text=text)
-        response = await asyncio.to_thread(self.llm, formatted_prompt)
+        response = await call_llm(self.llm, formatted_prompt, "extraction")
         
         return response.strip()
@@ -0,0 +1,203 @@
+import json
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.chat_context import DocumentContext, ProgressContext
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryContextBackend:
+    """In-process entries and version counters; consistent within a single worker only."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._versions = {}
+
+    async def read(self, key: str, version_names: Sequence[str]) -> Tuple[Optional[str], List[int]]:
+        versions = [self._versions.get(name, 0) for name in version_names]
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, versions
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None, versions
+        self._entries.move_to_end(key)
+        return value, versions
+
+    async def write(self, key: str, value: str, ttl: int):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def bump(self, version_names: Iterable[str]):
+        for name in version_names:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    async def close(self):
+        pass
+
+
+class RedisContextBackend:
+    """Entries and version counters in Redis, shared by every worker."""
+
+    def __init__(self, url: str, prefix: str = "stementor:context:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def read(self, key: str, version_names: Sequence[str]) -> Tuple[Optional[str], List[int]]:
+        # Entry and versions in one round trip
+        values = await self.client.mget([self.prefix + key] + [self.prefix + name for name in version_names])
+        return values[0], [int(value or 0) for value in values[1:]]
+
+    async def write(self, key: str, value: str, ttl: int):
+        await self.client.set(self.prefix + key, value, ex=ttl)
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def bump(self, version_names: Iterable[str]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for name in version_names:
+                pipe.incr(self.prefix + name)
+            await pipe.execute()
+
+    async def close(self):
+        await self.client.close()
+
+
+class ContextCache:
+    """Document and progress context per conversation, invalidated by the events that change it.
+
+    An entry records the version of every input it was built from: one counter
+    per referenced document and one for the user's progress. Saving a document
+    analysis or recording progress bumps the matching counter, so every worker
+    sharing the backend sees the entry as stale on its next read, without
+    tracking which conversations depend on what. Versions are read before the
+    database is, so a change landing mid-load is never cached as current.
+    """
+
+    def __init__(self, backend, ttl: int = 3600):
+        """
+        Args:
+            backend: MemoryContextBackend or RedisContextBackend
+            ttl: Seconds an entry lives at most, bounding staleness if an invalidation is lost
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def lookup(
+        self, conversation
+    ) -> Tuple[Optional[Tuple[List[DocumentContext], List[ProgressContext]]], Optional[List[int]]]:
+        """Cached (documents, progress) if still current, and the versions to store a fresh load under.
+
+        Backend errors count as a miss; the versions are then None and the
+        fresh load is not stored.
+        """
+        document_ids = list(conversation.context_documents or [])
+        try:
+            raw, versions = await self.backend.read(
+                _conversation_key(conversation.id), _dependencies(document_ids, conversation.user_id)
+            )
+        except Exception as e:
+            logger.error(f"Context cache read failed: {str(e)}")
+            self.misses += 1
+            return None, None
+
+        if raw is not None:
+            entry = json.loads(raw)
+            # An edit to context_documents changes the dependencies themselves
+            if entry["document_ids"] == document_ids and entry["versions"] == versions:
+                self.hits += 1
+                return (
+                    [DocumentContext(**document) for document in entry["documents"]],
+                    [ProgressContext(**record) for record in entry["progress"]]
+                ), versions
+        self.misses += 1
+        return None, versions
+
+    async def store(
+        self,
+        conversation,
+        versions: Optional[List[int]],
+        documents: List[DocumentContext],
+        progress: List[ProgressContext]
+    ):
+        """Cache a fresh load under the versions returned by the lookup that preceded it."""
+        if versions is None:
+            return
+        entry = {
+            "document_ids": list(conversation.context_documents or []),
+            "versions": versions,
+            "documents": [asdict(document) for document in documents],
+            "progress": [asdict(record) for record in progress],
+        }
+        try:
+            await self.backend.write(_conversation_key(conversation.id), json.dumps(entry), self.ttl)
+        except Exception as e:
+            logger.error(f"Context cache write failed: {str(e)}")
+
+    async def documents_changed(self, document_ids: Iterable[int]):
+        """A document's analysis changed or the document was deleted."""
+        await self._bump(f"document:{document_id}" for document_id in document_ids)
+
+    async def progress_changed(self, user_id: int):
+        """A progress record of the user changed."""
+        await self._bump([f"progress:{user_id}"])
+
+    async def conversation_changed(self, conversation_id: int):
+        """The conversation's context documents were edited or it was deleted."""
+        try:
+            await self.backend.delete(_conversation_key(conversation_id))
+        except Exception as e:
+            logger.error(f"Context cache invalidation failed: {str(e)}")
+
+    async def _bump(self, version_names: Iterable[str]):
+        try:
+            await self.backend.bump(list(version_names))
+        except Exception as e:
+            # Entries expire after the TTL at the latest
+            logger.error(f"Context cache invalidation failed: {str(e)}")
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+def _conversation_key(conversation_id: int) -> str:
+    return f"conversation:{conversation_id}"
+
+
+def _dependencies(document_ids: List[int], user_id: int) -> List[str]:
+    return [f"document:{document_id}" for document_id in document_ids] + [f"progress:{user_id}"]
+
+
+def create_context_cache() -> Optional[ContextCache]:
+    """Context cache from CONTEXT_CACHE_BACKEND; None when disabled."""
+    if settings.CONTEXT_CACHE_BACKEND == "redis":
+        backend = RedisContextBackend(settings.REDIS_URL)
+    elif settings.CONTEXT_CACHE_BACKEND == "memory":
+        backend = MemoryContextBackend(settings.CONTEXT_CACHE_MAX_ENTRIES)
+    else:
+        return None
+    return ContextCache(backend, ttl=settings.CONTEXT_CACHE_TTL)
+
+
+# Shared by all requests; invalidated from the document, progress and chat services
+context_cache = create_context_cache()
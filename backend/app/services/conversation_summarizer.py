@@ -0,0 +1,163 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.models.chat import Conversation, ConversationSummary, Message, MessageRole
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import call_llm
+from app.services.chat_context import HistoryTurn
+
+logger = logging.getLogger(__name__)
+
+# Longest message text quoted into a summary prompt
+MAX_MESSAGE_CHARS = 2000
+
+
+class ConversationSummarizer:
+    """Fold the older messages of long conversations into rolling summaries.
+
+    Each ConversationSummary row covers the conversation from its first message
+    up to message_range_end: it is written from the previous row's summary plus
+    the messages that followed it. A prompt therefore needs only the latest row
+    and the messages after its range, however long the conversation has run.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        trigger_messages: int = settings.CONVERSATION_SUMMARY_TRIGGER,
+        keep_recent: int = settings.CONVERSATION_SUMMARY_KEEP_RECENT
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # Serializes the check-then-insert of summary rows within this worker
+        self._write_lock = asyncio.Lock()
+
+    def schedule(self, conversation_id: int, llm: Optional[Any]) -> None:
+        """Summarize a conversation in the background if it has grown past the trigger.
+
+        At most one run per conversation is in flight; turns arriving meanwhile
+        are picked up by the next run.
+        """
+        if not llm:
+            return
+        task = self._tasks.get(conversation_id)
+        if task and not task.done():
+            return
+        task = asyncio.create_task(self._run(conversation_id, llm))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id, None))
+
+    async def shutdown(self):
+        """Cancel runs still in flight; the next turn after a restart schedules them again."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, conversation_id: int, llm: Any):
+        try:
+            await self.summarize(conversation_id, llm)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A failed run only delays summarizing; the prompt falls back to the raw tail
+            logger.warning(f"Conversation {conversation_id} summary failed: {str(e)}")
+
+    async def summarize(self, conversation_id: int, llm: Any) -> Optional[ConversationSummary]:
+        """Write a new summary row if enough messages follow the latest one.
+
+        Everything but the most recent keep_recent messages is folded in, so the
+        tail the prompt quotes verbatim stays between keep_recent and
+        trigger_messages long. The reads and the write each use their own short
+        session; no connection is held during the model call. The row is only
+        written if no other run, in this worker or another, added a summary
+        meanwhile, so ranges never overlap.
+        """
+        async with self.session_factory() as session:
+            previous = await latest_summary(session, conversation_id)
+            result = await session.execute(
+                select(Message.id, Message.role, Message.content)
+                .where(
+                    Message.conversation_id == conversation_id,
+                    Message.id > (previous.message_range_end if previous else 0)
+                )
+                .order_by(Message.id.asc())
+            )
+            messages = result.all()
+        if len(messages) < self.trigger_messages:
+            return None
+
+        folded = messages[:len(messages) - self.keep_recent]
+        if not folded:
+            return None
+        turns = [
+            HistoryTurn("Student" if row.role == MessageRole.USER else "Tutor", row.content[:MAX_MESSAGE_CHARS])
+            for row in folded
+        ]
+        text = await call_llm(
+            llm,
+            self._summary_prompt(previous.summary if previous else None, turns),
+            "summary",
+            max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS
+        )
+
+        previous_end = previous.message_range_end if previous else None
+        async with self._write_lock, self.session_factory() as session:
+            # The conversation row lock serializes runs of other workers (PostgreSQL)
+            await session.execute(
+                select(Conversation.id).where(Conversation.id == conversation_id).with_for_update()
+            )
+            latest = await latest_summary(session, conversation_id)
+            if (latest.message_range_end if latest else None) != previous_end:
+                logger.info(f"Conversation {conversation_id} was summarized meanwhile; dropping this summary")
+                return None
+            summary = ConversationSummary(
+                conversation_id=conversation_id,
+                summary=text.strip(),
+                message_range_start=previous.message_range_start if previous else folded[0].id,
+                message_range_end=folded[-1].id
+            )
+            session.add(summary)
+            await session.commit()
+            return summary
+
+    def _summary_prompt(self, previous_summary: Optional[str], turns: List[HistoryTurn]) -> str:
+        """Prompt asking the model to extend the running summary with newer turns."""
+        earlier = previous_summary or "(none - this is the start of the conversation)"
+        transcript = "\n".join(turn.render() for turn in turns)
+        return f"""
+You are keeping notes on a tutoring conversation so that a tutor can continue it without rereading it.
+
+Summary of the conversation so far:
+{earlier}
+
+Newer messages:
+{transcript}
+
+Write an updated summary of the whole conversation in at most 200 words. Keep the topics covered,
+what the student has understood, where they struggled, and any questions still open. Do not
+address the student.
+
+Updated summary:
+"""
+
+
+async def latest_summary(session: AsyncSession, conversation_id: int) -> Optional[ConversationSummary]:
+    """Most recent summary row of a conversation, if it has one."""
+    result = await session.execute(
+        select(ConversationSummary)
+        .where(ConversationSummary.conversation_id == conversation_id)
+        .order_by(ConversationSummary.message_range_end.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+# Shared by all requests so runs are deduplicated per conversation
+conversation_summarizer = ConversationSummarizer()
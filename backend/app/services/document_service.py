@@ -8,6 +8,8 @@ from sqlalchemy import select
 from app.models.document import Document, ProcessingStatus
 from app.core.config import settings
 from app.schemas.document import DocumentCreate
+from app.services.context_cache import context_cache
+from app.services.hybrid_retrieval import hybrid_retriever
 
 
 class DocumentService:
@@ -86,6 +88,20 @@ class DocumentService:
             return None
         return document.ai_analysis
 
+    async def save_extracted_text(self, document_id: int, text: str):
+        """Save the plain text extracted from a document."""
+        result = await self.db.execute(
+            select(Document).where(Document.id == document_id)
+        )
+        document = result.scalar_one_or_none()
+        
+        if document:
+            document.extracted_text = text
+            await self.db.commit()
+            # The document now joins its conversations' context, analysis or not
+            if context_cache:
+                await context_cache.documents_changed([document_id])
+
     async def save_document_analysis(self, document_id: int, analysis: dict):
         """Save AI analysis results for a document."""
         result = await self.db.execute(
@@ -97,6 +113,8 @@ class DocumentService:
             document.ai_analysis = analysis
             document.processing_status = ProcessingStatus.COMPLETED
             await self.db.commit()
+            if context_cache:
+                await context_cache.documents_changed([document_id])
 
     async def mark_processing_failed(self, document_id: int, error_message: str):
         """Mark document processing as failed."""
@@ -126,5 +144,8 @@ class DocumentService:
         # Delete database record
         await self.db.delete(document)
         await self.db.commit()
+        await hybrid_retriever.remove_document(document_id)
+        if context_cache:
+            await context_cache.documents_changed([document_id])
         
         return True
@@ -0,0 +1,155 @@
+import time
+import asyncio
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.models.document import Document
+from app.core.config import settings
+from app.services.chat_context import PassageContext
+from app.services.keyword_index import KeywordIndex, keyword_index
+from app.services.vector_index import VectorIndex, vector_index
+
+# Rank offset of reciprocal rank fusion; 60 is the value from the original paper
+RRF_K = 60
+
+# Seconds before retrying to load a document that had no extracted text yet
+MISSING_TEXT_RETRY = 60.0
+
+_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=settings.RAG_CHUNK_SIZE,
+    chunk_overlap=settings.RAG_CHUNK_OVERLAP
+)
+
+
+def split_into_chunks(text: str) -> List[str]:
+    """Split document text into overlapping retrieval chunks; deterministic, so both indexes agree on chunk numbers."""
+    return [chunk for chunk in _splitter.split_text(text) if chunk.strip()]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Fuse several best-first rankings; each item scores the sum of 1 / (k + rank) over the rankings it is in."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever:
+    """BM25 and vector search over document chunks, fused by reciprocal rank.
+
+    Exact STEM terms, symbols and formula names ("Navier–Stokes", "eigenvalue")
+    are found by BM25 even when the embedding misses them; paraphrases are found
+    by the vectors. Ranks rather than raw scores are fused, so the two scales
+    need no calibration. Only documents owned by the asking user are searched.
+    """
+
+    def __init__(
+        self,
+        keywords: KeywordIndex,
+        vectors: VectorIndex,
+        candidates: int = settings.RAG_CANDIDATES
+    ):
+        """
+        Args:
+            keywords: BM25 index; documents missing from it are loaded from Document.extracted_text
+            vectors: Embedding index
+            candidates: Chunks taken from each ranking before fusing
+        """
+        self.keywords = keywords
+        self.vectors = vectors
+        self.candidates = candidates
+        self._missing_text: Dict[int, float] = {}
+
+    async def retrieve(
+        self,
+        query: str,
+        query_embedding: Optional[Sequence[float]],
+        document_ids: Sequence[int],
+        user_id: int,
+        k: int = 4
+    ) -> List[PassageContext]:
+        """Top-k chunks for a question across the given documents of a user.
+
+        Without a query embedding (no embedding client, or the call failed)
+        the ranking is BM25 alone. Documents not in the keyword index are
+        skipped; load them first with fetch_texts and index_fetched.
+        """
+        allowed = [document_id for document_id in document_ids if self.keywords.owner(document_id) == user_id]
+        if not allowed:
+            return []
+
+        texts = {}
+        rankings = []
+        keyword_hits = self.keywords.search(query, allowed, self.candidates)
+        rankings.append([(hit.document_id, hit.chunk_index) for hit in keyword_hits])
+        texts.update({(hit.document_id, hit.chunk_index): hit.text for hit in keyword_hits})
+        if query_embedding is not None:
+            vector_hits = await asyncio.to_thread(self.vectors.search, query_embedding, allowed, self.candidates)
+            rankings.append([(hit.document_id, hit.chunk_index) for hit in vector_hits])
+            texts.update({(hit.document_id, hit.chunk_index): hit.text for hit in vector_hits})
+
+        return [
+            PassageContext(document_id, texts[(document_id, chunk_index)], score)
+            for (document_id, chunk_index), score in reciprocal_rank_fusion(rankings)[:k]
+        ]
+
+    def missing(self, document_ids: Sequence[int]) -> List[int]:
+        """Documents this worker has not indexed yet, e.g. uploaded through another worker, evicted or before a restart.
+
+        Documents found without extracted text are left out for MISSING_TEXT_RETRY seconds.
+        """
+        now = time.monotonic()
+        return [
+            document_id for document_id in document_ids
+            if document_id not in self.keywords and self._missing_text.get(document_id, 0.0) <= now
+        ]
+
+    @staticmethod
+    async def fetch_texts(session: AsyncSession, document_ids: Sequence[int]) -> List:
+        """Owner and extracted text of the given documents that have text, in the caller's session."""
+        result = await session.execute(
+            select(Document.id, Document.user_id, Document.extracted_text)
+            .where(Document.id.in_(document_ids), Document.extracted_text.isnot(None))
+        )
+        return result.all()
+
+    async def index_fetched(self, document_ids: Sequence[int], rows: Sequence):
+        """Index the fetch_texts rows of missing documents once their session is closed."""
+        for row in rows:
+            await self.index_text(row.id, row.user_id, row.extracted_text)
+        found = {row.id for row in rows}
+        retry_at = time.monotonic() + MISSING_TEXT_RETRY
+        for document_id in document_ids:
+            if document_id not in found:
+                self._missing_text[document_id] = retry_at
+
+    async def index_text(self, document_id: int, user_id: int, text: str) -> List[str]:
+        """Chunk a document's text and add it to the keyword index; returns the chunks."""
+        chunks = await asyncio.to_thread(split_into_chunks, text)
+        await self.index_document(document_id, user_id, chunks)
+        return chunks
+
+    async def index_document(self, document_id: int, user_id: int, chunks: Sequence[str]):
+        """Add a document to the keyword index.
+
+        Terms are counted and postings built in worker threads (about 75 ms
+        per 200 chunks); only registering new terms and the final insert run
+        on the event loop.
+        """
+        chunk_terms, terms = await asyncio.to_thread(self.keywords.analyze, chunks)
+        term_ids = self.keywords.register_terms(terms)
+        postings = await asyncio.to_thread(self.keywords.build, user_id, chunks, chunk_terms, term_ids)
+        self._missing_text.pop(document_id, None)
+        self.keywords.insert(document_id, postings)
+
+    async def remove_document(self, document_id: int):
+        """Drop a deleted document from both indexes."""
+        self.keywords.remove_document(document_id)
+        await asyncio.to_thread(self.vectors.remove_document, document_id)
+
+
+# Shared by ingestion and chat
+hybrid_retriever = HybridRetriever(keyword_index, vector_index)
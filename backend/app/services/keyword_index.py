@@ -0,0 +1,206 @@
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# Words (Unicode, so Greek letters count) and single math symbols
+_TOKEN = re.compile(r"\w+|[∇∂∫∮∑∏√∞≈≡≠≤≥±∓×÷→←↔⇒⇔∈∉⊂⊆∪∩∀∃∧∨¬⊥∥°′″]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Index terms of a text: case-folded words with a light plural strip, plus math symbols.
+
+    Hyphenated names such as "Navier–Stokes" split into their parts, so
+    "navier stokes" and "Navier-Stokes" match each other exactly.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return [_stem(token) for token in _TOKEN.findall(text)]
+
+
+def _stem(token: str) -> str:
+    # Same rules as services.semantic_cache._stem, so both agree on what a term is
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("sses", "xes", "zes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+@dataclass
+class KeywordHit:
+    """One chunk matched by BM25."""
+
+    document_id: int
+    chunk_index: int
+    text: str
+    score: float
+
+
+class _DocumentPostings:
+    """Inverted index of one document's chunks in compressed sparse rows.
+
+    term_ids is sorted; the postings of term_ids[i] are
+    chunk_ids[offsets[i]:offsets[i + 1]] with matching term frequencies.
+    """
+
+    def __init__(self, user_id: int, texts: List[str], chunk_terms: List[Counter], term_ids: Dict[str, int]):
+        self.user_id = user_id
+        self.texts = texts
+        self.lengths = np.array([sum(terms.values()) for terms in chunk_terms], dtype=np.float32)
+
+        postings: Dict[int, List] = {}
+        for chunk_index, terms in enumerate(chunk_terms):
+            for term, frequency in terms.items():
+                postings.setdefault(term_ids[term], []).append((chunk_index, frequency))
+        self.term_ids = np.array(sorted(postings), dtype=np.int32)
+        counts = [len(postings[term_id]) for term_id in self.term_ids]
+        self.offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        flat = [posting for term_id in self.term_ids for posting in postings[term_id]]
+        self.chunk_ids = np.array([chunk for chunk, _ in flat], dtype=np.int32)
+        self.frequencies = np.array([frequency for _, frequency in flat], dtype=np.float32)
+
+    def postings(self, term_id: int):
+        position = np.searchsorted(self.term_ids, term_id)
+        if position == len(self.term_ids) or self.term_ids[position] != term_id:
+            return None, None
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.chunk_ids[start:end], self.frequencies[start:end]
+
+    def nbytes(self) -> int:
+        arrays = (self.lengths, self.term_ids, self.offsets, self.chunk_ids, self.frequencies)
+        return sum(array.nbytes for array in arrays) + sum(len(text) for text in self.texts)
+
+
+class KeywordIndex:
+    """In-process BM25 index over document chunks.
+
+    Postings are kept per document, so a search filtered to a conversation's
+    context documents only touches those documents, while document
+    frequencies and the average chunk length are corpus-wide and updated
+    incrementally as documents are added and removed. Beyond max_documents
+    the least recently indexed or searched document is dropped; it is loaded again from
+    Document.extracted_text the next time a chat turn needs it.
+
+    Indexing is split so the CPU-heavy steps (analyze, build) can run in a
+    worker thread while the steps touching shared state (register_terms,
+    insert) stay on the event loop; add_document runs all four in a row.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_documents: Optional[int] = None):
+        self.k1 = k1
+        self.b = b
+        self.max_documents = max_documents
+        self.vocabulary: Dict[str, int] = {}
+        self.document_frequencies = np.zeros(1024, dtype=np.int32)
+        self.total_chunks = 0
+        self.total_length = 0.0
+        self.evictions = 0
+        self._documents: "OrderedDict[int, _DocumentPostings]" = OrderedDict()
+
+    def __contains__(self, document_id: int) -> bool:
+        return document_id in self._documents
+
+    def owner(self, document_id: int) -> Optional[int]:
+        document = self._documents.get(document_id)
+        return document.user_id if document else None
+
+    @staticmethod
+    def analyze(chunks: Sequence[str]) -> Tuple[List[Counter], Set[str]]:
+        """Term counts of each chunk and the document's distinct terms; safe to run in a worker thread."""
+        chunk_terms = [Counter(tokenize(chunk)) for chunk in chunks]
+        return chunk_terms, set().union(*chunk_terms)
+
+    def register_terms(self, terms: Iterable[str]) -> Dict[str, int]:
+        """Vocabulary ids of a document's distinct terms, adding the new ones; run on the event loop."""
+        for term in terms:
+            if term not in self.vocabulary:
+                self.vocabulary[term] = len(self.vocabulary)
+        if len(self.vocabulary) > len(self.document_frequencies):
+            grown = np.zeros(max(len(self.vocabulary), 2 * len(self.document_frequencies)), dtype=np.int32)
+            grown[:len(self.document_frequencies)] = self.document_frequencies
+            self.document_frequencies = grown
+        return {term: self.vocabulary[term] for term in terms}
+
+    @staticmethod
+    def build(user_id: int, chunks: Sequence[str], chunk_terms: List[Counter], term_ids: Dict[str, int]) -> _DocumentPostings:
+        """Postings of a document from analyze() and register_terms() output; safe to run in a worker thread."""
+        return _DocumentPostings(user_id, list(chunks), chunk_terms, term_ids)
+
+    def insert(self, document_id: int, document: _DocumentPostings):
+        """Make built postings searchable, replacing any earlier version and evicting beyond max_documents."""
+        self.remove_document(document_id)
+        self.document_frequencies[document.term_ids] += np.diff(document.offsets).astype(np.int32)
+        self.total_chunks += len(document.texts)
+        self.total_length += float(document.lengths.sum())
+        self._documents[document_id] = document
+        while self.max_documents and len(self._documents) > self.max_documents:
+            self.remove_document(next(iter(self._documents)))
+            self.evictions += 1
+
+    def add_document(self, document_id: int, user_id: int, chunks: Sequence[str]):
+        """Index (or re-index) a document's chunks in one go."""
+        chunk_terms, terms = self.analyze(chunks)
+        self.insert(document_id, self.build(user_id, chunks, chunk_terms, self.register_terms(terms)))
+
+    def remove_document(self, document_id: int):
+        """Drop a document from the index."""
+        document = self._documents.pop(document_id, None)
+        if document is None:
+            return
+        self.document_frequencies[document.term_ids] -= np.diff(document.offsets).astype(np.int32)
+        self.total_chunks -= len(document.texts)
+        self.total_length -= float(document.lengths.sum())
+
+    def search(self, query: str, document_ids: Iterable[int], k: int = 20) -> List[KeywordHit]:
+        """Top-k chunks by BM25 across the given documents, best first."""
+        term_ids = [self.vocabulary[term] for term in dict.fromkeys(tokenize(query)) if term in self.vocabulary]
+        if not term_ids or not self.total_chunks:
+            return []
+        average_length = self.total_length / self.total_chunks
+        frequencies = self.document_frequencies[term_ids]
+        idf = np.log1p((self.total_chunks - frequencies + 0.5) / (frequencies + 0.5))
+
+        candidates = []
+        for document_id in dict.fromkeys(document_ids):
+            document = self._documents.get(document_id)
+            if document is None:
+                continue
+            self._documents.move_to_end(document_id)
+            scores = np.zeros(len(document.texts), dtype=np.float32)
+            norms = self.k1 * (1 - self.b + self.b * document.lengths / average_length)
+            for term_id, term_idf in zip(term_ids, idf):
+                chunk_ids, tf = document.postings(term_id)
+                if chunk_ids is not None:
+                    scores[chunk_ids] += term_idf * tf * (self.k1 + 1) / (tf + norms[chunk_ids])
+            matched = np.flatnonzero(scores)
+            if len(matched) > k:
+                matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            candidates.extend((float(scores[i]), document_id, int(i)) for i in matched)
+
+        candidates.sort(reverse=True)
+        return [
+            KeywordHit(document_id, index, self._documents[document_id].texts[index], score)
+            for score, document_id, index in candidates[:k]
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._documents),
+            "chunks": self.total_chunks,
+            "terms": len(self.vocabulary),
+            "max_documents": self.max_documents,
+            "evictions": self.evictions,
+            "bytes": sum(document.nbytes() for document in self._documents.values()),
+        }
+
+
+# Shared by ingestion and chat; filled on upload and lazily from Document.extracted_text
+keyword_index = KeywordIndex(max_documents=settings.KEYWORD_INDEX_MAX_DOCUMENTS)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import bindparam, insert, text, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models.chat import Conversation, Message
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Columns written for a queued message; the rest take their column defaults
+MESSAGE_COLUMNS = (
+    "id", "conversation_id", "role", "content", "message_type",
+    "model_used", "processing_time_ms", "created_at"
+)
+
+
+class MessageWriter:
+    """Write-behind queue for chat messages.
+
+    A chat turn enqueues its messages and returns without waiting for a
+    commit. A background task writes the queue every interval seconds, or as
+    soon as batch_size messages are waiting, as multi-row INSERTs plus one
+    counter UPDATE per conversation, all in one transaction. Ids come from the
+    messages sequence when a turn is enqueued, so replies carry their final id
+    and history stays in id order.
+
+    Queued messages are only visible to this worker: readers merge pending()
+    into what they load from the database, and anything still queued is
+    written on shutdown. A hard crash loses at most one interval of messages.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        interval: float = settings.CHAT_WRITE_BEHIND_INTERVAL,
+        batch_size: int = settings.CHAT_WRITE_BEHIND_BATCH_SIZE
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.interval = interval
+        self.batch_size = batch_size
+        self._queue: Dict[int, List[Message]] = {}
+        self._in_flight: Dict[int, List[Message]] = {}
+        self._queued = 0
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def enqueue(self, conversation_id: int, messages: Sequence[Message]):
+        """Assign ids and timestamps to a turn's messages and queue them for writing."""
+        ids = await self._allocate_ids(len(messages))
+        now = datetime.now(timezone.utc)
+        for message, message_id in zip(messages, ids):
+            message.id = message_id
+            message.created_at = now
+        self._queue.setdefault(conversation_id, []).extend(messages)
+        self._queued += len(messages)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self._queued >= self.batch_size:
+            self._wake.set()
+
+    async def _allocate_ids(self, count: int) -> List[int]:
+        """Next ids of the messages sequence (PostgreSQL), one round trip without a transaction to wait on."""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                text("SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, :count)"),
+                {"count": count}
+            )
+            return [row[0] for row in result]
+
+    def pending(self, conversation_id: int) -> List[Message]:
+        """Messages of a conversation not yet committed, oldest first."""
+        return self._in_flight.get(conversation_id, []) + self._queue.get(conversation_id, [])
+
+    def discard(self, conversation_id: int):
+        """Drop the queued messages of a conversation that is being deleted."""
+        self._queued -= len(self._queue.pop(conversation_id, []))
+
+    async def flush(self):
+        """Write everything queued so far."""
+        async with self._flush_lock:
+            if not self._queue:
+                return
+            batch, self._queue, self._queued = self._queue, {}, 0
+            self._in_flight = batch
+            try:
+                try:
+                    await self._write(batch)
+                except IntegrityError:
+                    # Most likely a conversation deleted meanwhile; keep the other conversations' turns
+                    for conversation_id, messages in batch.items():
+                        try:
+                            await self._write({conversation_id: messages})
+                        except IntegrityError as e:
+                            logger.warning(f"Dropped {len(messages)} queued messages of conversation {conversation_id}: {str(e)}")
+            except BaseException:
+                # Database unavailable or flush cancelled: put the batch back in front for the next flush
+                for conversation_id, messages in batch.items():
+                    self._queue[conversation_id] = messages + self._queue.get(conversation_id, [])
+                self._queued = sum(len(messages) for messages in self._queue.values())
+                raise
+            finally:
+                self._in_flight = {}
+
+    async def _write(self, batch: Dict[int, List[Message]]):
+        rows = [
+            {column: getattr(message, column) for column in MESSAGE_COLUMNS}
+            for messages in batch.values() for message in messages
+        ]
+        counters = [
+            {
+                "conversation_key": conversation_id,
+                "added": len(messages),
+                "activity_at": messages[-1].created_at
+            }
+            for conversation_id, messages in batch.items()
+        ]
+        async with self.session_factory() as session:
+            for start in range(0, len(rows), self.batch_size):
+                await session.execute(insert(Message.__table__).values(rows[start:start + self.batch_size]))
+            await session.execute(
+                update(Conversation.__table__)
+                .where(Conversation.id == bindparam("conversation_key"))
+                .values(
+                    total_messages=Conversation.total_messages + bindparam("added"),
+                    last_activity_at=bindparam("activity_at")
+                ),
+                counters
+            )
+            await session.commit()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Writing queued chat messages failed, retrying: {str(e)}")
+
+    async def shutdown(self):
+        """Stop the background task and write whatever is still queued.
+
+        The task is woken and left to finish a flush in progress rather than
+        cancelled in the middle of it. If the final write fails, the messages
+        still queued are reported as lost instead of failing the rest of the
+        application's shutdown.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Writing queued chat messages at shutdown failed, {self._queued} messages lost: {str(e)}")
+
+
+# Shared by all requests of a worker; None unless CHAT_WRITE_BEHIND is enabled
+message_writer = MessageWriter() if settings.CHAT_WRITE_BEHIND else None
@@ -12,6 +12,7 @@ from app.models.progress import (
 from app.models.document import Topic
 from app.models.user import User
 from app.schemas.progress import SkillAssessment, ProgressUpdate
+from app.services.context_cache import context_cache
 
 
 class ProgressService:
@@ -178,6 +179,8 @@ class ProgressService:
         await self._update_mastery_level(progress_record)
         
         await self.db.commit()
+        if context_cache:
+            await context_cache.progress_changed(progress_record.user_id)
 
     async def update_topic_progress(self, progress: ProgressUpdate):
         """Update user's progress on a specific topic."""
@@ -211,6 +214,8 @@ class ProgressService:
         progress_record.last_practice_at = datetime.utcnow()
         
         await self.db.commit()
+        if context_cache:
+            await context_cache.progress_changed(progress_record.user_id)
 
     async def get_topic_mastery(self, topic_id: int) -> Optional[Dict[str, Any]]:
         """Get detailed mastery information for a specific topic."""
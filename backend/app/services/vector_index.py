@@ -0,0 +1,146 @@
+import os
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChunkHit:
+    """One retrieved chunk of a document."""
+
+    document_id: int
+    chunk_index: int
+    text: str
+    score: float
+
+
+class _DocumentChunks:
+    def __init__(self, vectors: np.ndarray, texts: List[str], mtime: int):
+        self.vectors = vectors
+        self.texts = texts
+        self.mtime = mtime
+
+
+class VectorIndex:
+    """Chunk embeddings of every document, kept in a local directory.
+
+    Each document's unit-length vectors live in their own .npy file, memory
+    mapped on first use, with the chunk texts next to it in JSON. A search only
+    scores the documents it is asked about (a conversation's context
+    documents), so its cost follows the size of those documents rather than of
+    the whole corpus, and the corpus does not have to fit in memory. Workers
+    share the directory; a file's modification time tells a worker that another
+    one has re-indexed or deleted the document.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._documents: Dict[int, _DocumentChunks] = {}
+
+    def _paths(self, document_id: int) -> Tuple[str, str]:
+        base = os.path.join(self.directory, str(document_id))
+        return base + ".npy", base + ".json"
+
+    def add_document(self, document_id: int, chunks: Sequence[str], embeddings: Sequence[Sequence[float]]) -> int:
+        """Index (or re-index) a document's chunks; returns the number of chunks stored.
+
+        Blocking file I/O; call it from a worker thread in async code.
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if len(chunks) != len(vectors):
+            raise ValueError("Expected one embedding per chunk")
+        if not len(vectors):
+            self.remove_document(document_id)
+            return 0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        # Created on first write, so importing the app leaves no directory behind
+        os.makedirs(self.directory, exist_ok=True)
+        vectors_path, texts_path = self._paths(document_id)
+        # Texts first and both files swapped in atomically; readers check the counts match
+        with open(texts_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(list(chunks), f)
+        os.replace(texts_path + ".tmp", texts_path)
+        with open(vectors_path + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(vectors_path + ".tmp", vectors_path)
+        self._documents.pop(document_id, None)
+        return len(chunks)
+
+    def remove_document(self, document_id: int):
+        """Drop a document from the index."""
+        self._documents.pop(document_id, None)
+        for path in self._paths(document_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _load(self, document_id: int) -> Optional[_DocumentChunks]:
+        vectors_path, texts_path = self._paths(document_id)
+        try:
+            mtime = os.stat(vectors_path).st_mtime_ns
+        except FileNotFoundError:
+            self._documents.pop(document_id, None)
+            return None
+
+        cached = self._documents.get(document_id)
+        if cached is not None and cached.mtime == mtime:
+            return cached
+        try:
+            with open(texts_path, encoding="utf-8") as f:
+                texts = json.load(f)
+            vectors = np.load(vectors_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Vector index entry for document {document_id} unreadable: {str(e)}")
+            return None
+        if len(texts) != len(vectors):
+            # Caught between the two writes of a re-index; the next search picks it up
+            return None
+        loaded = self._documents[document_id] = _DocumentChunks(vectors, texts, mtime)
+        return loaded
+
+    def search(self, query_embedding: Sequence[float], document_ids: Iterable[int], k: int = 4) -> List[ChunkHit]:
+        """Top-k chunks by cosine similarity across the given documents, best first.
+
+        Blocking file I/O on first use of a document; call it from a worker thread in async code.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        candidates = []
+        texts = {}
+        for document_id in dict.fromkeys(document_ids):
+            chunks = self._load(document_id)
+            if chunks is None or chunks.vectors.shape[1] != len(query):
+                continue
+            texts[document_id] = chunks.texts
+            scores = chunks.vectors @ query
+            # Only each document's own top k can make the overall top k
+            top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+            candidates.extend((float(scores[i]), document_id, int(i)) for i in top)
+
+        candidates.sort(reverse=True)
+        return [
+            ChunkHit(document_id, index, texts[document_id][index], score)
+            for score, document_id, index in candidates[:k]
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "documents_loaded": len(self._documents),
+            "chunks_loaded": sum(len(chunks.texts) for chunks in self._documents.values()),
+        }
+
+
+# Shared by ingestion and chat; the directory is the source of truth
+vector_index = VectorIndex(settings.VECTOR_INDEX_PATH)
@@ -2,6 +2,16 @@
 Services module for STEMentor AI Learning Platform
 """
 
-from .ai_service import LlamaAIService, ai_service
+import importlib
 
 __all__ = ['LlamaAIService', 'ai_service']
+
+
+def __getattr__(name):
+    # Lazy, so the helpers shared with the app package (deadline, metrics,
+    # generation_profiles) can be imported without building the global service
+    if name in __all__:
+        module = importlib.import_module(".ai_service", __name__)
+        globals().update({export: getattr(module, export) for export in __all__})
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
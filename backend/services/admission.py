@@ -0,0 +1,170 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+ANALYSIS = "analysis"
+WARMUP = "warmup"
+PRIORITY_CLASSES = (INTERACTIVE, ANALYSIS, WARMUP)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call cannot be admitted because the queue is full"""
+
+
+class AdmissionTimeout(AdmissionRejected):
+    """Raised when a queued call waited longer than its class timeout"""
+
+
+class AdmissionController:
+    """
+    Cap concurrent upstream calls and queue the rest by priority
+
+    Free slots are handed to the highest-priority waiter first (FIFO within a
+    class), so a burst of document analysis cannot starve interactive chat.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 64,
+        queue_timeouts: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            max_concurrency: Upstream calls allowed to run at once
+            max_queue: Calls allowed to wait for a slot across all classes
+            queue_timeouts: Maximum seconds a call of each class may wait
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeouts = {INTERACTIVE: 10.0, ANALYSIS: 120.0, WARMUP: 300.0}
+        if queue_timeouts:
+            self.queue_timeouts.update(queue_timeouts)
+
+        self._in_use = 0
+        self._waiters: List[list] = []  # heap of [rank, seq, future]
+        self._seq = itertools.count()
+        self._queued = {name: 0 for name in PRIORITY_CLASSES}
+
+        self.admitted = {name: 0 for name in PRIORITY_CLASSES}
+        self.rejected = {name: 0 for name in PRIORITY_CLASSES}
+        self.timed_out = {name: 0 for name in PRIORITY_CLASSES}
+        self._wait_total = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._wait_max = {name: 0.0 for name in PRIORITY_CLASSES}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Build a controller from LLAMA_MAX_CONCURRENCY, LLAMA_MAX_QUEUE and LLAMA_QUEUE_TIMEOUT_<CLASS>"""
+        timeouts = {}
+        for name in PRIORITY_CLASSES:
+            value = os.getenv(f"LLAMA_QUEUE_TIMEOUT_{name.upper()}")
+            if value:
+                timeouts[name] = float(value)
+        return cls(
+            max_concurrency=int(os.getenv("LLAMA_MAX_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("LLAMA_MAX_QUEUE", "64")),
+            queue_timeouts=timeouts
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self._queued.values())
+
+    async def acquire(self, priority: str = INTERACTIVE):
+        """Wait for a slot; raises AdmissionRejected or AdmissionTimeout"""
+        if priority not in self._queued:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        if self._in_use < self.max_concurrency and self.queue_depth == 0:
+            self._in_use += 1
+            self._record_admission(priority, 0.0)
+            return
+
+        if self.queue_depth >= self.max_queue:
+            self.rejected[priority] += 1
+            logger.warning(f"Admission queue full ({self.max_queue}), rejecting {priority} call")
+            raise AdmissionRejected(f"Inference queue is full ({self.max_queue} waiting)")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [PRIORITY_CLASSES.index(priority), next(self._seq), future])
+        self._queued[priority] += 1
+        started = time.monotonic()
+        try:
+            # A slot handed over by release() resolves the future; asyncio.wait (unlike
+            # wait_for) neither cancels it nor hides a cancellation racing the hand-over
+            done, _ = await asyncio.wait({future}, timeout=self.queue_timeouts[priority])
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation: pass it on
+                self.release()
+            else:
+                future.cancel()
+            raise
+        finally:
+            self._queued[priority] -= 1
+        if not done:
+            # Cancelled so release() skips it; nothing can resolve it between wait() and here
+            future.cancel()
+            self.timed_out[priority] += 1
+            logger.warning(f"{priority} call timed out after {self.queue_timeouts[priority]}s in the admission queue")
+            raise AdmissionTimeout(f"Timed out waiting {self.queue_timeouts[priority]}s for an inference slot")
+        self._record_admission(priority, time.monotonic() - started)
+
+    def try_acquire(self, priority: str = INTERACTIVE) -> bool:
+        """Take a slot only if one is free right now, without queueing"""
+        if self._in_use < self.max_concurrency and self.queue_depth == 0:
+            self._in_use += 1
+            self._record_admission(priority, 0.0)
+            return True
+        return False
+
+    def release(self):
+        """Give the slot to the next live waiter, or free it"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self._in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE):
+        """Hold a slot for the duration of the block"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _record_admission(self, priority: str, waited: float):
+        self.admitted[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_use": self._in_use,
+            "max_queue": self.max_queue,
+            "queue_depth": dict(self._queued),
+            "queue_timeouts": dict(self.queue_timeouts),
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "timed_out": dict(self.timed_out),
+            "wait_seconds": {
+                name: {
+                    "avg": round(self._wait_total[name] / self.admitted[name], 4) if self.admitted[name] else 0.0,
+                    "max": round(self._wait_max[name], 4),
+                }
+                for name in PRIORITY_CLASSES
+            },
+        }
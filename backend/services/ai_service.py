@@ -1,134 +1,524 @@
 import os
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncGenerator
 import httpx
 import json
 import asyncio
+import functools
+import hashlib
+import time
+from collections import Counter
+
+from .resilience import RetryPolicy, CircuitBreaker, parse_retry_after
+from .response_cache import ResponseCache, make_cache_key
+from .semantic_cache import SemanticCache
+from .single_flight import SingleFlight
+from .backends import InferenceBackend, create_backends, create_http_client
+from .hedging import Endpoint, EndpointPool, RequestTrace
+from .metrics import llm_metrics
+from .deadline import Deadline, DeadlineExceeded
+from .model_router import ModelRouter, RouteDecision
+from .generation_profiles import GenerationProfile, StopSequenceFilter, default_profiles, truncate_at_stop, GENERAL
+from .prompt_budget import PromptBudgeter, PromptFit
+from .admission import AdmissionController, AdmissionRejected, INTERACTIVE, ANALYSIS, WARMUP
 
 logger = logging.getLogger(__name__)
 
+# Readiness states reported by get_readiness()
+STARTING = "starting"
+WARMING = "warming"
+READY = "ready"
+DEGRADED = "degraded"
+
+ANALYSIS_SYSTEM_MESSAGE = "You are an expert educational content analyzer. Provide structured analysis of academic documents."
+
+# Output budget for each per-chunk (map) analysis call
+ANALYSIS_MAP_MAX_NEW_TOKENS = 384
+
+DIFFICULTY_LEVELS = ("beginner", "intermediate", "advanced")
+
+# Admission priority class for each call site
+CALL_SITE_PRIORITY = {
+    "chat": INTERACTIVE,
+    "analysis": ANALYSIS,
+    "warmup": WARMUP,
+}
+
 class LlamaAIService:
-    """AI Service using Meta Llama 3 via Hugging Face Inference API"""
+    """AI Service using Meta Llama 3 via a pluggable inference backend (Hugging Face Inference API by default)"""
     
-    def __init__(self, model_name: str = None):
+    def __init__(
+        self,
+        model_name: str = None,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+        backend: Optional[InferenceBackend] = None
+    ):
         """
         Initialize the Llama 3 AI service
         
         Args:
             model_name: The Hugging Face model name for Llama 3
+            retry_policies: Optional retry policy per call site ("chat", "analysis", "warmup")
+            backend: Inference backend; defaults to the one selected by LLAMA_BACKEND,
+                with one endpoint per URL in LLAMA_BACKEND_URLS
         """
         # Use environment variable or default to Llama 3 8B
         self.model_name = model_name or os.getenv("LLAMA_MODEL", "meta-llama/Meta-Llama-3-8B-Instruct")
-        self.hf_token = os.getenv("HUGGINGFACE_TOKEN")
-        self.api_url = f"https://api-inference.huggingface.co/models/{self.model_name}"
+        backends = [backend] if backend else create_backends(self.model_name)
+        self.backend = backends[0]
+        self.api_url = self.backend.generate_url()
+        
+        # Equivalent endpoints: least-outstanding routing and hedging of slow chat calls
+        self.endpoint_pool = EndpointPool.from_env([Endpoint(item) for item in backends])
+        self.endpoint_pools = {self.model_name: self.endpoint_pool}
+        
+        # Optional smaller model for greetings and simple lookups (LLAMA_SMALL_MODEL)
+        self.model_router = None if backend else ModelRouter.from_env(self.model_name)
+        if self.model_router:
+            small_model = self.model_router.models["small"]
+            try:
+                small_backends = create_backends(small_model, url_prefix="LLAMA_SMALL_BACKEND")
+                self.endpoint_pools[small_model] = EndpointPool.from_env([Endpoint(item) for item in small_backends])
+            except ValueError as e:
+                logger.warning(f"Model routing disabled: {str(e)}")
+                self.model_router = None
         self.is_initialized = False
         
+        # Readiness: warming until the first test generation finishes
+        self.readiness = STARTING
+        self.readiness_detail = None
+        self.warmup_seconds = None
+        self._warmup_task = None
+        
         # Model configuration
         self.max_new_tokens = 512
         self.temperature = 0.7
         self.top_p = 0.9
         self.repetition_penalty = 1.1
         
+        # Output budget and stop sequences per chat message type
+        self.generation_profiles = default_profiles()
+        
         # HTTP client for API calls
         self.client = None
         
-    async def initialize(self):
-        """Initialize the API client and test connection"""
+        # Token counting and trimming against the model window
+        self.prompt_budgeter = PromptBudgeter.from_env(self.model_name, auth_token=self.backend.token)
+        
+        # Map-reduce document analysis: chunk size and how many chunks run at once
+        self.analysis_chunk_tokens = int(os.getenv("LLAMA_ANALYSIS_CHUNK_TOKENS", "1500"))
+        
+        # Retry policy per call site; interactive chat gives up quickly,
+        # background analysis and warmup can afford to wait for the model
+        self.retry_policies = {
+            "chat": RetryPolicy.from_env("chat", max_attempts=2, base_delay=0.5, max_delay=5.0),
+            "analysis": RetryPolicy.from_env("analysis", max_attempts=4, base_delay=2.0, max_delay=30.0),
+            "warmup": RetryPolicy.from_env("warmup", max_attempts=6, base_delay=5.0, max_delay=30.0),
+        }
+        if retry_policies:
+            self.retry_policies.update(retry_policies)
+        
+        # Generation cache (None when LLAMA_CACHE_ENABLED=false)
+        self.response_cache = ResponseCache.from_env()
+        
+        # Reuses answers to paraphrased questions (None unless LLAMA_SEMANTIC_CACHE_ENABLED=true)
+        self.semantic_cache = SemanticCache.from_env()
+        
+        # Coalesces identical generations that are in flight at the same time
+        self.single_flight = SingleFlight()
+        
+        # Caps concurrent upstream calls; chat is admitted ahead of analysis and warmup
+        self.admission = AdmissionController.from_env()
+        self.analysis_parallelism = int(os.getenv("LLAMA_ANALYSIS_PARALLELISM", str(self.admission.max_concurrency)))
+        
+        # Shared across call sites: it tracks the health of the backend itself
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("LLAMA_BREAKER_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("LLAMA_BREAKER_RECOVERY_TIMEOUT", "30")),
+            trial_timeout=float(os.getenv("LLAMA_BREAKER_TRIAL_TIMEOUT", "60"))
+        )
+        
+    def setup_client(self) -> bool:
+        """
+        Create the shared API client without contacting the model
+        
+        This is fast enough to run inline at startup; the service accepts requests
+        as soon as it returns True, while warmup() runs in the background.
+        """
         try:
             logger.info(f"Initializing Llama 3 API service: {self.model_name}")
-            logger.info("Using Hugging Face Inference API (no local model needed)")
+            logger.info(f"Using inference backend '{self.backend.name}' at {self.api_url}")
             
-            # Check if we have a Hugging Face token
-            if not self.hf_token:
+            # Check if we have a token when the backend needs one
+            if self.backend.requires_token and not self.backend.token:
                 logger.error("HUGGINGFACE_TOKEN not found. This is required for the Inference API.")
+                self.readiness = DEGRADED
+                self.readiness_detail = "HUGGINGFACE_TOKEN is not configured"
                 return False
             
-            # Create HTTP client
-            self.client = httpx.AsyncClient(
-                headers={
-                    "Authorization": f"Bearer {self.hf_token}",
-                    "Content-Type": "application/json"
-                },
-                timeout=httpx.Timeout(120.0)  # 2 minutes timeout for API calls
-            )
+            # Create the shared HTTP client (pooled keep-alive connections)
+            if self.client is None:
+                self.client = create_http_client(self.backend)
+            
+            self.is_initialized = True
+            self.readiness = WARMING
+            self.readiness_detail = "Model warmup in progress"
+            return True
             
-            # Test the API connection
+        except Exception as e:
+            logger.error(f"Failed to initialize Llama 3 API service: {str(e)}")
+            self.readiness = DEGRADED
+            self.readiness_detail = f"Client setup failed: {str(e)}"
+            return False
+    
+    async def warmup(self) -> bool:
+        """Send a short test generation so the upstream model is loaded before real traffic needs it"""
+        started = time.monotonic()
+        await self.prompt_budgeter.load()
+        try:
             logger.info("Testing API connection...")
             test_response = await self._make_api_call(
                 "Hello, can you respond with a simple greeting?",
+                call_site="warmup",
                 max_new_tokens=50
             )
-            
-            if test_response:
-                self.is_initialized = True
-                logger.info("✅ Llama 3 API service initialized successfully!")
-                logger.info(f"Test response: {test_response[:100]}...")
-                return True
-            else:
-                logger.error("❌ Failed to get response from API")
-                return False
-                
         except Exception as e:
-            logger.error(f"Failed to initialize Llama 3 API service: {str(e)}")
+            logger.error(f"Warmup failed: {str(e)}")
+            test_response = None
+        self.warmup_seconds = round(time.monotonic() - started, 3)
+        
+        if test_response:
+            self.readiness = READY
+            self.readiness_detail = None
+            logger.info("✅ Llama 3 API service initialized successfully!")
+            logger.info(f"Test response: {test_response[:100]}...")
+            return True
+        
+        self.readiness = DEGRADED
+        self.readiness_detail = "Warmup generation failed; requests are served but may be slow or fail"
+        logger.error("❌ Failed to get response from API")
+        return False
+    
+    def start_warmup(self) -> Optional[asyncio.Task]:
+        """Run warmup() as a background task so startup does not wait on a cold model"""
+        if not self.is_initialized:
+            return None
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.create_task(self.warmup())
+        return self._warmup_task
+    
+    async def initialize(self, warmup: bool = True) -> bool:
+        """Initialize the API client and, unless warmup is False, wait for a test generation"""
+        if not self.setup_client():
             return False
+        if warmup:
+            return await self.warmup()
+        return True
     
-    async def _make_api_call(self, prompt: str, **parameters) -> Optional[str]:
-        """Make a call to the Hugging Face Inference API"""
-        try:
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": parameters.get("max_new_tokens", self.max_new_tokens),
-                    "temperature": parameters.get("temperature", self.temperature),
-                    "top_p": parameters.get("top_p", self.top_p),
-                    "repetition_penalty": parameters.get("repetition_penalty", self.repetition_penalty),
-                    "do_sample": True,
-                    "return_full_text": False  # Only return new generated text
-                },
-                "options": {
-                    "wait_for_model": True,
-                    "use_cache": False
-                }
-            }
-            
-            logger.info(f"Making API call to: {self.api_url}")
-            response = await self.client.post(self.api_url, json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                if isinstance(result, list) and len(result) > 0:
-                    # Standard response format
-                    generated_text = result[0].get("generated_text", "")
-                elif isinstance(result, dict):
-                    # Alternative response format
-                    generated_text = result.get("generated_text", "")
-                else:
-                    logger.error(f"Unexpected response format: {result}")
-                    return None
-                
-                # Clean up the response
-                generated_text = generated_text.strip()
-                generated_text = generated_text.replace('<|eot_id|>', '').replace('<|end_of_text|>', '')
+    def get_readiness(self) -> Dict[str, Any]:
+        """Readiness for load balancers: warming, ready or degraded"""
+        status = self.readiness
+        detail = self.readiness_detail
+        if status == READY and self.circuit_breaker.state == CircuitBreaker.OPEN:
+            status = DEGRADED
+            detail = "Inference backend is failing; circuit breaker is open"
+        elif status == READY and self.circuit_breaker.trial_overdue:
+            status = DEGRADED
+            detail = "Inference backend is not answering; circuit breaker trial call is overdue"
+        return {
+            "status": status,
+            # Warming workers already accept requests, so only a missing client is not ready
+            "accepting_traffic": self.is_initialized,
+            "detail": detail,
+            "warmup_seconds": self.warmup_seconds,
+            "backend": self.backend.name,
+        }
+    
+    def _pool_for(self, model: Optional[str]) -> EndpointPool:
+        """Endpoints serving a model; the main model's when it is not routed"""
+        return self.endpoint_pools.get(model or self.model_name, self.endpoint_pool)
+    
+    def _build_payload(self, prompt: str, stream: bool = False, model: Optional[str] = None, **parameters) -> Dict[str, Any]:
+        """Build the request body for a text-generation call"""
+        parameters = {
+            "max_new_tokens": parameters.get("max_new_tokens", self.max_new_tokens),
+            "temperature": parameters.get("temperature", self.temperature),
+            "top_p": parameters.get("top_p", self.top_p),
+            "repetition_penalty": parameters.get("repetition_penalty", self.repetition_penalty),
+            "stop": parameters.get("stop") or []
+        }
+        return self._pool_for(model).primary.backend.build_payload(prompt, parameters, stream=stream)
+    
+    def _retry_after_hint(self, response: httpx.Response) -> Optional[float]:
+        """Seconds the server asked us to wait, from Retry-After or HF's estimated_time"""
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is None and response.status_code == 503:
+            # Hugging Face reports model loading as 503 with an estimated_time body
+            try:
+                retry_after = float(response.json().get("estimated_time"))
+            except Exception:
+                retry_after = None
+        return retry_after
+    
+    def _record_outcome(self, status_code: Optional[int]):
+        """Feed an upstream result into the circuit breaker"""
+        if status_code is None or status_code == 429 or status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            # The backend answered; client errors say nothing about its health
+            self.circuit_breaker.record_success()
+    
+    def _observe_call(
+        self,
+        call_site: str,
+        outcome: str,
+        queue_wait: Optional[float],
+        duration: Optional[float],
+        prompt_tokens: int,
+        trace: Optional[RequestTrace] = None,
+        ttfb: Optional[float] = None,
+        completion_tokens: Optional[int] = None,
+        model: Optional[str] = None
+    ):
+        """Record one upstream attempt in the process-wide LLM metrics"""
+        if ttfb is None and trace is not None:
+            ttfb = trace.ttfb_seconds
+        llm_metrics.observe_call(
+            call_site,
+            model or self.model_name,
+            outcome,
+            queue_wait=queue_wait,
+            connect=trace.connect_seconds if trace else None,
+            ttfb=ttfb,
+            duration=duration,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+    
+    async def _make_api_call(
+        self, prompt: str, call_site: str = "chat", model: Optional[str] = None, **parameters
+    ) -> Optional[str]:
+        """Make a call to the Hugging Face Inference API with bounded retries"""
+        policy = self.retry_policies.get(call_site, self.retry_policies["chat"])
+        pool = self._pool_for(model)
+        payload = self._build_payload(prompt, model=model, **parameters)
+        prompt_tokens = self.prompt_budgeter.count(prompt)
+        
+        priority = CALL_SITE_PRIORITY.get(call_site, INTERACTIVE)
+        
+        attempt = 0
+        while True:
+            attempt += 1
+            status_code = None
+            retry_after = None
+            outcome = "error"
+            queue_wait = duration = trace = generated = None
+            admitted = False
+            try:
+                # The slot is held only while the request is on the wire, not during backoff
+                requested = time.monotonic()
+                async with self.admission.slot(priority):
+                    queue_wait = time.monotonic() - requested
+                    admitted = self.circuit_breaker.allow_request()
+                    if not admitted:
+                        logger.warning(f"Circuit breaker is open, failing fast for {call_site} call")
+                        outcome = "circuit_open"
+                        return None
+                    
+                    logger.info(f"Making {call_site} API call (attempt {attempt}/{policy.max_attempts})")
+                    sent = time.monotonic()
+                    # Only interactive calls are hedged; background work can wait out a slow endpoint
+                    response = await pool.post(
+                        self.client, payload, hedge=(call_site == "chat"), admission=self.admission, priority=priority
+                    )
+                    duration = time.monotonic() - sent
+                status_code = response.status_code
+                trace = response.extensions.get("request_trace")
+                outcome = f"http_{status_code}"
                 
-                return generated_text.strip()
+                if status_code == 200:
+                    self._record_outcome(status_code)
+                    generated = pool.primary.backend.parse_generation(response.json())
+                    outcome = "success" if generated is not None else "invalid_response"
+                    return generated
                 
-            elif response.status_code == 503:
-                # Model is loading, wait and retry
-                logger.info("Model is loading, waiting 10 seconds before retry...")
-                await asyncio.sleep(10)
-                return await self._make_api_call(prompt, **parameters)
+                logger.error(f"API call failed with status {status_code}: {response.text}")
+                retry_after = self._retry_after_hint(response)
                 
-            else:
-                logger.error(f"API call failed with status {response.status_code}: {response.text}")
+            except AdmissionRejected as e:
+                logger.warning(f"{call_site} call not admitted: {str(e)}")
+                outcome = "rejected"
                 return None
-                
-        except Exception as e:
-            logger.error(f"Error making API call: {str(e)}")
-            return None
+            except httpx.TransportError as e:
+                logger.error(f"Transport error making API call: {str(e)}")
+                outcome = "transport_error"
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"Error making API call: {str(e)}")
+                return None
+            finally:
+                # A half-open trial that ended without an upstream answer must not block later calls;
+                # outcomes are recorded before this or right after it with no await in between
+                if admitted:
+                    self.circuit_breaker.release_trial()
+                self._observe_call(
+                    call_site, outcome, queue_wait, duration, prompt_tokens, trace=trace,
+                    completion_tokens=self.prompt_budgeter.count(generated) if generated is not None else None,
+                    model=model
+                )
+            
+            self._record_outcome(status_code)
+            if not policy.should_retry(attempt, status_code):
+                return None
+            
+            delay = policy.compute_delay(attempt, retry_after)
+            logger.info(f"Retrying {call_site} call in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    async def _make_api_call_stream(
+        self, prompt: str, call_site: str = "chat", model: Optional[str] = None, **parameters
+    ) -> AsyncGenerator[str, None]:
+        """Stream generated tokens from the Hugging Face Inference API (server-sent events)"""
+        policy = self.retry_policies.get(call_site, self.retry_policies["chat"])
+        pool = self._pool_for(model)
+        payload = self._build_payload(prompt, stream=True, model=model, **parameters)
+        
+        prompt_tokens = self.prompt_budgeter.count(prompt)
+        
+        priority = CALL_SITE_PRIORITY.get(call_site, INTERACTIVE)
+        
+        attempt = 0
+        while True:
+            attempt += 1
+            status_code = None
+            retry_after = None
+            outcome = "error"
+            queue_wait = duration = first_token = None
+            tokens = 0
+            trace = RequestTrace()
+            admitted = False
+            try:
+                # A stream occupies upstream capacity until its last token
+                requested = time.monotonic()
+                async with self.admission.slot(priority):
+                    queue_wait = time.monotonic() - requested
+                    admitted = self.circuit_breaker.allow_request()
+                    if not admitted:
+                        logger.warning(f"Circuit breaker is open, failing fast for streaming {call_site} call")
+                        outcome = "circuit_open"
+                        return
+                    
+                    # Streams are routed to the least busy endpoint but never hedged
+                    endpoint = pool.pick()
+                    stream_url = endpoint.backend.generate_url(stream=True)
+                    logger.info(f"Making streaming API call to: {stream_url} (attempt {attempt}/{policy.max_attempts})")
+                    endpoint.outstanding += 1
+                    sent = time.monotonic()
+                    try:
+                        async with self.client.stream("POST", stream_url, json=payload, extensions=trace.extensions()) as response:
+                            status_code = response.status_code
+                            outcome = f"http_{status_code}"
+                            
+                            if status_code == 200:
+                                self._record_outcome(status_code)
+                                # Stays "stopped" if the consumer stops reading (stop sequence, disconnect, deadline)
+                                outcome = "stopped"
+                                async for text in endpoint.backend.iter_stream_tokens(response):
+                                    if first_token is None:
+                                        first_token = time.monotonic() - sent
+                                    tokens += 1
+                                    yield text
+                                outcome = "success"
+                                return
+                            
+                            endpoint.errors += 1
+                            body = await response.aread()
+                            logger.error(f"Streaming API call failed with status {status_code}: {body.decode(errors='replace')}")
+                            retry_after = self._retry_after_hint(response)
+                    finally:
+                        endpoint.outstanding -= 1
+                        duration = time.monotonic() - sent
+                    
+            except AdmissionRejected as e:
+                logger.warning(f"Streaming {call_site} call not admitted: {str(e)}")
+                outcome = "rejected"
+                return
+            except httpx.TransportError as e:
+                outcome = "transport_error"
+                # Once tokens have been sent the stream cannot be replayed
+                if status_code == 200:
+                    raise
+                logger.error(f"Transport error making streaming API call: {str(e)}")
+            finally:
+                if admitted:
+                    self.circuit_breaker.release_trial()
+                # Time to first byte of a stream is time to the first token
+                self._observe_call(
+                    call_site, outcome, queue_wait, duration, prompt_tokens, trace=trace,
+                    ttfb=first_token, completion_tokens=tokens, model=model
+                )
+            
+            self._record_outcome(status_code)
+            if not policy.should_retry(attempt, status_code):
+                return
+            
+            delay = policy.compute_delay(attempt, retry_after)
+            logger.info(f"Retrying streaming {call_site} call in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    def _create_prompt(
+        self,
+        user_message: str,
+        context: Optional[str] = None,
+        system_message: Optional[str] = None,
+        max_new_tokens: Optional[int] = None
+    ) -> str:
+        """Create a properly formatted prompt for Llama 3 that fits the model window"""
+        return self._fit_prompt(user_message, context, system_message, max_new_tokens).prompt
+    
+    def _fit_prompt(
+        self,
+        user_message: str,
+        context: Optional[str] = None,
+        system_message: Optional[str] = None,
+        max_new_tokens: Optional[int] = None
+    ) -> PromptFit:
+        """
+        Format the prompt, trimming context (then the message) to the token budget
+        
+        The budget is the model window minus max_new_tokens; context is cut at
+        sentence boundaries and the number of dropped tokens is reported.
+        """
+        budgeter = self.prompt_budgeter
+        budget = budgeter.available(max_new_tokens or self.max_new_tokens)
+        prompt = self._format_prompt(user_message, context, system_message)
+        prompt_tokens = budgeter.count(prompt)
+        if prompt_tokens <= budget:
+            return PromptFit(prompt, prompt_tokens, 0)
+        
+        dropped = 0
+        if context:
+            overhead = budgeter.count(self._format_prompt(user_message, "", system_message)) + budgeter.count("Context: \n\n")
+            context, dropped = budgeter.fit(context, budget - overhead, keep="head")
+            prompt = self._format_prompt(user_message, context, system_message)
+            prompt_tokens = budgeter.count(prompt)
+        
+        if prompt_tokens > budget:
+            # The message alone overflows the window; keep its beginning
+            overhead = budgeter.count(self._format_prompt("", context, system_message))
+            user_message, more = budgeter.fit(user_message, budget - overhead, keep="head")
+            dropped += more
+            prompt = self._format_prompt(user_message, context, system_message)
+            prompt_tokens = budgeter.count(prompt)
+        
+        budgeter.record(dropped)
+        logger.warning(f"Prompt trimmed to fit the model window: dropped {dropped} tokens, {prompt_tokens} remain")
+        return PromptFit(prompt, prompt_tokens, dropped)
     
-    def _create_prompt(self, user_message: str, context: Optional[str] = None, system_message: Optional[str] = None) -> str:
-        """Create a properly formatted prompt for Llama 3"""
+    def _format_prompt(self, user_message: str, context: Optional[str] = None, system_message: Optional[str] = None) -> str:
+        """Lay out system message, context and user message in the model's chat format"""
         
         # Default system message for educational context
         if system_message is None:
@@ -159,6 +549,54 @@ class LlamaAIService:
         
         return prompt
     
+    def _profile_for(self, kwargs: Dict[str, Any]) -> Optional[GenerationProfile]:
+        """Generation profile for a call; chat defaults to "general", other call sites use none"""
+        message_type = kwargs.get("message_type")
+        if not message_type:
+            return self.generation_profiles[GENERAL] if kwargs.get("call_site", "chat") == "chat" else None
+        return self.generation_profiles.get(message_type, self.generation_profiles[GENERAL])
+    
+    def _generation_parameters(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Sampling parameters for a call: explicit kwargs, then the message type profile, then the service defaults"""
+        profile = self._profile_for(kwargs)
+        temperature = self.temperature
+        if profile and profile.temperature is not None:
+            temperature = profile.temperature
+        return {
+            "max_new_tokens": kwargs.get("max_new_tokens", profile.max_new_tokens if profile else self.max_new_tokens),
+            "temperature": kwargs.get("temperature", temperature),
+            "top_p": kwargs.get("top_p", self.top_p),
+            "repetition_penalty": kwargs.get("repetition_penalty", self.repetition_penalty),
+            "stop": list(kwargs.get("stop", profile.stop if profile else ()))
+        }
+    
+    def _cache_key_for(self, prompt: str, parameters: Dict[str, Any], kwargs: Dict[str, Any]) -> Optional[str]:
+        """Cache key for a generation, or None when the cache must be bypassed"""
+        if self.response_cache is None or not kwargs.get("use_cache", True):
+            return None
+        if not self.response_cache.is_cacheable(parameters, allow_sampled=kwargs.get("cache_sampled")):
+            return None
+        return make_cache_key(kwargs.get("model") or self.model_name, prompt, parameters)
+    
+    def _route(self, user_message: str, kwargs: Dict[str, Any]) -> Optional[RouteDecision]:
+        """Pick the model for a chat message and set it in kwargs; None when routing does not apply"""
+        if self.model_router is None or kwargs.get("model") or kwargs.get("call_site", "chat") != "chat":
+            return None
+        decision = self.model_router.route(user_message, kwargs.get("message_type"))
+        kwargs["model"] = decision.model
+        return decision
+    
+    def _semantic_scope(self, context: Optional[str], system_message: Optional[str], kwargs: Dict[str, Any]) -> Optional[str]:
+        """Semantic cache scope for a chat call, or None when it must not be used"""
+        if self.semantic_cache is None or not kwargs.get("use_cache", True):
+            return None
+        if kwargs.get("call_site", "chat") != "chat":
+            return None
+        # Answers are only shared between identical material, instructions and message type
+        return SemanticCache.scope_key(
+            self.model_name, kwargs.get("subject"), kwargs.get("message_type"), context, system_message
+        )
+    
     async def generate_response(
         self, 
         user_message: str, 
@@ -173,70 +611,254 @@ class LlamaAIService:
             user_message: The user's question or message
             context: Optional context from documents or previous conversation
             system_message: Optional custom system message
-            **kwargs: Additional generation parameters
+            **kwargs: Additional generation parameters; use_cache=False skips the
+                response caches, cache_sampled=True caches even when temperature > 0,
+                coalesce=False opts out of sharing identical in-flight calls,
+                subject scopes semantic answer reuse to one course subject,
+                message_type (general, explanation, problem_solving, quiz) selects
+                the output budget and stop sequences, model overrides the routed
+                model and deadline (a Deadline or seconds) bounds the total time spent
         
         Returns:
             Generated response string
+        
+        Raises:
+            DeadlineExceeded: The deadline passed first; the upstream call has been cancelled
         """
         
         if not self.is_initialized:
             return "I'm sorry, but the AI service is not properly initialized. Please try again later."
         
+        deadline = Deadline.coerce(kwargs.pop("deadline", None))
         try:
-            # Create the prompt
-            prompt = self._create_prompt(user_message, context, system_message)
+            semantic_scope = self._semantic_scope(context, system_message, kwargs)
+            if semantic_scope:
+                cached = await self.semantic_cache.lookup(semantic_scope, user_message)
+                if cached is not None:
+                    logger.info("Response served from semantic cache")
+                    return cached
             
-            # Generate response via API
-            logger.info(f"Generating response for: {user_message[:100]}...")
-            response = await self._make_api_call(
-                prompt,
-                max_new_tokens=kwargs.get("max_new_tokens", self.max_new_tokens),
-                temperature=kwargs.get("temperature", self.temperature),
-                top_p=kwargs.get("top_p", self.top_p),
-                repetition_penalty=kwargs.get("repetition_penalty", self.repetition_penalty)
-            )
+            decision = self._route(user_message, kwargs)
+            started = time.monotonic()
+            generation = self._generate_text(user_message, context, system_message, **kwargs)
+            # Cancelling on expiry closes the upstream request and frees its admission slot
+            response = await (deadline.run(generation) if deadline else generation)
             
             if response:
-                logger.info("Response generated successfully via API")
+                if decision:
+                    self.model_router.record_latency(decision, time.monotonic() - started)
+                if semantic_scope:
+                    await self.semantic_cache.store(semantic_scope, user_message, response)
                 return response
             else:
                 return "I apologize, but I couldn't generate a proper response. Please try rephrasing your question."
                 
+        except DeadlineExceeded as e:
+            logger.warning(f"Abandoning generation: {str(e)}")
+            raise
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             return "I encountered an error while processing your request. Please try again."
     
-    async def analyze_document(self, document_content: str, subject: str) -> Dict[str, Any]:
+    async def _generate_text(
+        self,
+        user_message: str,
+        context: Optional[str] = None,
+        system_message: Optional[str] = None,
+        **kwargs
+    ) -> Optional[str]:
+        """Generate through the cache and single-flight layers; None when no text was produced"""
+        # Create the prompt
+        parameters = self._generation_parameters(kwargs)
+        prompt = self._create_prompt(user_message, context, system_message, parameters["max_new_tokens"])
+        
+        cache_key = self._cache_key_for(prompt, parameters, kwargs)
+        if cache_key:
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Response served from cache")
+                return cached
+        
+        # Generate response via API
+        logger.info(f"Generating response for: {user_message[:100]}...")
+        api_call = functools.partial(
+            self._make_api_call,
+            prompt,
+            call_site=kwargs.get("call_site", "chat"),
+            model=kwargs.get("model"),
+            **parameters
+        )
+        if kwargs.get("coalesce", True):
+            # Identical concurrent requests share one upstream generation
+            flight_key = cache_key or make_cache_key(kwargs.get("model") or self.model_name, prompt, parameters)
+            response = await self.single_flight.do(flight_key, api_call)
+        else:
+            response = await api_call()
+        
+        if response and parameters["stop"]:
+            # Servers may return the stop sequence itself, or ignore stops they do not support
+            response = truncate_at_stop(response, parameters["stop"]).strip()
+        
+        if response:
+            logger.info("Response generated successfully via API")
+            if cache_key:
+                await self.response_cache.set(cache_key, response)
+        return response
+    
+    async def generate_response_stream(
+        self, 
+        user_message: str, 
+        context: Optional[str] = None,
+        system_message: Optional[str] = None,
+        **kwargs
+    ) -> AsyncGenerator[str, None]:
+        """
+        Generate a response token by token using Llama 3 via Hugging Face API
+        
+        Args:
+            user_message: The user's question or message
+            context: Optional context from documents or previous conversation
+            system_message: Optional custom system message
+            **kwargs: Additional generation parameters (see generate_response)
+        
+        Yields:
+            Text fragments as soon as the upstream model produces them
+        
+        Raises:
+            DeadlineExceeded: The deadline passed mid-stream; the upstream stream has been closed
+        """
+        
+        if not self.is_initialized:
+            yield "I'm sorry, but the AI service is not properly initialized. Please try again later."
+            return
+        
+        deadline = Deadline.coerce(kwargs.pop("deadline", None))
+        decision = self._route(user_message, kwargs)
+        started = time.monotonic()
+        parameters = self._generation_parameters(kwargs)
+        prompt = self._create_prompt(user_message, context, system_message, parameters["max_new_tokens"])
+        
+        cache_key = self._cache_key_for(prompt, parameters, kwargs)
+        if cache_key:
+            cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Streamed response served from cache")
+                yield cached
+                return
+        
+        semantic_scope = self._semantic_scope(context, system_message, kwargs)
+        if semantic_scope:
+            cached = await self.semantic_cache.lookup(semantic_scope, user_message)
+            if cached is not None:
+                logger.info("Streamed response served from semantic cache")
+                yield cached
+                return
+        
+        logger.info(f"Streaming response for: {user_message[:100]}...")
+        produced = False
+        pieces = []
+        stop_filter = StopSequenceFilter(parameters["stop"])
+        tokens = self._make_api_call_stream(
+            prompt,
+            call_site=kwargs.get("call_site", "chat"),
+            model=kwargs.get("model"),
+            **parameters
+        )
+        try:
+            async for token in (deadline.iterate(tokens) if deadline else tokens):
+                # Drop leading whitespace the model emits after the assistant header
+                if not produced:
+                    token = token.lstrip()
+                    if not token:
+                        continue
+                token = stop_filter.feed(token)
+                if token:
+                    produced = True
+                    pieces.append(token)
+                    yield token
+                if stop_filter.stopped:
+                    # Leaving the loop closes the upstream stream instead of generating past the stop
+                    break
+            
+            tail = stop_filter.flush()
+            if tail:
+                produced = True
+                pieces.append(tail)
+                yield tail
+        except DeadlineExceeded as e:
+            logger.warning(f"Abandoning stream: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            if not produced:
+                yield "I encountered an error while processing your request. Please try again."
+            return
+        finally:
+            # Close the upstream stream now rather than at garbage collection when the consumer goes away
+            await tokens.aclose()
+        
+        if produced:
+            logger.info("Response streamed successfully via API")
+            if decision:
+                self.model_router.record_latency(decision, time.monotonic() - started)
+            answer = "".join(pieces).strip()
+            if cache_key:
+                await self.response_cache.set(cache_key, answer)
+            if semantic_scope:
+                await self.semantic_cache.store(semantic_scope, user_message, answer)
+        else:
+            yield "I apologize, but I couldn't generate a proper response. Please try rephrasing your question."
+    
+    async def analyze_document(
+        self,
+        document_content: str,
+        subject: str,
+        mode: str = "auto",
+        checkpoint: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
         Analyze uploaded document content
         
         Args:
             document_content: The text content of the document
             subject: The subject category
+            mode: "single" sends one prompt (trimmed to the model window), "map_reduce"
+                analyzes token-bounded chunks and merges them, "auto" picks map_reduce
+                only when the document does not fit in one prompt
+            checkpoint: The "checkpoint" of an earlier partial map-reduce result;
+                chunks already analyzed are not sent again
         
         Returns:
             Analysis results including key topics, difficulty level, etc.
         """
         
+        if mode == "auto":
+            mode = "single" if self._fits_single_prompt(document_content) else "map_reduce"
+        if mode == "map_reduce":
+            return await self._analyze_document_map_reduce(document_content, subject, checkpoint)
+        
         analysis_prompt = (
             f"Analyze this {subject} document and provide:\n"
             f"1. Key topics covered\n"
             f"2. Difficulty level (beginner/intermediate/advanced)\n"
             f"3. Main concepts that students should understand\n"
-            f"4. Potential quiz questions\n\n"
-            f"Document content:\n{document_content[:1500]}..."  # Limit content length for API
+            f"4. Potential quiz questions"
         )
         
         try:
+            # The document goes in as context so the prompt budgeter can trim it to the model window
             response = await self.generate_response(
                 analysis_prompt,
-                system_message="You are an expert educational content analyzer. Provide structured analysis of academic documents."
+                context=f"Document content:\n{document_content}",
+                system_message=ANALYSIS_SYSTEM_MESSAGE,
+                call_site="analysis"
             )
             
             return {
                 "analysis": response,
                 "subject": subject,
-                "status": "completed"
+                "status": "completed",
+                "mode": "single"
             }
         except Exception as e:
             logger.error(f"Error analyzing document: {str(e)}")
@@ -246,6 +868,117 @@ class LlamaAIService:
                 "status": "failed"
             }
     
+    def _fits_single_prompt(self, document_content: str) -> bool:
+        """Whether the whole document fits in one analysis prompt"""
+        budgeter = self.prompt_budgeter
+        overhead = budgeter.count(self._format_prompt("", "", ANALYSIS_SYSTEM_MESSAGE)) + 128
+        return budgeter.count(document_content) + overhead <= budgeter.available(self.max_new_tokens)
+    
+    async def _analyze_document_map_reduce(
+        self,
+        document_content: str,
+        subject: str,
+        checkpoint: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Analyze every chunk concurrently (map), then merge the partial analyses (reduce)"""
+        budgeter = self.prompt_budgeter
+        map_overhead = budgeter.count(self._format_prompt(_map_instructions(subject, 999, 999), "", ANALYSIS_SYSTEM_MESSAGE))
+        chunk_tokens = min(
+            self.analysis_chunk_tokens,
+            budgeter.available(ANALYSIS_MAP_MAX_NEW_TOKENS) - map_overhead - 32
+        )
+        
+        fingerprint = hashlib.sha256(f"{chunk_tokens}:{document_content}".encode("utf-8")).hexdigest()
+        completed: Dict[str, Any] = {}
+        if checkpoint and checkpoint.get("fingerprint") == fingerprint:
+            completed = dict(checkpoint.get("completed") or {})
+        elif checkpoint:
+            logger.info("Ignoring analysis checkpoint for a different document or chunk size")
+        
+        chunks = budgeter.split(document_content, chunk_tokens)
+        pending = [index for index in range(len(chunks)) if str(index) not in completed]
+        logger.info(f"Map-reduce analysis: {len(chunks)} chunks, {len(pending)} to analyze, {len(completed)} resumed")
+        
+        # Bound our own fan-out so a long document does not fill the admission queue
+        semaphore = asyncio.Semaphore(self.analysis_parallelism)
+        
+        async def analyze_chunk(index: int):
+            async with semaphore:
+                try:
+                    response = await self._generate_text(
+                        _map_instructions(subject, index + 1, len(chunks)),
+                        context=f"Document section:\n{chunks[index]}",
+                        system_message=ANALYSIS_SYSTEM_MESSAGE,
+                        call_site="analysis",
+                        max_new_tokens=ANALYSIS_MAP_MAX_NEW_TOKENS
+                    )
+                except Exception as e:
+                    logger.error(f"Error analyzing chunk {index}: {str(e)}")
+                    return
+                partial = _parse_json_object(response) if response else None
+                if partial is None and response:
+                    # Keep unstructured output rather than losing the chunk
+                    partial = {"key_concepts": [], "topics": [], "quiz_questions": [], "notes": response}
+                if partial is not None:
+                    completed[str(index)] = partial
+        
+        await asyncio.gather(*(analyze_chunk(index) for index in pending))
+        
+        failed_chunks = [index for index in range(len(chunks)) if str(index) not in completed]
+        merged = _merge_partial_analyses([completed[str(index)] for index in range(len(chunks)) if str(index) in completed])
+        result_checkpoint = {
+            "fingerprint": fingerprint,
+            "chunk_tokens": chunk_tokens,
+            "total_chunks": len(chunks),
+            "completed": completed
+        }
+        
+        if not completed:
+            return {
+                "analysis": "Document analysis failed. Please try again.",
+                "subject": subject,
+                "status": "failed",
+                "mode": "map_reduce",
+                "chunks": len(chunks),
+                "failed_chunks": failed_chunks,
+                "checkpoint": result_checkpoint
+            }
+        
+        reduce_context = (
+            f"Topics: {'; '.join(merged['topics'])}\n"
+            f"Key concepts: {'; '.join(merged['key_concepts'])}\n"
+            f"Quiz questions: {' | '.join(merged['quiz_questions'])}\n"
+            f"Difficulty by section: {', '.join(merged['difficulty_votes']) or 'unknown'}"
+        )
+        try:
+            analysis = await self._generate_text(
+                f"These are partial analyses of the sections of a {subject} document. Combine them into one analysis and provide:\n"
+                f"1. Key topics covered\n"
+                f"2. Difficulty level (beginner/intermediate/advanced)\n"
+                f"3. Main concepts that students should understand\n"
+                f"4. Potential quiz questions",
+                context=reduce_context,
+                system_message=ANALYSIS_SYSTEM_MESSAGE,
+                call_site="analysis"
+            )
+        except Exception as e:
+            logger.error(f"Error reducing document analysis: {str(e)}")
+            analysis = None
+        
+        return {
+            "analysis": analysis or "Document analysis could not be summarized. Partial results are included.",
+            "subject": subject,
+            "status": "completed" if analysis and not failed_chunks else "partial",
+            "mode": "map_reduce",
+            "topics": merged["topics"],
+            "key_concepts": merged["key_concepts"],
+            "quiz_questions": merged["quiz_questions"],
+            "difficulty_level": merged["difficulty_level"],
+            "chunks": len(chunks),
+            "failed_chunks": failed_chunks,
+            "checkpoint": result_checkpoint
+        }
+    
     async def get_model_info(self) -> Dict[str, Any]:
         """Get information about the current model"""
         return {
@@ -253,15 +986,80 @@ class LlamaAIService:
             "api_url": self.api_url,
             "initialized": self.is_initialized,
             "max_new_tokens": self.max_new_tokens,
+            "generation_profiles": {name: profile.to_dict() for name, profile in self.generation_profiles.items()},
             "temperature": self.temperature,
-            "deployment_type": "huggingface_inference_api"
+            "deployment_type": self.backend.name,
+            "cache": self.response_cache.stats() if self.response_cache else {"enabled": False},
+            "single_flight": self.single_flight.stats(),
+            "admission": self.admission.stats(),
+            "prompt_budget": self.prompt_budgeter.stats(),
+            "routing": self.endpoint_pool.stats(),
+            "model_router": self.model_router.stats() if self.model_router else {"enabled": False},
+            "semantic_cache": self.semantic_cache.stats() if self.semantic_cache else {"enabled": False}
+        }
+    
+    def get_resilience_status(self) -> Dict[str, Any]:
+        """Circuit breaker state and retry policies for status reporting"""
+        return {
+            "circuit_breaker": self.circuit_breaker.snapshot(),
+            "retry_policies": {name: policy.to_dict() for name, policy in self.retry_policies.items()}
         }
     
     async def cleanup(self):
         """Clean up resources"""
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
         if self.client:
             await self.client.aclose()
             logger.info("HTTP client closed")
 
+def _map_instructions(subject: str, part: int, total: int) -> str:
+    """Instructions for analyzing one chunk of a longer document"""
+    return (
+        f"This is part {part} of {total} of a {subject} document. Respond with only a JSON object with the keys "
+        f'"topics" (list of strings), "key_concepts" (list of strings), "quiz_questions" (list of strings) '
+        f'and "difficulty_level" (one of "beginner", "intermediate", "advanced").'
+    )
+
+
+def _parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Extract the first JSON object from model output, tolerating surrounding prose"""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        value = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _merge_partial_analyses(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Union the per-chunk lists (case-insensitive, first spelling wins) and vote on difficulty"""
+    merged = {"topics": [], "key_concepts": [], "quiz_questions": []}
+    for key in merged:
+        seen = set()
+        for partial in partials:
+            items = partial.get(key) or []
+            if isinstance(items, str):
+                items = [items]
+            for item in items:
+                if not isinstance(item, str):
+                    continue
+                normalized = " ".join(item.lower().split())
+                if normalized and normalized not in seen:
+                    seen.add(normalized)
+                    merged[key].append(item.strip())
+    
+    votes = [
+        str(partial.get("difficulty_level", "")).lower()
+        for partial in partials
+        if str(partial.get("difficulty_level", "")).lower() in DIFFICULTY_LEVELS
+    ]
+    merged["difficulty_votes"] = votes
+    merged["difficulty_level"] = Counter(votes).most_common(1)[0][0] if votes else None
+    return merged
+
 # Global AI service instance
 ai_service = LlamaAIService()
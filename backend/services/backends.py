@@ -0,0 +1,334 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Optional, Dict, Any, AsyncGenerator, List
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _clean(text: str) -> str:
+    """Remove Llama 3 control tokens that leak into generated text"""
+    return text.replace('<|eot_id|>', '').replace('<|end_of_text|>', '')
+
+
+class InferenceBackend:
+    """
+    Wire protocol of a text-generation server
+
+    LlamaAIService owns the HTTP client, retries and admission control; a backend
+    only knows where to send a prompt and how to read the answer back.
+    """
+
+    name = "base"
+    requires_token = False
+
+    def __init__(self, model_name: str, base_url: str, token: Optional[str] = None):
+        """
+        Args:
+            model_name: Model identifier sent to or implied by the server
+            base_url: Root URL of the server
+            token: Optional bearer token
+        """
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def transport(self) -> Optional[httpx.AsyncBaseTransport]:
+        """Custom transport for the shared client; None means real network I/O"""
+        return None
+
+    def generate_url(self, stream: bool = False) -> str:
+        raise NotImplementedError
+
+    def build_payload(self, prompt: str, parameters: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def parse_generation(self, result: Any) -> Optional[str]:
+        raise NotImplementedError
+
+    def parse_stream_event(self, event: Dict[str, Any]) -> Optional[str]:
+        """Token text carried by one stream event, or None to skip it"""
+        raise NotImplementedError
+
+    async def iter_stream_tokens(self, response: httpx.Response) -> AsyncGenerator[str, None]:
+        """Decode token text from a server-sent event stream"""
+        async for line in response.aiter_lines():
+            # Each event arrives as "data:{json}"; blank lines separate events
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if not data or data == "[DONE]":
+                continue
+
+            try:
+                event = json.loads(data)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed stream event: {data[:100]}")
+                continue
+
+            if "error" in event:
+                logger.error(f"Streaming API returned an error: {event['error']}")
+                return
+
+            text = self.parse_stream_event(event)
+            if text:
+                text = _clean(text)
+                if text:
+                    yield text
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "api_url": self.generate_url()}
+
+
+class TGIBackend(InferenceBackend):
+    """Self-hosted Text Generation Inference server (/generate and /generate_stream)"""
+
+    name = "tgi"
+
+    def generate_url(self, stream: bool = False) -> str:
+        return f"{self.base_url}/generate_stream" if stream else f"{self.base_url}/generate"
+
+    def build_payload(self, prompt: str, parameters: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": parameters["max_new_tokens"],
+                "temperature": parameters["temperature"],
+                "top_p": parameters["top_p"],
+                "repetition_penalty": parameters["repetition_penalty"],
+                "do_sample": True,
+                "return_full_text": False  # Only return new generated text
+            }
+        }
+        if parameters.get("stop"):
+            payload["parameters"]["stop"] = list(parameters["stop"])
+        return payload
+
+    def parse_generation(self, result: Any) -> Optional[str]:
+        if isinstance(result, list) and len(result) > 0:
+            # Standard response format
+            generated_text = result[0].get("generated_text", "")
+        elif isinstance(result, dict):
+            # Alternative response format
+            generated_text = result.get("generated_text", "")
+        else:
+            logger.error(f"Unexpected response format: {result}")
+            return None
+        return _clean(generated_text.strip()).strip()
+
+    def parse_stream_event(self, event: Dict[str, Any]) -> Optional[str]:
+        token = event.get("token") or {}
+        if token.get("special"):
+            return None
+        return token.get("text", "")
+
+
+class HuggingFaceBackend(TGIBackend):
+    """Hugging Face serverless Inference API"""
+
+    name = "huggingface_inference_api"
+    requires_token = True
+
+    def __init__(self, model_name: str, base_url: Optional[str] = None, token: Optional[str] = None):
+        super().__init__(model_name, base_url or f"https://api-inference.huggingface.co/models/{model_name}", token)
+
+    def generate_url(self, stream: bool = False) -> str:
+        # The same URL serves both modes; "stream": true in the body switches to SSE
+        return self.base_url
+
+    def build_payload(self, prompt: str, parameters: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        payload = super().build_payload(prompt, parameters, stream)
+        payload["options"] = {
+            "wait_for_model": True,
+            "use_cache": False
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+
+class OpenAICompatibleBackend(InferenceBackend):
+    """OpenAI-style /v1/completions server such as vLLM or TGI's Messages API"""
+
+    name = "openai_compatible"
+
+    def generate_url(self, stream: bool = False) -> str:
+        return f"{self.base_url}/v1/completions"
+
+    def build_payload(self, prompt: str, parameters: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "max_tokens": parameters["max_new_tokens"],
+            "temperature": parameters["temperature"],
+            "top_p": parameters["top_p"],
+            # vLLM accepts repetition_penalty as an extra sampling parameter
+            "repetition_penalty": parameters["repetition_penalty"],
+            "stream": stream
+        }
+        if parameters.get("stop"):
+            payload["stop"] = list(parameters["stop"])
+        return payload
+
+    def parse_generation(self, result: Any) -> Optional[str]:
+        try:
+            text = result["choices"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            logger.error(f"Unexpected response format: {result}")
+            return None
+        return _clean(text.strip()).strip()
+
+    def parse_stream_event(self, event: Dict[str, Any]) -> Optional[str]:
+        choices = event.get("choices") or []
+        return choices[0].get("text", "") if choices else None
+
+
+class StubBackend(TGIBackend):
+    """
+    In-process stand-in speaking the TGI protocol
+
+    Requests go through the same shared client, retries and admission control as
+    a real backend; only the transport is replaced, so benchmarks exercise the
+    production code path without a model.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        model_name: str,
+        base_url: Optional[str] = None,
+        token: Optional[str] = None,
+        first_token_ms: float = 50.0,
+        token_ms: float = 10.0
+    ):
+        super().__init__(model_name, base_url or "http://stub.local", token)
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+
+    def transport(self) -> Optional[httpx.AsyncBaseTransport]:
+        return httpx.MockTransport(self._handle)
+
+    def _tokens_for(self, payload: Dict[str, Any]):
+        max_new_tokens = payload.get("parameters", {}).get("max_new_tokens", 64)
+        words = ("This is a stub response from the local inference backend. " * 64).split(" ")
+        return [word + " " for word in words[:max_new_tokens] if word]
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content or b"{}")
+        tokens = self._tokens_for(payload)
+        await asyncio.sleep(self.first_token_ms / 1000)
+
+        if request.url.path.endswith("/generate_stream"):
+            async def body():
+                for index, token in enumerate(tokens):
+                    if index:
+                        await asyncio.sleep(self.token_ms / 1000)
+                    event = {"token": {"text": token, "special": False}, "generated_text": None}
+                    yield f"data:{json.dumps(event)}\n\n".encode()
+            return httpx.Response(200, content=body(), headers={"Content-Type": "text/event-stream"})
+
+        await asyncio.sleep(self.token_ms * max(len(tokens) - 1, 0) / 1000)
+        return httpx.Response(200, json=[{"generated_text": "".join(tokens).strip()}])
+
+
+BACKENDS = {
+    "huggingface": HuggingFaceBackend,
+    "tgi": TGIBackend,
+    "openai": OpenAICompatibleBackend,
+    "stub": StubBackend,
+}
+
+
+def create_backend(model_name: str, kind: Optional[str] = None, base_url: Optional[str] = None,
+                   token: Optional[str] = None, url_prefix: str = "LLAMA_BACKEND") -> InferenceBackend:
+    """
+    Build the backend selected by LLAMA_BACKEND (huggingface, tgi, openai or stub)
+
+    Args:
+        model_name: Model identifier
+        kind: Backend name; defaults to LLAMA_BACKEND or "huggingface"
+        base_url: Server root URL; defaults to <url_prefix>_URL
+        token: Bearer token; defaults to HUGGINGFACE_TOKEN for Hugging Face, LLAMA_BACKEND_TOKEN otherwise
+        url_prefix: Environment prefix for the server URL, e.g. LLAMA_SMALL_BACKEND for the routed small model
+    """
+    kind = (kind or os.getenv("LLAMA_BACKEND", "huggingface")).lower()
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{kind}', expected one of {sorted(BACKENDS)}")
+    base_url = base_url or os.getenv(f"{url_prefix}_URL")
+    if token is None:
+        token = os.getenv("HUGGINGFACE_TOKEN") if kind == "huggingface" else os.getenv("LLAMA_BACKEND_TOKEN")
+
+    if kind == "stub":
+        return StubBackend(
+            model_name,
+            base_url,
+            token,
+            first_token_ms=float(os.getenv("LLAMA_STUB_FIRST_TOKEN_MS", "50")),
+            token_ms=float(os.getenv("LLAMA_STUB_TOKEN_MS", "10"))
+        )
+    if kind == "huggingface":
+        return HuggingFaceBackend(model_name, base_url, token)
+    if not base_url:
+        raise ValueError(f"{url_prefix}_URL is required for the '{kind}' backend")
+    return BACKENDS[kind](model_name, base_url, token)
+
+
+def create_backends(model_name: str, kind: Optional[str] = None, token: Optional[str] = None,
+                    url_prefix: str = "LLAMA_BACKEND") -> List[InferenceBackend]:
+    """
+    One backend per equivalent endpoint in <url_prefix>_URLS (comma separated)
+
+    Falls back to the single endpoint from create_backend when the list is not set.
+    """
+    urls = [url.strip() for url in os.getenv(f"{url_prefix}_URLS", "").split(",") if url.strip()]
+    if not urls:
+        return [create_backend(model_name, kind, token=token, url_prefix=url_prefix)]
+    return [create_backend(model_name, kind, base_url=url, token=token, url_prefix=url_prefix) for url in urls]
+
+
+def create_http_client(backend: InferenceBackend) -> httpx.AsyncClient:
+    """
+    Shared client with explicit keep-alive pool limits and split timeouts
+
+    Tuned via LLAMA_HTTP_MAX_CONNECTIONS, LLAMA_HTTP_MAX_KEEPALIVE,
+    LLAMA_HTTP_KEEPALIVE_EXPIRY, LLAMA_HTTP_CONNECT_TIMEOUT, LLAMA_HTTP_READ_TIMEOUT
+    and LLAMA_HTTP2.
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLAMA_HTTP_MAX_CONNECTIONS", "32")),
+        max_keepalive_connections=int(os.getenv("LLAMA_HTTP_MAX_KEEPALIVE", "16")),
+        keepalive_expiry=float(os.getenv("LLAMA_HTTP_KEEPALIVE_EXPIRY", "30"))
+    )
+    # Fail fast on unreachable hosts, but give generation time to finish
+    timeout = httpx.Timeout(
+        connect=float(os.getenv("LLAMA_HTTP_CONNECT_TIMEOUT", "5")),
+        read=float(os.getenv("LLAMA_HTTP_READ_TIMEOUT", "120")),
+        write=10.0,
+        pool=float(os.getenv("LLAMA_HTTP_POOL_TIMEOUT", "10"))
+    )
+
+    http2 = os.getenv("LLAMA_HTTP2", "false").lower() in ("1", "true", "yes")
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("LLAMA_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        headers=backend.headers(),
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+        transport=backend.transport()
+    )
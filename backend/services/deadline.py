@@ -0,0 +1,105 @@
+import time
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's time budget runs out before its answer is ready"""
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away while its answer was being generated"""
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request must be answered
+
+    Created once at the endpoint from a time budget and passed down unchanged,
+    so every layer sees the time that is actually left rather than a fresh
+    timeout of its own.
+    """
+
+    def __init__(self, budget: float):
+        """
+        Args:
+            budget: Seconds from now until the deadline
+        """
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def coerce(cls, value: Union["Deadline", float, None]) -> Optional["Deadline"]:
+        """Accept a Deadline, a budget in seconds, or None (no deadline)"""
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(float(value))
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    async def run(self, awaitable: Awaitable[Any]) -> Any:
+        """
+        Await within the remaining budget
+
+        On expiry the awaitable is cancelled, which closes any in-flight HTTP
+        request and releases admission slots held below it.
+        """
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"No answer within the {self.budget:g}s time budget")
+
+    async def iterate(self, stream: AsyncGenerator[Any, None]) -> AsyncIterator[Any]:
+        """Yield from an async generator until the budget runs out, then close it"""
+        try:
+            while True:
+                try:
+                    item = await self.run(stream.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            await stream.aclose()
+
+
+async def run_until_disconnected(
+    awaitable: Awaitable[Any],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: float = 0.5
+) -> Any:
+    """
+    Await a result, cancelling it as soon as the client disconnects
+
+    Args:
+        awaitable: Work producing the response
+        is_disconnected: Coroutine function reporting whether the client has gone,
+            e.g. starlette's Request.is_disconnected
+        poll_interval: Seconds between disconnect checks
+
+    Raises:
+        ClientDisconnected: The client went away; the work has been cancelled
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                logger.info("Client disconnected, cancelling generation")
+                raise ClientDisconnected("Client disconnected before the answer was ready")
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
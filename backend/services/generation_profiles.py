@@ -0,0 +1,106 @@
+import os
+import logging
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# End of the assistant turn, and the start of a turn the model should not write for the student
+DEFAULT_STOP_SEQUENCES = ("<|eot_id|>", "<|end_of_text|>", "\nStudent:", "\nUser:")
+
+# Message types, matching Message.message_type
+GENERAL = "general"
+EXPLANATION = "explanation"
+PROBLEM_SOLVING = "problem_solving"
+QUIZ = "quiz"
+
+
+@dataclass
+class GenerationProfile:
+    """Output budget and stop sequences for one kind of tutor message"""
+
+    name: str
+    max_new_tokens: int
+    temperature: Optional[float] = None  # None keeps the service default
+    stop: Tuple[str, ...] = field(default_factory=lambda: DEFAULT_STOP_SEQUENCES)
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "GenerationProfile":
+        """Build a profile, letting LLAMA_PROFILE_<NAME>_MAX_TOKENS and _TEMPERATURE override the defaults"""
+        prefix = f"LLAMA_PROFILE_{name.upper()}_"
+        profile = cls(name=name, **defaults)
+        profile.max_new_tokens = int(os.getenv(f"{prefix}MAX_TOKENS", profile.max_new_tokens))
+        temperature = os.getenv(f"{prefix}TEMPERATURE")
+        if temperature:
+            profile.temperature = float(temperature)
+        return profile
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_new_tokens": self.max_new_tokens,
+            "temperature": self.temperature,
+            "stop": list(self.stop),
+        }
+
+
+def default_profiles() -> Dict[str, GenerationProfile]:
+    """Profiles per message type; quick answers get short budgets so they are not billed worst-case latency"""
+    return {
+        GENERAL: GenerationProfile.from_env(GENERAL, max_new_tokens=256),
+        EXPLANATION: GenerationProfile.from_env(EXPLANATION, max_new_tokens=640),
+        PROBLEM_SOLVING: GenerationProfile.from_env(PROBLEM_SOLVING, max_new_tokens=768, temperature=0.3),
+        QUIZ: GenerationProfile.from_env(QUIZ, max_new_tokens=448),
+    }
+
+
+def truncate_at_stop(text: str, stop: Iterable[str]) -> str:
+    """Text up to the first stop sequence"""
+    cut = min((index for index in (text.find(sequence) for sequence in stop if sequence) if index >= 0), default=-1)
+    return text[:cut] if cut >= 0 else text
+
+
+class StopSequenceFilter:
+    """
+    Cut a token stream at the first stop sequence
+
+    A stop sequence can arrive split across several tokens, so text that could
+    still be the start of one is held back until the next token settles it.
+    Only that ambiguous suffix is delayed; everything else is passed through
+    as soon as it arrives.
+    """
+
+    def __init__(self, stop: Iterable[str]):
+        self.stop = tuple(sequence for sequence in stop if sequence)
+        self.stopped = False
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        """Text that is safe to emit; sets stopped once a stop sequence is found"""
+        if self.stopped:
+            return ""
+        self._pending += text
+        truncated = truncate_at_stop(self._pending, self.stop)
+        if len(truncated) < len(self._pending):
+            self.stopped = True
+            self._pending = ""
+            return truncated
+
+        held = self._held_suffix()
+        ready = self._pending[:len(self._pending) - held]
+        self._pending = self._pending[len(ready):]
+        return ready
+
+    def flush(self) -> str:
+        """Held-back text once the stream has ended without a stop sequence"""
+        text, self._pending = self._pending, ""
+        return "" if self.stopped else text
+
+    def _held_suffix(self) -> int:
+        """Length of the longest suffix of the pending text that begins a stop sequence"""
+        longest = 0
+        for sequence in self.stop:
+            for size in range(min(len(sequence) - 1, len(self._pending)), longest, -1):
+                if self._pending.endswith(sequence[:size]):
+                    longest = size
+                    break
+        return longest
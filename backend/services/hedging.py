@@ -0,0 +1,272 @@
+import os
+import time
+import bisect
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Sequence
+
+import httpx
+
+from .admission import AdmissionController, INTERACTIVE
+from .backends import InferenceBackend
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, roughly log-spaced from 50 ms to 2 minutes
+LATENCY_BUCKETS = (
+    0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5,
+    10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with interpolated quantiles"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated q-quantile in seconds, or None without samples"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 4) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class RequestTrace:
+    """
+    Connect and time-to-first-byte timings from httpcore's "trace" request extension
+
+    Transports that do not emit trace events (such as httpx.MockTransport) leave
+    both timings as None.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._connect_started = None
+        self.connect_seconds: Optional[float] = None
+        self.ttfb_seconds: Optional[float] = None
+
+    async def hook(self, event_name: str, info: Dict[str, Any]):
+        now = time.monotonic()
+        if event_name == "connection.connect_tcp.started":
+            self._connect_started = now
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            # TLS completes after TCP, so the last event wins
+            if self._connect_started is not None:
+                self.connect_seconds = now - self._connect_started
+        elif event_name.endswith("receive_response_headers.complete") and self.ttfb_seconds is None:
+            self.ttfb_seconds = now - self.started
+
+    def extensions(self) -> Dict[str, Any]:
+        return {"trace": self.hook}
+
+
+class Endpoint:
+    """One inference server and its load and latency statistics"""
+
+    def __init__(self, backend: InferenceBackend):
+        self.backend = backend
+        self.outstanding = 0
+        self.latency = LatencyHistogram()
+        self.errors = 0
+
+    @property
+    def url(self) -> str:
+        return self.backend.generate_url()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "errors": self.errors,
+            "latency_seconds": self.latency.snapshot(),
+        }
+
+
+class EndpointPool:
+    """
+    Equivalent inference endpoints with least-outstanding selection and hedging
+
+    A request goes to the endpoint with the fewest requests in flight. If it has
+    not answered within the primary endpoint's observed latency percentile, a
+    duplicate goes to the next endpoint; the first good answer wins and the other
+    request is cancelled. Hedges are capped to a fraction of requests so an
+    overloaded fleet is not hit with twice the traffic, and each one takes its
+    own admission slot, so a hedge is only sent while the concurrency cap has
+    room for it.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        hedge_percentile: float = 0.95,
+        min_samples: int = 20,
+        default_hedge_delay: float = 3.0,
+        min_hedge_delay: float = 0.05,
+        max_hedge_ratio: float = 0.1
+    ):
+        """
+        Args:
+            endpoints: Equivalent servers, first one preferred on ties
+            hedge_percentile: Latency percentile after which a hedge is sent
+            min_samples: Samples needed before the percentile is trusted
+            default_hedge_delay: Hedge delay in seconds until then
+            min_hedge_delay: Lower bound on the hedge delay
+            max_hedge_ratio: Maximum fraction of requests that may be hedged
+        """
+        self.endpoints = endpoints
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.hedges_skipped = 0
+
+    @classmethod
+    def from_env(cls, endpoints: List[Endpoint]) -> "EndpointPool":
+        return cls(
+            endpoints,
+            hedge_percentile=float(os.getenv("LLAMA_HEDGE_PERCENTILE", "0.95")),
+            default_hedge_delay=float(os.getenv("LLAMA_HEDGE_DEFAULT_DELAY", "3.0")),
+            max_hedge_ratio=float(os.getenv("LLAMA_HEDGE_MAX_RATIO", "0.1"))
+        )
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def pick(self, exclude: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        """Endpoint with the fewest outstanding requests, ties broken by median latency"""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint is not exclude]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda endpoint: (endpoint.outstanding, endpoint.latency.quantile(0.5) or 0.0)
+        )
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        if endpoint.latency.count < self.min_samples:
+            return self.default_hedge_delay
+        return max(endpoint.latency.quantile(self.hedge_percentile), self.min_hedge_delay)
+
+    def _hedge_allowed(self) -> bool:
+        return len(self.endpoints) > 1 and self.hedges_sent < self.max_hedge_ratio * self.requests
+
+    async def _post(self, client: httpx.AsyncClient, endpoint: Endpoint, payload: Dict[str, Any]) -> httpx.Response:
+        endpoint.outstanding += 1
+        started = time.monotonic()
+        trace = RequestTrace()
+        try:
+            response = await client.post(endpoint.url, json=payload, extensions=trace.extensions())
+        except Exception:
+            endpoint.errors += 1
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        if response.status_code == 200:
+            endpoint.latency.record(time.monotonic() - started)
+        else:
+            endpoint.errors += 1
+        # The winning request's timings travel with its response
+        response.extensions["request_trace"] = trace
+        return response
+
+    async def post(
+        self,
+        client: httpx.AsyncClient,
+        payload: Dict[str, Any],
+        hedge: bool = True,
+        admission: Optional[AdmissionController] = None,
+        priority: str = INTERACTIVE
+    ) -> httpx.Response:
+        """
+        POST a generation request, hedging to a second endpoint when the first is slow
+
+        The caller already holds an admission slot for the first request; a
+        hedge takes another one from admission, and is skipped if none is free.
+        """
+        self.requests += 1
+        primary = self.pick()
+        first = asyncio.ensure_future(self._post(client, primary, payload))
+        if not hedge or not self._hedge_allowed():
+            return await first
+
+        delay = self.hedge_delay(primary)
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+
+        if admission and not admission.try_acquire(priority):
+            # Every slot is busy: a duplicate would only add load
+            self.hedges_skipped += 1
+            return await first
+
+        secondary = self.pick(exclude=primary)
+        self.hedges_sent += 1
+        logger.info(f"Hedging request to {secondary.url} after {delay:.2f}s without an answer from {primary.url}")
+        second = asyncio.ensure_future(self._post(client, secondary, payload))
+        if admission:
+            # Runs however the hedge ends, even if it is cancelled before it starts
+            second.add_done_callback(lambda _: admission.release())
+
+        pending = {first, second}
+        fallback = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code == 200:
+                        if task is second:
+                            self.hedges_won += 1
+                        return task.result()
+                    fallback = fallback or task
+            # Neither endpoint produced a good answer: surface the first failure
+            return fallback.result()
+        finally:
+            # The losing request is cancelled, which closes its connection upstream
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+            "hedge_percentile": self.hedge_percentile,
+            "max_hedge_ratio": self.max_hedge_ratio,
+            "requests": self.requests,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "hedges_skipped": self.hedges_skipped,
+        }
@@ -0,0 +1,190 @@
+import math
+import threading
+from typing import Optional, Dict, List, Sequence, Tuple
+
+from .hedging import LatencyHistogram, LATENCY_BUCKETS
+from .prompt_budget import CHARS_PER_TOKEN
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+CONNECT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250)
+
+LLM_LABELS = ("call_site", "model")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Token count estimate for callers without access to the model tokenizer"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class HistogramFamily:
+    """Labeled Prometheus histogram built on LatencyHistogram buckets"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], label_names: Sequence[str] = LLM_LABELS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], LatencyHistogram] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = LatencyHistogram(self.buckets)
+        series.record(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series.counts):
+                cumulative += count
+                le = _labels(self.label_names, labels, ("le", _number(float(bound))))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(float(series.total))}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series.count}")
+        return lines
+
+
+class CounterFamily:
+    """Labeled Prometheus counter"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class LLMMetrics:
+    """
+    Per-call LLM latency and throughput metrics, labeled by call site and model
+
+    One registry is shared by everything in the process (simple_main's Llama
+    service and app.main's OpenAI services alike) and rendered on /metrics in
+    the Prometheus text format. Observations that a caller cannot measure (for
+    example connect time on a reused keep-alive connection) are simply skipped.
+    """
+
+    def __init__(self, prefix: str = "stementor_llm"):
+        self._lock = threading.Lock()
+        self.calls = CounterFamily(
+            f"{prefix}_calls_total", "Upstream LLM calls by outcome", LLM_LABELS + ("outcome",)
+        )
+        self.queue_wait = HistogramFamily(
+            f"{prefix}_queue_wait_seconds", "Time waiting for an inference slot before the call", QUEUE_WAIT_BUCKETS
+        )
+        self.connect = HistogramFamily(
+            f"{prefix}_connect_seconds", "TCP and TLS connect time for calls that opened a new connection", CONNECT_BUCKETS
+        )
+        self.time_to_first_byte = HistogramFamily(
+            f"{prefix}_time_to_first_byte_seconds", "Time from sending the request to the first response byte or token",
+            LATENCY_BUCKETS
+        )
+        self.duration = HistogramFamily(
+            f"{prefix}_request_duration_seconds", "Total upstream call latency", LATENCY_BUCKETS
+        )
+        self.prompt_tokens = HistogramFamily(
+            f"{prefix}_prompt_tokens", "Prompt tokens per call", TOKEN_BUCKETS
+        )
+        self.completion_tokens = HistogramFamily(
+            f"{prefix}_completion_tokens", "Generated tokens per call", TOKEN_BUCKETS
+        )
+        self.tokens_per_second = HistogramFamily(
+            f"{prefix}_tokens_per_second", "Generation throughput after the first byte", TOKENS_PER_SECOND_BUCKETS
+        )
+        self._families = (
+            self.calls, self.queue_wait, self.connect, self.time_to_first_byte, self.duration,
+            self.prompt_tokens, self.completion_tokens, self.tokens_per_second,
+        )
+
+    def observe_call(
+        self,
+        call_site: str,
+        model: str,
+        outcome: str = "success",
+        queue_wait: Optional[float] = None,
+        connect: Optional[float] = None,
+        ttfb: Optional[float] = None,
+        duration: Optional[float] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None
+    ):
+        """
+        Record one upstream call
+
+        Args:
+            call_site: Caller such as "chat", "analysis" or "warmup"
+            model: Model identifier
+            outcome: "success", "http_<status>", "transport_error", "rejected", ...
+            queue_wait: Seconds spent waiting for admission
+            connect: Seconds spent opening a connection, None when one was reused
+            ttfb: Seconds until the response headers (or the first streamed token)
+            duration: Seconds from sending the request to the last byte
+            prompt_tokens: Prompt length in tokens
+            completion_tokens: Generated tokens; only recorded for successful calls
+        """
+        labels = (call_site, model)
+        with self._lock:
+            self.calls.inc(labels + (outcome,))
+            if queue_wait is not None:
+                self.queue_wait.observe(labels, queue_wait)
+            if connect is not None:
+                self.connect.observe(labels, connect)
+            if ttfb is not None:
+                self.time_to_first_byte.observe(labels, ttfb)
+            if duration is not None:
+                self.duration.observe(labels, duration)
+            if prompt_tokens is not None:
+                self.prompt_tokens.observe(labels, prompt_tokens)
+            if outcome != "success" or completion_tokens is None:
+                return
+            self.completion_tokens.observe(labels, completion_tokens)
+            # Throughput is measured over the decode phase, so queueing and prefill do not dilute it
+            generation = (duration or 0.0) - (ttfb or 0.0)
+            if completion_tokens and generation <= 0:
+                generation = duration or 0.0
+            if completion_tokens and generation > 0:
+                self.tokens_per_second.observe(labels, completion_tokens / generation)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            for family in self._families:
+                lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry
+llm_metrics = LLMMetrics()
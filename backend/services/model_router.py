@@ -0,0 +1,175 @@
+import os
+import re
+import math
+import logging
+from typing import Optional, Dict, Any, List, Tuple
+
+from .hedging import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+SMALL = "small"
+LARGE = "large"
+
+_WORD = re.compile(r"[a-z0-9']+")
+_GREETING = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening)|bye|ok(ay)?|cool|great)\b[\s!.,?]*"
+    r"(there|so much|a lot)?[\s!.,?]*$",
+    re.IGNORECASE
+)
+_DEFINITIONAL = re.compile(
+    r"^\s*(what('s| is| are| does)|define|definition of|meaning of|who (is|was)|what do you mean by)\b",
+    re.IGNORECASE
+)
+_MATH = re.compile(r"[=^√∫∑π]|\d\s*[-+*/]\s*\d|\\[a-z]+|\b(sin|cos|tan|log|ln|lim|dx|dy)\b")
+
+# Words that signal multi-step reasoning rather than recall
+_REASONING_WORDS = frozenset("""
+prove proof derive derivation solve calculate compute evaluate integrate differentiate
+simplify factor optimize compare contrast analyze analyse why justify show steps step
+explain how design implement debug algorithm complexity estimate approximate
+""".split())
+
+# Weights of the feature model; positive pushes toward the large model
+_WEIGHTS = {
+    "bias": -1.6,
+    "log_words": 0.55,
+    "reasoning_words": 0.9,
+    "math_tokens": 0.6,
+    "digits": 0.08,
+    "sentences": 0.35,
+    "newlines": 0.4,
+    "definitional": -1.2,
+    "code": 1.2,
+}
+
+# message_type hints from the client shift the score
+_MESSAGE_TYPE_BIAS = {
+    "problem_solving": 2.0,
+    "explanation": 0.6,
+    "quiz": 0.4,
+    "general": 0.0,
+}
+
+
+class RouteDecision:
+    """Which model a message goes to, and why"""
+
+    def __init__(self, route: str, model: str, score: float, reason: str):
+        self.route = route
+        self.model = model
+        self.score = score
+        self.reason = reason
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"route": self.route, "model": self.model, "score": round(self.score, 3), "reason": self.reason}
+
+
+class ComplexityClassifier:
+    """
+    Local query complexity score in [0, 1]: rules first, then a small logistic feature model
+
+    Greetings and thanks always score 0. Everything else is scored from
+    length, reasoning verbs, math notation, code and definitional phrasing,
+    without any network call; scoring takes microseconds.
+    """
+
+    def features(self, message: str) -> Dict[str, float]:
+        text = message.lower()
+        words = _WORD.findall(text)
+        return {
+            "bias": 1.0,
+            "log_words": math.log1p(len(words)),
+            "reasoning_words": float(sum(1 for word in words if word in _REASONING_WORDS)),
+            "math_tokens": float(min(len(_MATH.findall(message)), 5)),
+            "digits": float(min(sum(char.isdigit() for char in message), 20)),
+            "sentences": float(max(len(re.findall(r"[.!?](\s|$)", message)) - 1, 0)),
+            "newlines": float(min(message.count("\n"), 5)),
+            "definitional": 1.0 if _DEFINITIONAL.match(message) else 0.0,
+            "code": 1.0 if "```" in message or re.search(r"\b(def|return|for|while)\b.*[:(]", message) else 0.0,
+        }
+
+    def score(self, message: str, message_type: Optional[str] = None) -> Tuple[float, str]:
+        """Complexity score and the rule or feature that decided it"""
+        if _GREETING.match(message):
+            return 0.0, "greeting"
+        features = self.features(message)
+        logit = sum(_WEIGHTS[name] * value for name, value in features.items())
+        logit += _MESSAGE_TYPE_BIAS.get(message_type or "general", 0.0)
+        score = 1.0 / (1.0 + math.exp(-logit))
+
+        # Name the strongest contributor for the decision log
+        contributions = {name: _WEIGHTS[name] * value for name, value in features.items() if name != "bias"}
+        if message_type in ("problem_solving",):
+            contributions[f"message_type:{message_type}"] = _MESSAGE_TYPE_BIAS[message_type]
+        reason = max(contributions, key=lambda name: abs(contributions[name])) if contributions else "length"
+        return score, reason
+
+
+class ModelRouter:
+    """
+    Send simple chat messages to a smaller, faster model
+
+    Messages scoring below the threshold go to the small model; the rest keep
+    the large one. Decisions and end-to-end latency are recorded per route so
+    the savings can be checked against the AI status endpoint.
+    """
+
+    def __init__(
+        self,
+        large_model: str,
+        small_model: str,
+        threshold: float = 0.4,
+        classifier: Optional[ComplexityClassifier] = None,
+        max_recent: int = 50
+    ):
+        """
+        Args:
+            large_model: Model for complex messages (the service's main model)
+            small_model: Cheaper model for greetings and simple lookups
+            threshold: Scores below this go to the small model
+            classifier: Complexity classifier; defaults to ComplexityClassifier
+            max_recent: Recent decisions kept for inspection
+        """
+        self.models = {LARGE: large_model, SMALL: small_model}
+        self.threshold = threshold
+        self.classifier = classifier or ComplexityClassifier()
+        self.max_recent = max_recent
+        self.decisions = {SMALL: 0, LARGE: 0}
+        self.latency = {SMALL: LatencyHistogram(), LARGE: LatencyHistogram()}
+        self._recent: List[Dict[str, Any]] = []
+
+    @classmethod
+    def from_env(cls, large_model: str) -> Optional["ModelRouter"]:
+        """Router from LLAMA_SMALL_MODEL and LLAMA_ROUTER_THRESHOLD; None when no small model is configured"""
+        small_model = os.getenv("LLAMA_SMALL_MODEL")
+        if not small_model or os.getenv("LLAMA_ROUTER_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            large_model,
+            small_model,
+            threshold=float(os.getenv("LLAMA_ROUTER_THRESHOLD", "0.4"))
+        )
+
+    def route(self, message: str, message_type: Optional[str] = None) -> RouteDecision:
+        score, reason = self.classifier.score(message, message_type)
+        route = SMALL if score < self.threshold else LARGE
+        decision = RouteDecision(route, self.models[route], score, reason)
+        self.decisions[route] += 1
+        self._recent.append({**decision.to_dict(), "message_type": message_type, "chars": len(message)})
+        del self._recent[:-self.max_recent]
+        logger.info(f"Routing to {route} model ({decision.model}), complexity {score:.2f} ({reason})")
+        return decision
+
+    def record_latency(self, decision: RouteDecision, seconds: float):
+        self.latency[decision.route].record(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "models": dict(self.models),
+            "threshold": self.threshold,
+            "decisions": dict(self.decisions),
+            "latency_seconds": {route: histogram.snapshot() for route, histogram in self.latency.items()},
+            "recent": list(reversed(self._recent)),
+        }
@@ -0,0 +1,210 @@
+import os
+import re
+import math
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for Llama 3 on English/STEM text, used until the
+# real tokenizer is loaded (or if it cannot be). Deliberately low so estimates
+# err on the side of over-counting.
+CHARS_PER_TOKEN = 3.5
+
+# Sentence ends followed by whitespace, or line breaks
+_SENTENCE_BOUNDARY = re.compile(r"[.!?](?=\s)|\n")
+
+# Tokenizers are loaded once per process and shared between budgeters
+_TOKENIZER_CACHE: Dict[str, Any] = {}
+
+
+class PromptFit:
+    """Result of fitting a prompt into the model window"""
+
+    def __init__(self, prompt: str, prompt_tokens: int, dropped_tokens: int):
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens
+        self.dropped_tokens = dropped_tokens
+
+
+class PromptBudgeter:
+    """Count tokens with the model's tokenizer and trim text to a token budget"""
+
+    def __init__(
+        self,
+        tokenizer_name: str,
+        context_window: int = 8192,
+        safety_margin: int = 16,
+        auth_token: Optional[str] = None
+    ):
+        """
+        Args:
+            tokenizer_name: Hugging Face repo whose tokenizer.json to load
+            context_window: Model context length in tokens
+            safety_margin: Tokens kept free to absorb special tokens and estimate error
+            auth_token: Token for gated tokenizer repos
+        """
+        self.tokenizer_name = tokenizer_name
+        self.context_window = context_window
+        self.safety_margin = safety_margin
+        self.auth_token = auth_token
+        self.trimmed_prompts = 0
+        self.dropped_tokens = 0
+        self._load_failed = False
+
+    @classmethod
+    def from_env(cls, model_name: str, auth_token: Optional[str] = None) -> "PromptBudgeter":
+        """Build a budgeter from LLAMA_TOKENIZER and LLAMA_CONTEXT_WINDOW"""
+        return cls(
+            tokenizer_name=os.getenv("LLAMA_TOKENIZER", model_name),
+            context_window=int(os.getenv("LLAMA_CONTEXT_WINDOW", "8192")),
+            auth_token=auth_token
+        )
+
+    @property
+    def tokenizer(self):
+        return _TOKENIZER_CACHE.get(self.tokenizer_name)
+
+    def _load(self):
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            logger.warning("The 'tokenizers' package is not installed; estimating token counts from text length")
+            return None
+        try:
+            return Tokenizer.from_pretrained(self.tokenizer_name, token=self.auth_token)
+        except TypeError:
+            # tokenizers < 0.15 names the argument auth_token
+            return Tokenizer.from_pretrained(self.tokenizer_name, auth_token=self.auth_token)
+
+    async def load(self) -> bool:
+        """Download and cache the tokenizer off the event loop; safe to call repeatedly"""
+        if self.tokenizer is not None:
+            return True
+        if self._load_failed or os.getenv("LLAMA_TOKENIZER_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return False
+        try:
+            tokenizer = await asyncio.to_thread(self._load)
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {self.tokenizer_name}, estimating token counts: {str(e)}")
+            tokenizer = None
+        if tokenizer is None:
+            self._load_failed = True
+            return False
+        _TOKENIZER_CACHE[self.tokenizer_name] = tokenizer
+        logger.info(f"Loaded tokenizer {self.tokenizer_name}")
+        return True
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text"""
+        if not text:
+            return 0
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def available(self, max_new_tokens: int) -> int:
+        """Prompt tokens that fit alongside max_new_tokens of output"""
+        return self.context_window - max_new_tokens - self.safety_margin
+
+    def fit(self, text: str, max_tokens: int, keep: str = "head") -> Tuple[str, int]:
+        """
+        Trim text to at most max_tokens, cutting at sentence boundaries
+
+        Args:
+            text: Text to trim
+            max_tokens: Token budget for the text
+            keep: "head" keeps the beginning (documents), "tail" keeps the end (history)
+
+        Returns:
+            The trimmed text and the number of tokens dropped
+        """
+        total = self.count(text)
+        if total <= max_tokens:
+            return text, 0
+        if max_tokens <= 0:
+            return "", total
+
+        def piece(size: int) -> str:
+            return text[len(text) - size:] if keep == "tail" else text[:size]
+
+        # Candidate sizes of the kept piece, ascending
+        boundaries = [m.end() for m in _SENTENCE_BOUNDARY.finditer(text)]
+        cuts = sorted(len(text) - b for b in boundaries) if keep == "tail" else boundaries
+
+        best = self._largest_cut(piece, cuts, max_tokens)
+
+        if best is not None:
+            kept = piece(best).strip()
+        else:
+            # A single sentence is larger than the budget: cut inside it
+            kept = self._truncate_tokens(text, max_tokens, keep)
+
+        return kept, total - self.count(kept)
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """
+        Split text into consecutive chunks of at most max_tokens, cutting at sentence boundaries
+
+        Only a bounded window ahead of each cut is tokenized, so splitting stays
+        linear in document length.
+        """
+        chunks = []
+        rest = text.strip()
+        # Generous upper bound on characters per token, so a window holds at least max_tokens
+        window_chars = max_tokens * 8
+        while rest:
+            window = rest[:window_chars]
+            if len(window) == len(rest) and self.count(window) <= max_tokens:
+                chunks.append(window)
+                break
+
+            boundaries = [m.end() for m in _SENTENCE_BOUNDARY.finditer(window)]
+            best = self._largest_cut(lambda size: window[:size], boundaries, max_tokens)
+            chunk = window[:best] if best else self._truncate_tokens(window, max_tokens, "head")
+            if not chunk.strip():
+                chunk = window[:max(int(max_tokens * CHARS_PER_TOKEN), 1)]
+            chunks.append(chunk.strip())
+            rest = rest[len(chunk):].lstrip()
+        return [chunk for chunk in chunks if chunk]
+
+    def _largest_cut(self, piece, cuts: List[int], max_tokens: int) -> Optional[int]:
+        """Largest cut whose piece fits in max_tokens; token count grows with the cut"""
+        best = None
+        low, high = 0, len(cuts) - 1
+        while low <= high:
+            mid = (low + high) // 2
+            if self.count(piece(cuts[mid])) <= max_tokens:
+                best = cuts[mid]
+                low = mid + 1
+            else:
+                high = mid - 1
+        return best
+
+    def _truncate_tokens(self, text: str, max_tokens: int, keep: str) -> str:
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            size = int(max_tokens * CHARS_PER_TOKEN)
+            return text[-size:] if keep == "tail" else text[:size]
+        offsets: List[Tuple[int, int]] = tokenizer.encode(text, add_special_tokens=False).offsets
+        if len(offsets) <= max_tokens:
+            # split() passes whole windows without a sentence boundary; one may already fit
+            return text
+        if keep == "tail":
+            return text[offsets[-max_tokens][0]:]
+        return text[:offsets[max_tokens - 1][1]]
+
+    def record(self, dropped_tokens: int):
+        if dropped_tokens:
+            self.trimmed_prompts += 1
+            self.dropped_tokens += dropped_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokenizer": self.tokenizer_name if self.tokenizer is not None else "estimate",
+            "context_window": self.context_window,
+            "trimmed_prompts": self.trimmed_prompts,
+            "dropped_tokens": self.dropped_tokens,
+        }
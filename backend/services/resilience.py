@@ -0,0 +1,189 @@
+import os
+import time
+import random
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, FrozenSet
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetryPolicy:
+    """Bounded retry with exponential backoff and full jitter"""
+
+    max_attempts: int = 3
+    base_delay: float = 1.0  # seconds before the first retry
+    max_delay: float = 30.0  # cap for any single backoff
+    multiplier: float = 2.0
+    retry_on_status: FrozenSet[int] = field(default_factory=lambda: frozenset({429, 502, 503, 504}))
+    respect_retry_after: bool = True
+
+    @classmethod
+    def from_env(cls, call_site: str, **defaults) -> "RetryPolicy":
+        """
+        Build a policy for a call site, letting environment variables override the defaults
+
+        Reads LLAMA_<CALL_SITE>_MAX_ATTEMPTS, _BASE_DELAY and _MAX_DELAY.
+        """
+        prefix = f"LLAMA_{call_site.upper()}_"
+        policy = cls(**defaults)
+        policy.max_attempts = int(os.getenv(f"{prefix}MAX_ATTEMPTS", policy.max_attempts))
+        policy.base_delay = float(os.getenv(f"{prefix}BASE_DELAY", policy.base_delay))
+        policy.max_delay = float(os.getenv(f"{prefix}MAX_DELAY", policy.max_delay))
+        return policy
+
+    def should_retry(self, attempt: int, status_code: Optional[int] = None) -> bool:
+        """Whether another attempt is allowed after `attempt` (1-based) failed"""
+        if attempt >= self.max_attempts:
+            return False
+        # Transport errors have no status code and are always retryable
+        return status_code is None or status_code in self.retry_on_status
+
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before the next attempt; a server Retry-After hint wins but is still capped"""
+        if self.respect_retry_after and retry_after is not None:
+            return min(max(retry_after, 0.0), self.max_delay)
+        backoff = min(self.base_delay * (self.multiplier ** (attempt - 1)), self.max_delay)
+        return random.uniform(0, backoff)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            "multiplier": self.multiplier,
+            "retry_on_status": sorted(self.retry_on_status),
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the inference backend is down
+
+    closed    -> calls flow; consecutive failures are counted
+    open      -> calls are rejected until recovery_timeout has elapsed
+    half_open -> a single trial call decides whether to close or re-open;
+                 a trial that ends without an outcome (cancelled) is released,
+                 and one still out after trial_timeout is given up on
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, trial_timeout: float = 60.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that trip the breaker
+            recovery_timeout: Seconds to stay open before allowing a trial call
+            trial_timeout: Seconds after which a half-open trial still in flight no longer blocks a new one
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.trial_timeout = trial_timeout
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._trial_started_at: Optional[float] = None
+        self.total_rejections = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    @property
+    def trial_overdue(self) -> bool:
+        """Whether a half-open trial has been in flight longer than trial_timeout"""
+        return (
+            self.state == self.HALF_OPEN
+            and self._trial_in_flight
+            and time.monotonic() - self._trial_started_at >= self.trial_timeout
+        )
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may go upstream right now
+
+        A True answer in half_open makes the caller the trial: it must end in
+        record_success, record_failure or release_trial.
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and (not self._trial_in_flight or self.trial_overdue):
+            if self._trial_in_flight:
+                logger.warning(f"Half-open trial call gave no outcome within {self.trial_timeout}s; allowing a new one")
+            self._trial_in_flight = True
+            self._trial_started_at = time.monotonic()
+            return True
+        self.total_rejections += 1
+        return False
+
+    def release_trial(self):
+        """Give back a half-open trial that ended without an upstream outcome, e.g. because it was cancelled"""
+        if self._state == self.HALF_OPEN:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info("Circuit breaker closed: inference backend recovered")
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(
+                    f"Circuit breaker opened after {self._consecutive_failures} consecutive failures; "
+                    f"failing fast for {self.recovery_timeout}s"
+                )
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current breaker state for status endpoints"""
+        state = self.state
+        retry_in = None
+        if state == self.OPEN:
+            retry_in = round(max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0), 2)
+        return {
+            "state": state,
+            "consecutive_failures": self._consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "retry_in_seconds": retry_in,
+            "trial_overdue": self.trial_overdue,
+            "times_opened": self.times_opened,
+            "total_rejections": self.total_rejections,
+        }
@@ -0,0 +1,258 @@
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import asyncio
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt so trivially different spellings share a cache entry"""
+    prompt = unicodedata.normalize("NFKC", prompt)
+    return " ".join(prompt.split())
+
+
+def make_cache_key(model_name: str, prompt: str, parameters: Dict[str, Any]) -> str:
+    """Stable key over the model, normalized prompt and sampling parameters"""
+    material = json.dumps(
+        {"model": model_name, "prompt": normalize_prompt(prompt), "parameters": parameters},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """In-process LRU with per-entry TTL and a total byte budget"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600.0):
+        """
+        Args:
+            max_entries: Maximum number of cached responses
+            max_bytes: Maximum total size of cached responses (UTF-8 bytes)
+            ttl: Seconds an entry stays valid
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, size = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class DiskCache:
+    """Persistent SQLite tier that survives restarts; blocking I/O runs in a worker thread"""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl: float = 7 * 24 * 3600.0):
+        """
+        Args:
+            path: SQLite database file
+            max_bytes: Size budget; least recently used rows are evicted beyond it
+            ttl: Seconds an entry stays valid
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5.0)
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def _set(self, key: str, value: str) -> int:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        evicted = 0
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now + self.ttl, now),
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 1").fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+                evicted += 1
+        return evicted
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await asyncio.to_thread(self._get, key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str):
+        self.evictions += await asyncio.to_thread(self._set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ResponseCache:
+    """Two-tier generation cache: in-process LRU in front of an optional on-disk store"""
+
+    def __init__(self, memory: MemoryCache, disk: Optional[DiskCache] = None, allow_sampled: bool = False):
+        """
+        Args:
+            memory: The in-process tier
+            disk: Optional persistent tier
+            allow_sampled: Cache generations with temperature > 0 by default
+        """
+        self.memory = memory
+        self.disk = disk
+        self.allow_sampled = allow_sampled
+        self.bypasses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Build the cache from LLAMA_CACHE_* environment variables; None when disabled"""
+        if os.getenv("LLAMA_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        memory = MemoryCache(
+            max_entries=int(os.getenv("LLAMA_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.getenv("LLAMA_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            ttl=float(os.getenv("LLAMA_CACHE_TTL", "3600")),
+        )
+        disk = None
+        disk_path = os.getenv("LLAMA_CACHE_DISK_PATH")
+        if disk_path:
+            try:
+                disk = DiskCache(
+                    disk_path,
+                    max_bytes=int(os.getenv("LLAMA_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024))),
+                    ttl=float(os.getenv("LLAMA_CACHE_DISK_TTL", str(7 * 24 * 3600))),
+                )
+            except Exception as e:
+                logger.error(f"Disk cache disabled, could not open {disk_path}: {str(e)}")
+        allow_sampled = os.getenv("LLAMA_CACHE_ALLOW_SAMPLED", "false").lower() in ("1", "true", "yes")
+        return cls(memory, disk, allow_sampled=allow_sampled)
+
+    def is_cacheable(self, parameters: Dict[str, Any], allow_sampled: Optional[bool] = None) -> bool:
+        """Sampled generations are not reproducible, so skip them unless explicitly allowed"""
+        if allow_sampled is None:
+            allow_sampled = self.allow_sampled
+        if parameters.get("temperature", 0) > 0 and not allow_sampled:
+            self.bypasses += 1
+            return False
+        return True
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        try:
+            value = await self.disk.get(key)
+        except Exception as e:
+            logger.error(f"Disk cache read failed: {str(e)}")
+            return None
+        if value is not None:
+            # Promote so the next hit is served from memory
+            self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await self.disk.set(key, value)
+            except Exception as e:
+                logger.error(f"Disk cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "allow_sampled": self.allow_sampled,
+            "bypasses": self.bypasses,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk else None,
+        }
@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import zlib
+import random
+import asyncio
+import hashlib
+import logging
+from collections import deque, OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+# Numbers, operators (not hyphens inside words) and one-letter variables other than "a" and "i"
+_EXACT = re.compile(r"\d+(?:\.\d+)?|[=+*/^<>≤≥≠√∫∑∏∂∇π∞!%]|(?<![a-z])-|-(?![a-z])|\b[b-hj-z]\b")
+
+# Question scaffolding that carries no topic; negations are kept on purpose
+STOPWORDS = frozenset("""
+a an the is are was were be been of to in on for and or with about what whats how why
+when which who can could would should do does did please explain describe tell me us
+you i my your it its this that these those give define definition meaning mean means
+""".split())
+
+
+def _stem(word: str) -> str:
+    """Very light plural stripping so "derivatives" and "derivative" share features"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "xes", "zes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def exact_terms(text: str) -> Tuple[str, ...]:
+    """
+    Numbers, operators and single-letter variables of a question, in order
+
+    Two equations differing in one coefficient are near-identical as bags of
+    words, so a cached answer is only reused when these match exactly.
+    """
+    return tuple(_EXACT.findall(text.lower()))
+
+
+class HashingEmbedder:
+    """
+    Dependency-free local embedding: hashed word and character trigram features
+
+    Deterministic across processes (crc32, not Python's salted hash), so
+    vectors stay comparable between workers and restarts.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        words = [_stem(word) for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+        features = [(f"w:{word}", 1.0) for word in words]
+        for word in words:
+            padded = f"^{word}$"
+            features.extend((f"c:{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dim] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model, used when the optional package is installed"""
+
+    name = "sentence_transformers"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+class _ScopeIndex:
+    """Embeddings and answers for one subject/context scope"""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.exact: List[Tuple[str, ...]] = []
+        self.created: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+
+class SemanticCache:
+    """
+    Answer reuse for paraphrased questions
+
+    Questions are embedded locally and kept in an in-process index per scope
+    (subject, document context, system message), so an answer is only reused
+    for the same material. A lookup returns the best cached answer whose
+    numbers, operators and variables match the question exactly and whose
+    cosine similarity clears the threshold. A sample of hits is retained with
+    both questions and the score so false hits can be reviewed when tuning.
+    """
+
+    def __init__(
+        self,
+        embedder=None,
+        threshold: float = 0.9,
+        max_entries_per_scope: int = 2000,
+        max_scopes: int = 512,
+        ttl: float = 24 * 3600.0,
+        max_question_chars: int = 500,
+        sample_rate: float = 0.05,
+        max_samples: int = 200
+    ):
+        """
+        Args:
+            embedder: Object with embed(text) -> unit vector; defaults to HashingEmbedder
+            threshold: Minimum cosine similarity for a hit
+            max_entries_per_scope: Oldest entries are dropped beyond this
+            max_scopes: Least recently used scopes are dropped beyond this
+            ttl: Seconds an answer may be reused
+            max_question_chars: Longer messages are not cached (they are rarely repeated)
+            sample_rate: Fraction of hits recorded for false-hit review
+            max_samples: Number of recorded hits kept
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        self.ttl = ttl
+        self.max_question_chars = max_question_chars
+        self.sample_rate = sample_rate
+        self._scopes: "OrderedDict[str, _ScopeIndex]" = OrderedDict()
+        self._samples: deque = deque(maxlen=max_samples)
+        # Best similarity per lookup, in 0.05-wide buckets, to see where the threshold cuts
+        self._similarity_buckets = [0] * 21
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        """Build the cache from LLAMA_SEMANTIC_CACHE_* variables; None when disabled"""
+        # Opt-in: a false hit serves a student the answer to a different question
+        if os.getenv("LLAMA_SEMANTIC_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        embedder = None
+        model_name = os.getenv("LLAMA_SEMANTIC_CACHE_MODEL")
+        if model_name:
+            try:
+                embedder = SentenceTransformerEmbedder(model_name)
+            except Exception as e:
+                logger.warning(f"Could not load embedding model {model_name}, using hashing embeddings: {str(e)}")
+        return cls(
+            embedder=embedder,
+            threshold=float(os.getenv("LLAMA_SEMANTIC_CACHE_THRESHOLD", "0.9")),
+            ttl=float(os.getenv("LLAMA_SEMANTIC_CACHE_TTL", str(24 * 3600))),
+            sample_rate=float(os.getenv("LLAMA_SEMANTIC_CACHE_SAMPLE_RATE", "0.05"))
+        )
+
+    @staticmethod
+    def scope_key(*parts: Optional[str]) -> str:
+        material = "\x1f".join(part or "" for part in parts)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def accepts(self, question: str) -> bool:
+        return 0 < len(question.strip()) <= self.max_question_chars
+
+    async def _embed(self, text: str) -> np.ndarray:
+        if isinstance(self.embedder, HashingEmbedder):
+            return self.embedder.embed(text)
+        # Model inference is CPU bound; keep it off the event loop
+        return await asyncio.to_thread(self.embedder.embed, text)
+
+    async def lookup(self, scope: str, question: str) -> Optional[str]:
+        """Cached answer for a paraphrase of question in scope, or None"""
+        if not self.accepts(question):
+            return None
+        index = self._scopes.get(scope)
+        if index is None or not len(index):
+            self.misses += 1
+            return None
+        self._scopes.move_to_end(scope)
+
+        query = await self._embed(question)
+        similarities = index.vectors @ query
+        terms = exact_terms(question)
+        similarities[[entry != terms for entry in index.exact]] = -1.0
+        best = int(np.argmax(similarities))
+        score = float(similarities[best])
+        self._similarity_buckets[min(int(max(score, 0.0) * 20), 20)] += 1
+
+        if score < self.threshold or time.time() - index.created[best] > self.ttl:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if random.random() < self.sample_rate:
+            self._samples.append({
+                "question": question,
+                "matched_question": index.questions[best],
+                "similarity": round(score, 4),
+                "at": time.time(),
+            })
+        return index.answers[best]
+
+    async def store(self, scope: str, question: str, answer: str):
+        if not self.accepts(question) or not answer:
+            return
+        vector = await self._embed(question)
+        index = self._scopes.get(scope)
+        if index is None:
+            index = _ScopeIndex(vector.shape[0])
+            self._scopes[scope] = index
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(scope)
+
+        index.vectors = np.vstack([index.vectors, vector[None, :]])
+        index.questions.append(question)
+        index.answers.append(answer)
+        index.exact.append(exact_terms(question))
+        index.created.append(time.time())
+        if len(index) > self.max_entries_per_scope:
+            drop = len(index) - self.max_entries_per_scope
+            index.vectors = index.vectors[drop:]
+            del index.questions[:drop], index.answers[:drop], index.exact[:drop], index.created[:drop]
+        self.stores += 1
+
+    def samples(self) -> List[Dict[str, Any]]:
+        """Recently sampled hits, newest first, for false-hit review"""
+        return list(reversed(self._samples))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "embedder": self.embedder.name,
+            "threshold": self.threshold,
+            "scopes": len(self._scopes),
+            "entries": sum(len(index) for index in self._scopes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "sampled_hits": len(self._samples),
+            "best_similarity_histogram": {
+                f"{bucket / 20:.2f}": count for bucket, count in enumerate(self._similarity_buckets) if count
+            },
+        }
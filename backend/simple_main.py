@@ -1,11 +1,16 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pathlib import Path
+import os
 import time
+import json
 from datetime import datetime
 from pydantic import BaseModel
 import logging
 from services.ai_service import ai_service
+from services.metrics import llm_metrics, CONTENT_TYPE_LATEST
+from services.deadline import Deadline, DeadlineExceeded, ClientDisconnected, run_until_disconnected
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +21,9 @@ class ChatRequest(BaseModel):
     message: str
     context: str = None
     system_message: str = None
+    subject: str = None
+    message_type: str = None  # general, explanation, problem_solving or quiz
+    timeout: float = None  # Seconds to wait for an answer; defaults to LLAMA_CHAT_DEADLINE
 
 class ChatResponse(BaseModel):
     response: str
@@ -130,11 +138,12 @@ async def upload_document(
 # Startup and shutdown events
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the AI service on startup"""
+    """Initialize the AI service on startup; model warmup continues in the background"""
     logger.info("Starting STEMentor API...")
     try:
-        await ai_service.initialize()
-        logger.info("AI service initialized successfully")
+        if ai_service.setup_client():
+            ai_service.start_warmup()
+            logger.info("AI service client ready, warming up model in the background")
     except Exception as e:
         logger.error(f"Failed to initialize AI service: {e}")
 
@@ -144,17 +153,35 @@ async def shutdown_event():
     logger.info("Shutting down STEMentor API...")
     await ai_service.cleanup()
 
+# Time budget for a chat answer when the request does not set one
+CHAT_DEADLINE_SECONDS = float(os.getenv("LLAMA_CHAT_DEADLINE", "60"))
+
+# Non-standard status used by nginx for requests the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
+def _chat_deadline(request: ChatRequest) -> Deadline:
+    """Deadline for a chat request, capped at the server-wide budget"""
+    budget = min(request.timeout, CHAT_DEADLINE_SECONDS) if request.timeout else CHAT_DEADLINE_SECONDS
+    return Deadline(budget)
+
 # Chat endpoints
 @app.post("/api/v1/chat", response_model=ChatResponse)
-async def chat_with_ai(request: ChatRequest):
+async def chat_with_ai(request: ChatRequest, http_request: Request):
     """Chat with the Llama 3 AI tutor"""
     try:
         logger.info(f"Received chat request: {request.message[:100]}...")
         
-        response = await ai_service.generate_response(
-            user_message=request.message,
-            context=request.context,
-            system_message=request.system_message
+        # Closing the tab or running out of time cancels the upstream generation
+        response = await run_until_disconnected(
+            ai_service.generate_response(
+                user_message=request.message,
+                context=request.context,
+                system_message=request.system_message,
+                subject=request.subject,
+                message_type=request.message_type,
+                deadline=_chat_deadline(request)
+            ),
+            http_request.is_disconnected
         )
         
         model_info = await ai_service.get_model_info()
@@ -165,6 +192,10 @@ async def chat_with_ai(request: ChatRequest):
             status="success"
         )
         
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Timed out generating a response: {str(e)}")
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(
@@ -172,6 +203,52 @@ async def chat_with_ai(request: ChatRequest):
             detail=f"Failed to generate response: {str(e)}"
         )
 
+def _sse_event(data: dict, event: str = None) -> str:
+    """Format a dict as a single server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/api/v1/chat/stream")
+async def chat_with_ai_stream(request: ChatRequest):
+    """Chat with the Llama 3 AI tutor, streaming tokens as server-sent events"""
+    logger.info(f"Received streaming chat request: {request.message[:100]}...")
+    
+    deadline = _chat_deadline(request)
+    
+    async def event_stream():
+        # A client disconnect cancels this generator; closing the token stream ends the upstream call
+        tokens = ai_service.generate_response_stream(
+            user_message=request.message,
+            context=request.context,
+            system_message=request.system_message,
+            subject=request.subject,
+            message_type=request.message_type,
+            deadline=deadline
+        )
+        try:
+            async for token in tokens:
+                yield _sse_event({"token": token})
+            
+            model_info = await ai_service.get_model_info()
+            yield _sse_event({"status": "success", "model_info": model_info}, event="done")
+            
+        except DeadlineExceeded as e:
+            yield _sse_event({"status": "timeout", "detail": f"Timed out generating a response: {str(e)}"}, event="error")
+        except Exception as e:
+            logger.error(f"Streaming chat error: {str(e)}")
+            yield _sse_event({"status": "error", "detail": f"Failed to generate response: {str(e)}"}, event="error")
+        finally:
+            await tokens.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering so tokens flush immediately
+        }
+    )
+
 @app.post("/api/v1/chat/test")
 async def chat_test():
     """Test endpoint for the AI chat - uses a simple predefined message"""
@@ -210,7 +287,19 @@ async def get_ai_status():
     model_info = await ai_service.get_model_info()
     return {
         "ai_service_status": "initialized" if ai_service.is_initialized else "not_initialized",
-        "model_info": model_info
+        "model_info": model_info,
+        "readiness": ai_service.get_readiness(),
+        **ai_service.get_resilience_status()
+    }
+
+@app.get("/api/v1/ai/semantic-cache/samples")
+async def get_semantic_cache_samples():
+    """Sampled semantic cache hits (question, matched question, similarity) for threshold tuning"""
+    if not ai_service.semantic_cache:
+        return {"enabled": False, "samples": []}
+    return {
+        **ai_service.semantic_cache.stats(),
+        "samples": ai_service.semantic_cache.samples()
     }
 
 @app.get("/api/v1/progress/test")  
@@ -234,3 +323,15 @@ def get_progress():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 200 while warming or ready, 503 when the AI service cannot take traffic"""
+    readiness = ai_service.get_readiness()
+    status_code = 200 if readiness["accepting_traffic"] else 503
+    return JSONResponse(status_code=status_code, content=readiness)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Per-call LLM latency, token and throughput metrics in the Prometheus text format"""
+    return Response(llm_metrics.render(), media_type=CONTENT_TYPE_LATEST)
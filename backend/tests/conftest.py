@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the backend packages (services, app) the way the apps run them, from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
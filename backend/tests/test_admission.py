@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from services.admission import AdmissionController, AdmissionTimeout
+
+
+def test_cancellation_racing_a_slot_hand_over_returns_the_slot():
+    async def run():
+        admission = AdmissionController(max_concurrency=1)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+
+        # The slot is handed to the waiter, which is cancelled before it resumes
+        admission.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admission._in_use == 0
+
+        await asyncio.wait_for(admission.acquire(), 1)
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_leaves_no_waiter_behind():
+    async def run():
+        admission = AdmissionController(max_concurrency=1, queue_timeouts={"interactive": 0.05})
+        await admission.acquire()
+        with pytest.raises(AdmissionTimeout):
+            await admission.acquire()
+        admission.release()
+        assert admission._in_use == 0
+        assert admission.queue_depth == 0
+
+    asyncio.run(run())
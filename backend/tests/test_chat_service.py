@@ -0,0 +1,212 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.database import Base
+from app.models import chat, document, progress, user  # noqa: F401  (register the tables)
+from app.models.chat import Conversation, Message, MessageRole
+from app.models.document import Document
+from app.models.user import User
+from app.schemas.chat import ChatMessage
+from app.services import chat_service as chat_service_module
+from app.services.chat_service import ChatService
+from app.services.context_cache import ContextCache, MemoryContextBackend
+from app.services.hybrid_retrieval import HybridRetriever
+from app.services.keyword_index import KeywordIndex
+from app.services.vector_index import VectorIndex
+
+
+class _QueryCounter:
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def reset(self):
+        self.statements.clear()
+
+
+async def _setup(tmp_path, monkeypatch, **engine_options):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'chat.db'}", **engine_options)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = sessionmaker(bind=engine, class_=AsyncSession, autoflush=False)
+
+    async with factory() as session:
+        session.add(User(id=1, email="student@example.com", hashed_password="x"))
+        for document_id in (1, 2):
+            session.add(Document(
+                id=document_id, user_id=1, title=f"Notes {document_id}", filename="notes.txt",
+                original_filename="notes.txt", file_path="/tmp/notes.txt", file_size=10,
+                content_type="text/plain", extracted_text="Eigenvalues of a symmetric matrix are real.",
+                ai_analysis={"summary": "Linear algebra", "key_concepts": ["eigenvalue"]}
+            ))
+        session.add(Conversation(id=1, user_id=1, title="Linear algebra", context_documents=[1, 2]))
+        session.add_all([
+            Message(conversation_id=1, role=MessageRole.USER, content="What is an eigenvalue?"),
+            Message(conversation_id=1, role=MessageRole.ASSISTANT, content="A scale factor."),
+        ])
+        await session.commit()
+
+    monkeypatch.setattr(chat_service_module, "message_writer", None)
+    monkeypatch.setattr(chat_service_module, "context_cache", ContextCache(MemoryContextBackend()))
+    monkeypatch.setattr(chat_service_module, "hybrid_retriever", HybridRetriever(
+        KeywordIndex(), VectorIndex(str(tmp_path / "vectors"))
+    ))
+    return engine, factory
+
+
+def test_cold_and_warm_context_query_counts(tmp_path, monkeypatch):
+    async def scenario():
+        engine, factory = await _setup(tmp_path, monkeypatch)
+        counter = _QueryCounter(engine)
+        try:
+            async with factory() as db:
+                conversation = await ChatService(db, session_factory=factory)._open_turn(1)
+
+            # Cold: documents and progress, summary and history, then the keyword index load
+            counter.reset()
+            context = await ChatService(None, session_factory=factory)._build_context(conversation, "eigenvalue")
+            assert len(counter.statements) == 5
+            assert [d.id for d in context.documents] == [1, 2]
+            assert len(context.history) == 2
+            assert context.passages
+
+            # Warm: grounding from the context cache, documents already indexed; only history is read
+            counter.reset()
+            context = await ChatService(None, session_factory=factory)._build_context(conversation, "eigenvalue")
+            assert len(counter.statements) == 2
+            assert [d.id for d in context.documents] == [1, 2]
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_turn_holds_no_connection_while_generating(tmp_path, monkeypatch):
+    async def scenario():
+        # A real pool, so checked-out connections can be counted (file SQLite defaults to NullPool)
+        engine, factory = await _setup(tmp_path, monkeypatch, poolclass=AsyncAdaptedQueuePool)
+        checked_out = []
+
+        def llm(prompt, **kwargs):
+            checked_out.append(engine.pool.checkedout())
+            return "Eigenvalues scale eigenvectors."
+
+        clients = SimpleNamespace(chat_llm=llm, embeddings=None, summary_llm=None)
+        try:
+            async with factory() as db:
+                reply = await ChatService(db, clients, session_factory=factory).process_message(
+                    1, ChatMessage(content="Why are they real?", message_type="general")
+                )
+            assert checked_out == [0]
+            assert reply["content"] == "Eigenvalues scale eigenvectors."
+            assert reply["id"] is not None
+
+            async with factory() as session:
+                conversation = await session.get(Conversation, 1)
+                assert conversation.total_messages == 2
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_conversations_page_by_last_activity(tmp_path, monkeypatch):
+    async def scenario():
+        engine, factory = await _setup(tmp_path, monkeypatch)
+        clients = SimpleNamespace(chat_llm=lambda prompt, **kwargs: "Answer.", embeddings=None, summary_llm=None)
+        try:
+            async with factory() as session:
+                session.add_all([
+                    Conversation(id=2, user_id=1, title="Kinematics"),
+                    Conversation(id=3, user_id=1, title="Entropy"),
+                ])
+                await session.commit()
+            for conversation_id in (1, 3):
+                async with factory() as db:
+                    await ChatService(db, clients, session_factory=factory).process_message(
+                        conversation_id, ChatMessage(content="Next step?", message_type="general")
+                    )
+
+            # Most recent first; never-active conversations sort first descending, as NULLs do in Postgres
+            async with factory() as db:
+                first = await ChatService(db, session_factory=factory).get_conversations(limit=2)
+            async with factory() as db:
+                second = await ChatService(db, session_factory=factory).get_conversations(
+                    limit=2, cursor=first.next_cursor
+                )
+            assert [c.id for c in first.items] == [2, 3]
+            assert [c.id for c in second.items] == [1]
+            assert first.items[1].last_activity_at is not None
+            assert second.next_cursor is None
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_streamed_turn_holds_no_connection_while_tokens_stream(tmp_path, monkeypatch):
+    async def scenario():
+        engine, factory = await _setup(tmp_path, monkeypatch, poolclass=AsyncAdaptedQueuePool)
+        checked_out = []
+
+        class StreamingLLM:
+            model_name = "test-model"
+
+            async def astream(self, prompt, **kwargs):
+                for delta in ("Eigen", "values"):
+                    checked_out.append(engine.pool.checkedout())
+                    yield delta
+
+        clients = SimpleNamespace(chat_llm=StreamingLLM(), embeddings=None, summary_llm=None)
+        try:
+            async with factory() as db:
+                events = []
+                async for streamed in ChatService(db, clients, session_factory=factory).process_message_stream(
+                    1, ChatMessage(content="Why are they real?", message_type="general")
+                ):
+                    events.append(streamed)
+                    checked_out.append(engine.pool.checkedout())
+            assert checked_out == [0] * len(checked_out)
+            assert events[-1]["type"] == "response_complete"
+            assert events[-1]["content"]["content"] == "Eigenvalues"
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_document_without_analysis_still_grounds_the_turn(tmp_path, monkeypatch):
+    async def scenario():
+        engine, factory = await _setup(tmp_path, monkeypatch)
+        try:
+            async with factory() as session:
+                session.add(Document(
+                    id=3, user_id=1, title="Lab handout", filename="lab.txt", original_filename="lab.txt",
+                    file_path="/tmp/lab.txt", file_size=10, content_type="text/plain",
+                    extracted_text="Measure the pendulum period for five lengths."
+                ))
+                conversation = await session.get(Conversation, 1)
+                conversation.context_documents = [3]
+                await session.commit()
+                await session.refresh(conversation)
+
+            context = await ChatService(None, session_factory=factory)._build_context(conversation, "pendulum period")
+            assert [d.id for d in context.documents] == [3]
+            assert [p.document_id for p in context.passages] == [3]
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
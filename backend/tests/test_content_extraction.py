@@ -0,0 +1,31 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.services import content_extraction_service as content_extraction_module
+from app.services.content_extraction_service import ContentExtractionService
+from app.services.hybrid_retrieval import HybridRetriever
+from app.services.keyword_index import KeywordIndex
+from app.services.vector_index import VectorIndex
+
+
+class _FailingEmbeddings:
+    async def aembed_documents(self, texts):
+        raise RuntimeError("embedding service unavailable")
+
+
+def test_failed_embedding_leaves_document_keyword_searchable(tmp_path, monkeypatch):
+    retriever = HybridRetriever(KeywordIndex(), VectorIndex(str(tmp_path)))
+    monkeypatch.setattr(content_extraction_module, "hybrid_retriever", retriever)
+    service = ContentExtractionService(SimpleNamespace(embeddings=_FailingEmbeddings(), extraction_llm=None))
+
+    async def scenario():
+        indexed = await service.index_document(7, 1, "Kirchhoff's current law: currents into a node sum to zero.")
+        assert indexed == 1
+        return await retriever.retrieve("Kirchhoff node currents", None, [7], user_id=1)
+
+    passages = asyncio.run(scenario())
+    assert [p.document_id for p in passages] == [7]
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.database import Base
+from app.models import chat, document, progress, user  # noqa: F401  (register the tables)
+from app.models.chat import Conversation, ConversationSummary, Message, MessageRole
+from app.models.user import User
+from app.services.conversation_summarizer import ConversationSummarizer
+
+
+async def _setup(tmp_path):
+    # A real pool, so checked-out connections can be counted (file SQLite defaults to NullPool)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'chat.db'}", poolclass=AsyncAdaptedQueuePool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    async with factory() as session:
+        session.add(User(id=1, email="student@example.com", hashed_password="x"))
+        session.add(Conversation(id=1, user_id=1, title="Thermodynamics"))
+        session.add_all([
+            Message(id=i, conversation_id=1, role=MessageRole.USER if i % 2 else MessageRole.ASSISTANT, content=f"m{i}")
+            for i in range(1, 7)
+        ])
+        await session.commit()
+    return engine, factory
+
+
+def test_summary_holds_no_connection_during_the_model_call(tmp_path):
+    async def scenario():
+        engine, factory = await _setup(tmp_path)
+        checked_out = []
+
+        def llm(prompt, **kwargs):
+            checked_out.append(engine.pool.checkedout())
+            return "Covered the first law."
+
+        try:
+            summarizer = ConversationSummarizer(factory, trigger_messages=4, keep_recent=2)
+            summary = await summarizer.summarize(1, llm)
+            assert checked_out == [0]
+            assert (summary.message_range_start, summary.message_range_end) == (1, 4)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_runs_write_one_summary(tmp_path):
+    async def scenario():
+        engine, factory = await _setup(tmp_path)
+
+        def slow_llm(prompt, **kwargs):
+            time.sleep(0.05)
+            return "Covered the first law."
+
+        try:
+            summarizer = ConversationSummarizer(factory, trigger_messages=4, keep_recent=2)
+            results = await asyncio.gather(summarizer.summarize(1, slow_llm), summarizer.summarize(1, slow_llm))
+            assert sum(result is not None for result in results) == 1
+            async with factory() as session:
+                assert await session.scalar(select(func.count()).select_from(ConversationSummary)) == 1
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+
+from services.admission import AdmissionController
+from services.backends import create_backends
+from services.hedging import Endpoint, EndpointPool
+
+
+def _pool(monkeypatch) -> EndpointPool:
+    monkeypatch.setenv("LLAMA_BACKEND_URLS", "http://a.test,http://b.test")
+    endpoints = [Endpoint(backend) for backend in create_backends("test-model")]
+    return EndpointPool(endpoints, default_hedge_delay=0.05, max_hedge_ratio=1.0)
+
+
+async def _slow_first(request):
+    if request.url.host == "a.test":
+        await asyncio.sleep(0.5)
+    return httpx.Response(200, json=[{"generated_text": request.url.host}])
+
+
+def test_hedge_takes_and_returns_its_own_admission_slot(monkeypatch):
+    async def run():
+        pool = _pool(monkeypatch)
+        admission = AdmissionController(max_concurrency=2)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_slow_first)) as client:
+            async with admission.slot():
+                response = await pool.post(client, {}, admission=admission)
+                await asyncio.sleep(0)
+                assert admission._in_use == 1
+        assert response.json()[0]["generated_text"] == "b.test"
+        assert pool.hedges_sent == 1
+        assert admission.admitted["interactive"] == 2
+
+    asyncio.run(run())
+
+
+def test_no_hedge_without_a_free_admission_slot(monkeypatch):
+    async def run():
+        pool = _pool(monkeypatch)
+        admission = AdmissionController(max_concurrency=1)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_slow_first)) as client:
+            async with admission.slot():
+                response = await pool.post(client, {}, admission=admission)
+        assert response.json()[0]["generated_text"] == "a.test"
+        assert pool.hedges_sent == 0
+        assert pool.hedges_skipped == 1
+        assert admission._in_use == 0
+
+    asyncio.run(run())
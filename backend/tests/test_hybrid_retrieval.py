@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.services.hybrid_retrieval import HybridRetriever
+from app.services.keyword_index import KeywordIndex
+from app.services.vector_index import VectorIndex
+
+
+class _RecordingVectorIndex(VectorIndex):
+    def search(self, query_embedding, document_ids, k=4):
+        self.search_thread = threading.get_ident()
+        return super().search(query_embedding, document_ids, k)
+
+
+def test_vector_search_runs_off_the_event_loop(tmp_path):
+    vectors = _RecordingVectorIndex(str(tmp_path))
+    retriever = HybridRetriever(KeywordIndex(), vectors)
+    chunks = ["Ohm's law relates voltage and current.", "Entropy never decreases."]
+    vectors.add_document(1, chunks, [[1.0, 0.0], [0.0, 1.0]])
+
+    async def scenario():
+        await retriever.index_document(1, 1, chunks)
+        passages = await retriever.retrieve("resistor voltage", [0.9, 0.1], [1], user_id=1)
+        return threading.get_ident(), passages
+
+    loop_thread, passages = asyncio.run(scenario())
+    assert vectors.search_thread != loop_thread
+    assert passages[0].text == chunks[0]
+
+
+def test_vector_index_directory_is_created_on_first_write(tmp_path):
+    directory = tmp_path / "vectors"
+    vectors = VectorIndex(str(directory))
+    assert not directory.exists()
+    assert vectors.search([1.0, 0.0], [1]) == []
+    assert not directory.exists()
+
+    vectors.add_document(1, ["Entropy never decreases."], [[1.0, 0.0]])
+    assert [hit.document_id for hit in vectors.search([1.0, 0.0], [1])] == [1]
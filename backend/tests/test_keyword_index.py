@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.services.keyword_index import KeywordIndex
+
+
+def test_least_recently_used_document_is_evicted():
+    index = KeywordIndex(max_documents=2)
+    index.add_document(1, 1, ["Ohm's law relates voltage and current."])
+    index.add_document(2, 1, ["Entropy of an isolated system never decreases."])
+    assert index.search("voltage", [1])
+
+    index.add_document(3, 1, ["Eigenvalues of symmetric matrices are real."])
+    assert 2 not in index
+    assert 1 in index and 3 in index
+    assert index.total_chunks == 2
+    assert index.document_frequencies[index.vocabulary["entropy"]] == 0
+    assert index.stats()["evictions"] == 1
+
+
+def test_split_indexing_matches_add_document():
+    chunks = ["Kirchhoff's current law: currents into a node sum to zero.", "Voltage around a loop sums to zero."]
+    direct = KeywordIndex()
+    direct.add_document(1, 1, chunks)
+
+    staged = KeywordIndex()
+    chunk_terms, terms = staged.analyze(chunks)
+    staged.insert(1, staged.build(1, chunks, chunk_terms, staged.register_terms(terms)))
+
+    assert [hit.chunk_index for hit in staged.search("zero current", [1])] == \
+        [hit.chunk_index for hit in direct.search("zero current", [1])]
+
+
+def test_plural_stemming_matches_the_semantic_cache():
+    from services.semantic_cache import _stem as semantic_cache_stem
+
+    from app.services.keyword_index import _stem
+
+    assert [_stem(word) for word in ("matrixes", "branches", "fluxes", "classes")] == \
+        ["matrix", "branch", "flux", "class"]
+    for word in ("derivatives", "matrixes", "branches", "bushes", "classes", "radius", "axis", "theories", "gas"):
+        assert _stem(word) == semantic_cache_stem(word)
+
+
+def test_plural_and_singular_find_the_same_chunk():
+    index = KeywordIndex()
+    index.add_document(1, 1, ["Adjacency matrixes of graphs."])
+    index.add_document(2, 1, ["Taylor series of the exponential."])
+    assert [hit.document_id for hit in index.search("matrix", [1, 2])] == [1]
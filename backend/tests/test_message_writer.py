@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.services.message_writer import MessageWriter
+
+
+def _writer(write_delay: float = 0.0):
+    writer = MessageWriter(session_factory=object(), interval=0.01, batch_size=2)
+    written = []
+    next_id = iter(range(1, 1000))
+
+    async def allocate_ids(count):
+        return [next(next_id) for _ in range(count)]
+
+    async def write(batch):
+        await asyncio.sleep(write_delay)
+        written.extend(message.content for messages in batch.values() for message in messages)
+
+    writer._allocate_ids = allocate_ids
+    writer._write = write
+    return writer, written
+
+
+def _turn(question: str):
+    return [SimpleNamespace(content=question), SimpleNamespace(content="answer to " + question)]
+
+
+def test_shutdown_during_flush_loses_no_messages():
+    async def scenario():
+        writer, written = _writer(write_delay=0.05)
+        await writer.enqueue(1, _turn("q1"))
+        await asyncio.sleep(0.01)
+        assert writer.pending(1)  # the batch is being written
+        await writer.enqueue(1, _turn("q2"))
+        await writer.shutdown()
+        return writer, written
+
+    writer, written = asyncio.run(scenario())
+    assert written == ["q1", "answer to q1", "q2", "answer to q2"]
+    assert writer.pending(1) == []
+
+
+def test_cancelled_flush_puts_the_batch_back():
+    async def scenario():
+        writer, written = _writer(write_delay=1.0)
+        await writer.enqueue(1, _turn("q1"))
+        flush = asyncio.create_task(writer.flush())
+        await asyncio.sleep(0.01)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        return writer, written
+
+    writer, written = asyncio.run(scenario())
+    assert written == []
+    assert [message.content for message in writer.pending(1)] == ["q1", "answer to q1"]
+
+
+def test_shutdown_reports_messages_it_could_not_write(caplog):
+    async def scenario():
+        writer, _ = _writer()
+
+        async def write(batch):
+            raise ConnectionError("database is gone")
+
+        writer._write = write
+        writer.interval = 60
+        await writer.enqueue(1, [SimpleNamespace(content="q1")])
+        await writer.shutdown()
+
+    asyncio.run(scenario())
+    assert "1 messages lost" in caplog.text
@@ -0,0 +1,45 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from services import prompt_budget
+from services.prompt_budget import PromptBudgeter
+
+
+class _WordTokenizer:
+    """One token per run of non-whitespace, so a URL or a base64 blob is a single token."""
+
+    def encode(self, text, add_special_tokens=False):
+        spans = [m.span() for m in re.finditer(r"\S+", text)]
+        return SimpleNamespace(ids=list(range(len(spans))), offsets=spans)
+
+
+@pytest.fixture
+def word_budgeter(monkeypatch):
+    monkeypatch.setitem(prompt_budget._TOKENIZER_CACHE, "test/words", _WordTokenizer())
+    return PromptBudgeter("test/words")
+
+
+def test_split_boundaryless_window_under_budget(word_budgeter):
+    blob = "aGVsbG8" * 30  # 210 characters, one token, no sentence boundary
+    chunks = word_budgeter.split(blob, 10)
+    assert "".join(chunks) == blob
+    assert all(len(chunk) <= 80 for chunk in chunks)
+
+
+def test_fit_cuts_boundaryless_text_by_tokens(word_budgeter):
+    text = "a b c d e f"
+    assert word_budgeter.fit(text, 2, keep="head") == ("a b", 4)
+    assert word_budgeter.fit(text, 2, keep="tail") == ("e f", 4)
+
+
+def test_estimate_without_tokenizer():
+    budgeter = PromptBudgeter("test/not-loaded")
+    assert budgeter.count("x" * 35) == 10
+    assert budgeter.fit("x" * 70, 10) == ("x" * 35, 10)
+    assert budgeter.fit("x" * 70, 10, keep="tail") == ("x" * 35, 10)
+
+    chunks = budgeter.split("x" * 100, 10)
+    assert "".join(chunks) == "x" * 100
+    assert all(budgeter.count(chunk) <= 10 for chunk in chunks)
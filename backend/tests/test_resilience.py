@@ -0,0 +1,79 @@
+import time
+import asyncio
+
+import httpx
+
+from services.ai_service import LlamaAIService, READY, DEGRADED
+from services.resilience import CircuitBreaker
+
+
+def _half_open_service(handler) -> LlamaAIService:
+    service = LlamaAIService()
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    service.is_initialized = True
+    service.readiness = READY
+    breaker = service.circuit_breaker
+    breaker._state = CircuitBreaker.OPEN
+    breaker._opened_at = time.monotonic() - breaker.recovery_timeout
+    return service
+
+
+class _Upstream:
+    """Mock inference endpoint that hangs until told to answer."""
+
+    def __init__(self):
+        self.hang = True
+
+    async def __call__(self, request):
+        if self.hang:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json=[{"generated_text": "ok"}])
+
+
+def test_cancelled_trial_call_releases_half_open_breaker():
+    async def run():
+        upstream = _Upstream()
+        service = _half_open_service(upstream)
+        try:
+            await asyncio.wait_for(service._make_api_call("hi", "chat"), 0.2)
+        except asyncio.TimeoutError:
+            pass
+        assert service.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+        assert not service.circuit_breaker._trial_in_flight
+
+        upstream.hang = False
+        assert await service._make_api_call("hi", "chat") == "ok"
+        assert service.circuit_breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_cancelled_streaming_trial_releases_half_open_breaker():
+    async def run():
+        service = _half_open_service(_Upstream())
+
+        async def consume():
+            async for _ in service._make_api_call_stream("hi", "chat"):
+                pass
+
+        try:
+            await asyncio.wait_for(consume(), 0.2)
+        except asyncio.TimeoutError:
+            pass
+        assert service.circuit_breaker.allow_request()
+
+    asyncio.run(run())
+
+
+def test_overdue_trial_degrades_readiness_and_allows_a_new_trial():
+    service = _half_open_service(_Upstream())
+    breaker = service.circuit_breaker
+    breaker.trial_timeout = 0.05
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    assert service.get_readiness()["status"] == READY
+
+    time.sleep(0.06)
+    assert service.get_readiness()["status"] == DEGRADED
+    assert breaker.allow_request()
@@ -0,0 +1,36 @@
+import asyncio
+
+from services.semantic_cache import SemanticCache, _stem
+
+SCOPE = SemanticCache.scope_key("math")
+
+
+def _cached(stored: str, asked: str):
+    async def run():
+        cache = SemanticCache()
+        await cache.store(SCOPE, stored, "cached answer")
+        return await cache.lookup(SCOPE, asked)
+
+    return asyncio.run(run())
+
+
+def test_paraphrased_question_hits():
+    assert _cached("what is a derivative?", "explain derivatives") == "cached answer"
+
+
+def test_distinct_equations_do_not_collide():
+    assert _cached("Solve x^2 + 5x + 6 = 0", "Solve x^2 + 7x + 12 = 0") is None
+    assert _cached("What is 12 * 7?", "What is 12 * 8?") is None
+    assert _cached("Differentiate f(x) = x^3", "Differentiate f(y) = y^3") is None
+
+
+def test_plural_stemming():
+    assert _stem("derivatives") == "derivative"
+    assert _stem("classes") == "class"
+    assert _stem("matrixes") == "matrix"
+    assert _stem("theories") == "theory"
+
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("LLAMA_SEMANTIC_CACHE_ENABLED", raising=False)
+    assert SemanticCache.from_env() is None
@@ -0,0 +1,17 @@
+import os
+import sys
+import subprocess
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_shared_helpers_do_not_build_the_llama_service():
+    # The app package imports these; a misconfigured Llama backend must not break it
+    code = (
+        "import sys\n"
+        "import services.deadline, services.metrics, services.generation_profiles\n"
+        "assert 'services.ai_service' not in sys.modules\n"
+    )
+    env = dict(os.environ, LLAMA_BACKEND="tgi", LLAMA_BACKEND_URL="")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr